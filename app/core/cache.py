@@ -0,0 +1,190 @@
+import asyncio
+import os
+import shutil
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from .config import settings
+
+# A loader receives the ETag we already hold (or None) and returns (content, etag).
+# Returning content=None means the object is unchanged (304 Not Modified).
+Loader = Callable[[Optional[str]], Awaitable[Tuple[Optional[bytes], Optional[str]]]]
+
+# First line of every disk copy, followed by the ETag
+DISK_HEADER = b"objcache-etag "
+
+@dataclass
+class _Entry:
+    content: bytes
+    etag: Optional[str]
+    checked_at: float
+
+# Two tier cache for storage objects: in-process LRU bounded by bytes, backed by a disk directory
+class ObjectCache:
+    def __init__(self, max_bytes: int, cache_dir: Optional[str], ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._size = 0
+        # key -> (lock, holders and waiters), dropped when the last one leaves
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, key: str, loader: Loader) -> bytes:
+        content, _ = await self.get_with_etag(key, loader)
+        return content
+
+    async def get_with_etag(self, key: str, loader: Loader) -> Tuple[bytes, Optional[str]]:
+        entry = self._fresh_entry(key)
+        if entry:
+            self.hits += 1
+            return entry.content, entry.etag
+
+        # One download per key at a time, concurrent renders wait for it
+        async with self._key_lock(key):
+            entry = self._fresh_entry(key)
+            if entry:
+                self.hits += 1
+                return entry.content, entry.etag
+
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = await asyncio.to_thread(self._read_disk, key)
+                if entry:
+                    self.disk_hits += 1
+
+            content, etag = await loader(entry.etag if entry else None)
+            if content is None and entry is not None:
+                # Not modified, keep serving what we have
+                self.revalidations += 1
+                entry.checked_at = time.monotonic()
+            else:
+                self.misses += 1
+                entry = _Entry(content=content, etag=etag, checked_at=time.monotonic())
+                await asyncio.to_thread(self._write_disk, key, entry)
+
+            self._store(key, entry)
+            return entry.content, entry.etag
+
+    async def put(self, key: str, content: bytes, etag: Optional[str]):
+        # Seed the cache with content produced locally, e.g. a regenerated PDF that is still uploading
+        entry = _Entry(content=content, etag=etag, checked_at=time.monotonic())
+        await asyncio.to_thread(self._write_disk, key, entry)
+        self._store(key, entry)
+
+    def invalidate(self, prefix: str):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            self._size -= len(self._entries.pop(key).content)
+        if self.cache_dir:
+            path = self._path(prefix)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                # .etag is a sidecar left by older versions
+                for candidate in (path, path + ".etag"):
+                    if os.path.exists(candidate):
+                        os.remove(candidate)
+
+    def stats(self) -> dict:
+        # Every lookup ends as a fresh hit, a revalidation or a full download
+        lookups = self.hits + self.revalidations + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "diskHits": self.disk_hits,
+            "revalidations": self.revalidations,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hitRatio": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+        }
+
+    @asynccontextmanager
+    async def _key_lock(self, key: str):
+        lock, users = self._locks.get(key, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._locks[key] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            _, users = self._locks[key]
+            if users == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, users - 1)
+
+    def _fresh_entry(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry.checked_at < self.ttl_seconds:
+            self._entries.move_to_end(key)
+            return entry
+        return None
+
+    def _store(self, key: str, entry: _Entry):
+        previous = self._entries.pop(key, None)
+        if previous:
+            self._size -= len(previous.content)
+        if len(entry.content) > self.max_bytes:
+            # Too big for memory, the disk tier still has it
+            return
+        self._entries[key] = entry
+        self._size += len(entry.content)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.content)
+            self.evictions += 1
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, *key.strip("/").split("/"))
+
+    def _read_disk(self, key: str) -> Optional[_Entry]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                header = f.readline()
+                content = f.read()
+        except OSError:
+            return None
+        if not header.startswith(DISK_HEADER):
+            # Written before the ETag moved into the file, download it again
+            return None
+        etag = header[len(DISK_HEADER):].strip().decode() or None
+        # Disk copies always get revalidated before use
+        return _Entry(content=content, etag=etag, checked_at=0.0)
+
+    def _write_disk(self, key: str, entry: _Entry):
+        # The ETag goes in a header line of the same file, so one atomic replace swaps both
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(DISK_HEADER + (entry.etag or "").encode() + b"\n")
+                f.write(entry.content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Cache write failed for {key}: {str(e)}")
+
+template_cache = ObjectCache(
+    max_bytes=settings.TEMPLATE_CACHE_MAX_BYTES,
+    cache_dir=settings.TEMPLATE_CACHE_DIR,
+    ttl_seconds=settings.TEMPLATE_CACHE_TTL_SECONDS,
+)
+
+invoice_cache = ObjectCache(
+    max_bytes=settings.INVOICE_CACHE_MAX_BYTES,
+    cache_dir=settings.INVOICE_CACHE_DIR,
+    ttl_seconds=settings.INVOICE_CACHE_TTL_SECONDS,
+)
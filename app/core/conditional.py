@@ -0,0 +1,135 @@
+import hashlib
+from typing import AsyncIterator, Dict, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from .storage import StorageBackend, ObjectNotFound
+
+def _normalize_etag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    # If-None-Match uses weak comparison, so W/"x" and "x" are the same version
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    return _normalize_etag(etag) in {_normalize_etag(tag) for tag in header.split(",")}
+
+def accepts_encoding(request: Request, coding: str) -> bool:
+    # Accept-Encoding with quality values: "gzip;q=0" refuses gzip, "*" covers codings not listed
+    qualities = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    coding = coding.lower()
+    if coding in qualities:
+        return qualities[coding] > 0
+    return qualities.get("*", 0.0) > 0
+
+def content_etag(content: bytes) -> str:
+    return f'"{hashlib.sha256(content).hexdigest()}"'
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, **(headers or {})})
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # Single "bytes=start-end" ranges only; anything else is served as the full body
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: the last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError()
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, min(end, size - 1)
+
+def _requested_range(request: Request, etag: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    # If-Range: only honour the range when the client's copy is still current
+    if_range = request.headers.get("if-range")
+    if if_range and not (etag and _normalize_etag(if_range) == _normalize_etag(etag)):
+        return None
+    return parse_range(request.headers.get("range"), size)
+
+async def _prepend(first: bytes, rest: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+async def stream_object_response(
+    request: Request,
+    storage: StorageBackend,
+    key: str,
+    media_type: str,
+    size: Optional[int],
+    etag: Optional[str],
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    headers = dict(headers or {})
+    if etag:
+        headers["ETag"] = etag
+        if etag_matches(request, etag):
+            return not_modified(etag, headers)
+
+    status_code = 200
+    start = end = None
+    if size is not None:
+        headers["Accept-Ranges"] = "bytes"
+        byte_range = _requested_range(request, etag, size)
+        if byte_range:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(size if status_code == 200 else end - start + 1)
+
+    # Pull the first chunk before answering so a missing object is still a clean 404
+    chunks = storage.stream(key, start, end)
+    try:
+        first = await chunks.__anext__()
+    except ObjectNotFound:
+        raise HTTPException(status_code=404, detail="File not found on Cloud Storage")
+    except StopAsyncIteration:
+        first = b""
+    return StreamingResponse(_prepend(first, chunks), status_code=status_code, media_type=media_type, headers=headers)
+
+def bytes_response(
+    request: Request,
+    content: bytes,
+    media_type: str,
+    etag: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    # Same conditional handling as stream_object_response, for content already in memory
+    headers = dict(headers or {})
+    if etag:
+        headers["ETag"] = etag
+        if etag_matches(request, etag):
+            return not_modified(etag, headers)
+    headers["Accept-Ranges"] = "bytes"
+    byte_range = _requested_range(request, etag, len(content))
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+        return Response(content=content[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
@@ -17,11 +17,111 @@ class Settings(BaseSettings):
     def DATABASE_URL(self) -> str:
         return f"postgresql+asyncpg://{self.PGUSER}:{self.PGPASSWORD}@{self.PGHOST}/{self.PGDATABASE}?ssl={self.PGSSLMODE}"
 
+    DB_CREATE_TABLES: bool = False # Schema is managed by Alembic, only enable for throwaway databases
+
+    # Engine profile: "dev", "prod", "pgbouncer" (transaction mode pooler) or "benchmark", see core/database.py.
+    # Any DB_* value below that is set overrides the profile.
+    DB_PROFILE: str = "pgbouncer" # The default PGHOST is Neon's pgbouncer endpoint
+    DB_ECHO: Optional[bool] = None
+    DB_POOL_SIZE: Optional[int] = None
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_TIMEOUT_SECONDS: Optional[float] = None
+    DB_POOL_RECYCLE_SECONDS: Optional[int] = None
+    DB_POOL_PRE_PING: Optional[bool] = None
+    DB_STATEMENT_CACHE_SIZE: Optional[int] = None # asyncpg prepared statements per connection, 0 for pgbouncer
+
+    # Optional read replica for GET endpoints (get_read_db), same URL format as DATABASE_URL
+    DATABASE_READ_URL: Optional[str] = None
+    DB_READ_PROFILE: Optional[str] = None # Defaults to DB_PROFILE
+    REPLICA_MAX_LAG_SECONDS: float = 5 # Reads go to the primary while the replica is further behind
+    REPLICA_LAG_CHECK_SECONDS: float = 2 # How often a read session re-measures the lag
+    REPLICA_RETRY_SECONDS: float = 30 # After a connection failure, use the primary this long
+
     # Security
     SECRET_KEY: str = "CHANGE_THIS_TO_A_SECURE_SECRET_KEY" # Should be env var in prod
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
+    # Resolved principals (user id, active flag, role names) by token subject
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000 # 0 disables the cache
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 60 # Upper bound on staleness across workers without a channel
+    PRINCIPAL_INVALIDATION_CHANNEL: Optional[str] = None # Postgres NOTIFY channel shared by all workers, e.g. "principal_invalidation"; also carries entitlement and reference data changes
+    # Direct (non-pooler) URL for the listener, same format as DATABASE_URL, e.g. the Neon host without "-pooler".
+    # Required with DB_PROFILE "pgbouncer": LISTEN does not work through a transaction mode pooler.
+    PRINCIPAL_INVALIDATION_LISTEN_URL: Optional[str] = None
+
+    # Plan quotas on invoice creation, decided from an in-memory entitlement cache
+    QUOTA_ENFORCEMENT: str = "soft" # "off", "soft" (allow, log and count) or "hard" (refuse with 402)
+    ENTITLEMENT_CACHE_MAX_ENTRIES: int = 10000 # 0 disables the cache, every check queries
+    ENTITLEMENT_CACHE_TTL_SECONDS: float = 30 # Bounds how far other workers' usage can be behind
+    ENTITLEMENT_STALE_GRACE_SECONDS: float = 300 # Past the TTL, decide on the old entry while it reloads in the background
+
+    # Reference data (plans, business types, roles) served from memory with ETags
+    REFERENCE_CACHE_TTL_SECONDS: float = 300 # 0 disables the cache; bounds staleness across workers without a channel
+    REFERENCE_CACHE_MAX_AGE_SECONDS: int = 60 # Cache-Control max-age sent to clients
+
+    # List endpoints (keyset pagination)
+    PAGE_SIZE_DEFAULT: int = 100
+    PAGE_SIZE_MAX: int = 500
+    FAST_LIST_RESPONSES: bool = False # Flat list schemas skip the ORM and Pydantic and are encoded with orjson
+
+    # Invoice export streaming
+    EXPORT_BATCH_SIZE: int = 1000 # Rows fetched per server-side cursor round trip
+    EXPORT_GZIP_LEVEL: int = 6
+
+    # Bulk invoice creation (POST /invoices/bulk)
+    INVOICE_BULK_MAX_ITEMS: int = 1000
+
+    # Invoice usage metering (epay_subscription_usages)
+    USAGE_METERING: str = "inline" # "inline", "buffered" or "off"
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 5 # "buffered" only
+
+    # Bulk customer import
+    CUSTOMER_IMPORT_BATCH_SIZE: int = 2000 # Rows per INSERT statement and commit
+    CUSTOMER_IMPORT_MAX_ROWS: int = 500000
+    CUSTOMER_IMPORT_MAX_ERRORS: int = 1000 # Row errors listed in the report, the rest are only counted
+
+    # Object storage
+    STORAGE_BACKEND: str = "oci" # "oci", "local" or "memory"
+    OCI_PAR_URL: str = "https://objectstorage.ap-mumbai-1.oraclecloud.com/p/IBDUyhhzwHNkcqt2_NvHqebRPyaN2tVfZuaqKpilDa0foleXa2TAU2xaiukX3NTB/n/bm3luqkdqbty/b/testing/o/"
+    STORAGE_LOCAL_ROOT: str = "app/storage"
+
+    # Shared HTTP client for object storage
+    HTTP_HTTP2: bool = True
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5
+    HTTP_TIMEOUT_SECONDS: float = 30
+
+    # Template cache (in-process LRU backed by a local directory)
+    TEMPLATE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    TEMPLATE_CACHE_DIR: Optional[str] = ".cache/templates"
+    TEMPLATE_CACHE_TTL_SECONDS: int = 300 # Revalidate with ETag after this long
+
+    # Generated invoice PDF cache, these never change once written
+    INVOICE_CACHE_MAX_BYTES: int = 128 * 1024 * 1024
+    INVOICE_CACHE_DIR: Optional[str] = ".cache/invoices"
+    INVOICE_CACHE_TTL_SECONDS: int = 3600
+
+    # PDF rendering pool
+    RENDER_POOL: str = "process" # "process" or "thread"
+    RENDER_WORKERS: int = 2
+    RENDER_MAX_QUEUE: int = 64 # Renders waiting or running before new ones get a 503
+    RENDER_TIMEOUT_SECONDS: Optional[float] = 30
+    PDF_BATCH_MAX_INVOICES: int = 500
+    PDF_BATCH_QUEUE_WAIT_SECONDS: float = 10 # Batch renders wait this long for room in the pool before a 503
+    PDF_BATCH_CHUNK_SIZE: int = 25 # Invoices rendered, committed and sent together; bounds the PDFs held in memory
+
+    # Generated invoice upload outbox
+    UPLOAD_CONCURRENCY: int = 4
+    UPLOAD_BATCH_SIZE: int = 20
+    UPLOAD_POLL_SECONDS: float = 5
+    UPLOAD_LEASE_SECONDS: int = 120 # Claimed rows are hidden from other workers this long
+    UPLOAD_MAX_ATTEMPTS: int = 8
+    UPLOAD_RETRY_BASE_SECONDS: float = 5
+    UPLOAD_RETRY_MAX_SECONDS: float = 3600
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore", env_file_encoding="utf-8")
 
 settings = Settings()
@@ -1,14 +1,206 @@
+import time
+from uuid import uuid4
+from weakref import WeakKeyDictionary
+from typing import Optional
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import Engine, default
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from ..core.config import settings
 
+# Engine settings by DB_PROFILE, individual DB_* settings override the profile.
+# "pgbouncer" is for a transaction mode pooler (e.g. Neon's -pooler host): server connections
+# are shared between clients, so asyncpg must not keep named prepared statements around.
+ENGINE_PROFILES = {
+    "dev": {"echo": True, "pool_size": 5, "max_overflow": 5, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True, "statement_cache_size": 100},
+    "prod": {"echo": False, "pool_size": 10, "max_overflow": 20, "pool_timeout": 30, "pool_recycle": 1800, "pool_pre_ping": True, "statement_cache_size": 100},
+    "pgbouncer": {"echo": False, "pool_size": 10, "max_overflow": 20, "pool_timeout": 30, "pool_recycle": 300, "pool_pre_ping": True, "statement_cache_size": 0},
+    "benchmark": {"echo": False, "pool_size": 20, "max_overflow": 0, "pool_timeout": 60, "pool_recycle": -1, "pool_pre_ping": False, "statement_cache_size": 500},
+}
+
+def engine_options(profile: str = None) -> dict:
+    name = profile or settings.DB_PROFILE
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {name!r}, expected one of {', '.join(ENGINE_PROFILES)}")
+    options = dict(ENGINE_PROFILES[name])
+    overrides = {
+        "echo": settings.DB_ECHO,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+
+    cache_size = options.pop("statement_cache_size")
+    connect_args = {"statement_cache_size": cache_size, "prepared_statement_cache_size": cache_size}
+    if cache_size == 0:
+        # Unnamed-style unique names, a statement prepared on one pooled server connection
+        # must never be looked up by name on another
+        connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+    options["connect_args"] = connect_args
+    return options
+
+# Queue pool that records how long checkouts wait for a free connection
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.max_checkout_wait_seconds = 0.0
+        self.checkout_timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.checkout_timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.checkout_wait_seconds += waited
+            self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, waited)
+
+class _StatementStats:
+    def __init__(self, profile: str):
+        self.profile = profile
+        self.executed = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # SQLAlchemy's compiled statement cache; asyncpg's prepared statement cache sits below it
+        self.executed += 1
+        if context is None:
+            return
+        if context.cache_hit is default.CACHE_HIT:
+            self.cache_hits += 1
+        elif context.cache_hit is default.CACHE_MISS:
+            self.cache_misses += 1
+
+_statement_stats: "WeakKeyDictionary[Engine, _StatementStats]" = WeakKeyDictionary()
+
+def build_engine(url: str, profile: str = None):
+    options = engine_options(profile)
+    new_engine = create_async_engine(url, poolclass=InstrumentedPool, **options)
+    statements = _StatementStats(profile or settings.DB_PROFILE)
+    event.listen(new_engine.sync_engine, "after_cursor_execute", statements.after_cursor_execute)
+    _statement_stats[new_engine.sync_engine] = statements
+    return new_engine
+
+def engine_stats(target=None) -> dict:
+    target = target or engine
+    pool = target.sync_engine.pool
+    statements = _statement_stats.get(target.sync_engine)
+    stats = {"profile": statements.profile if statements else None}
+    if isinstance(pool, InstrumentedPool):
+        stats.update({
+            "poolSize": pool.size(),
+            "inUse": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": pool.checkouts,
+            "checkoutTimeouts": pool.checkout_timeouts,
+            "avgCheckoutWaitMs": round(pool.checkout_wait_seconds / pool.checkouts * 1000, 3) if pool.checkouts else 0.0,
+            "maxCheckoutWaitMs": round(pool.max_checkout_wait_seconds * 1000, 3),
+        })
+    if statements:
+        cached = statements.cache_hits + statements.cache_misses
+        stats.update({
+            "statements": statements.executed,
+            "statementCacheHits": statements.cache_hits,
+            "statementCacheMisses": statements.cache_misses,
+            "statementCacheHitRatio": round(statements.cache_hits / cached, 4) if cached else 0.0,
+        })
+    return stats
+
 # Database connection setup with SQLAlchemy async engine
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+engine = build_engine(settings.DATABASE_URL)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Read replica, None when DATABASE_READ_URL is not set and every read goes to the primary
+read_engine = build_engine(settings.DATABASE_READ_URL, settings.DB_READ_PROFILE) if settings.DATABASE_READ_URL else None
+ReadSessionLocal = async_sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession) if read_engine else None
+
+# Seconds of replay lag; 0 on a primary and on a replica that has replayed everything it received
+REPLICA_LAG_SQL = text("""
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+""")
+
+class ReplicaHealth:
+    def __init__(self):
+        self.lag_seconds: Optional[float] = None
+        self.checked_at = 0.0
+        self.down_until = 0.0
+        self.reads = 0
+        self.stale_fallbacks = 0
+        self.error_fallbacks = 0
+        self.last_error: Optional[str] = None
+
+    def available(self) -> bool:
+        return ReadSessionLocal is not None and time.monotonic() >= self.down_until
+
+    async def fresh_enough(self, session: AsyncSession) -> bool:
+        # Re-measured at most every REPLICA_LAG_CHECK_SECONDS, in between the last reading stands
+        if time.monotonic() - self.checked_at >= settings.REPLICA_LAG_CHECK_SECONDS:
+            self.lag_seconds = float(await session.scalar(REPLICA_LAG_SQL))
+            self.checked_at = time.monotonic()
+        return self.lag_seconds <= settings.REPLICA_MAX_LAG_SECONDS
+
+    def mark_down(self, error: Exception):
+        self.last_error = str(error)
+        self.down_until = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        print(f"Read replica unavailable, using the primary for {settings.REPLICA_RETRY_SECONDS}s: {self.last_error}")
+
+    def stats(self) -> dict:
+        return {
+            "configured": ReadSessionLocal is not None,
+            "available": self.available(),
+            "lagSeconds": self.lag_seconds,
+            "maxLagSeconds": settings.REPLICA_MAX_LAG_SECONDS,
+            "reads": self.reads,
+            "staleFallbacks": self.stale_fallbacks,
+            "errorFallbacks": self.error_fallbacks,
+            "lastError": self.last_error,
+            "engine": engine_stats(read_engine) if read_engine else None,
+        }
+
+replica = ReplicaHealth()
+
 class Base(DeclarativeBase):
     pass
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+async def open_read_session() -> AsyncSession:
+    # A replica session when one is configured, reachable and within the lag limit, else the primary.
+    # Only the connection is checked here; a replica failing halfway through a query is an error.
+    if replica.available():
+        session = ReadSessionLocal()
+        try:
+            await session.connection()
+            if await replica.fresh_enough(session):
+                replica.reads += 1
+                return session
+            replica.stale_fallbacks += 1
+        except (exc.DBAPIError, OSError) as e:
+            replica.error_fallbacks += 1
+            replica.mark_down(e)
+        await session.close()
+    return AsyncSessionLocal()
+
+async def get_read_db():
+    # For GET handlers that can tolerate REPLICA_MAX_LAG_SECONDS of staleness and never write
+    async with await open_read_session() as session:
+        yield session
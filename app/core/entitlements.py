@@ -0,0 +1,115 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+from .config import settings
+
+# What the invoice endpoints need to know about a business's subscription, in memory
+@dataclass
+class Entitlement:
+    businessId: int
+    subscriptionId: Optional[int]
+    active: bool
+    endsAt: Optional[datetime]
+    invoiceLimit: Optional[int] # None = unlimited
+    usageMonth: str
+    used: int # Invoices this month: the counter at load time plus what this worker created since
+
+    def denial(self, n: int = 1, now: Optional[datetime] = None) -> Optional[str]:
+        # Why n more invoices are not allowed, None when they are
+        now = now or datetime.now(timezone.utc)
+        if self.subscriptionId is None:
+            return "no_subscription"
+        if not self.active:
+            return "subscription_inactive"
+        if self.endsAt is not None and self.endsAt < now:
+            return "subscription_expired"
+        if self.invoiceLimit is not None and self.used + n > self.invoiceLimit:
+            return "invoice_limit_reached"
+        return None
+
+@dataclass
+class _Entry:
+    entitlement: Entitlement
+    loaded_at: float
+
+# Entitlements by businessId. Entries are dropped on subscription, payment and plan changes;
+# the TTL bounds staleness for usage created by other workers.
+class EntitlementCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, grace_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.grace_seconds = grace_seconds
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # Bumped by every invalidation; a load that overlapped one is not cached
+        self.generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, businessId: int) -> Tuple[Optional[Entitlement], bool]:
+        # (entitlement, fresh). Past the TTL but within the grace period the entry is still
+        # returned, not fresh, and the caller refreshes it in the background.
+        entry = self._entries.get(businessId)
+        if entry is None or entry.entitlement.usageMonth != datetime.now(timezone.utc).strftime("%Y-%m"):
+            self.misses += 1
+            return None, False
+        age = time.monotonic() - entry.loaded_at
+        if age < self.ttl_seconds:
+            self._entries.move_to_end(businessId)
+            self.hits += 1
+            return entry.entitlement, True
+        if age < self.ttl_seconds + self.grace_seconds:
+            self.stale_hits += 1
+            return entry.entitlement, False
+        self.misses += 1
+        return None, False
+
+    def put(self, entitlement: Entitlement, generation: Optional[int] = None):
+        # generation: the value read before loading the entitlement
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        self._entries.pop(entitlement.businessId, None)
+        self._entries[entitlement.businessId] = _Entry(entitlement=entitlement, loaded_at=time.monotonic())
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def add_usage(self, businessId: int, usageMonth: str, n: int):
+        entry = self._entries.get(businessId)
+        if entry and entry.entitlement.usageMonth == usageMonth:
+            entry.entitlement.used += n
+
+    def invalidate_business(self, businessId: int):
+        self.generation += 1
+        if self._entries.pop(businessId, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hitRatio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+entitlement_cache = EntitlementCache(
+    max_entries=settings.ENTITLEMENT_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ENTITLEMENT_CACHE_TTL_SECONDS,
+    grace_seconds=settings.ENTITLEMENT_STALE_GRACE_SECONDS,
+)
@@ -0,0 +1,106 @@
+from typing import Optional
+import httpx
+from .config import settings
+
+class _TrackedStream(httpx.AsyncByteStream):
+    # A request stays active until its body is read or closed, not just until the headers arrive
+    def __init__(self, stream: httpx.AsyncByteStream, done):
+        self._stream = stream
+        self._done = done
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._done is not None:
+                self._done()
+                self._done = None
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = 0
+        self.errors = 0
+        self.active = 0
+        self.peak_active = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException as e:
+            # Cancelled requests free their slot too, but are not errors
+            if isinstance(e, Exception):
+                self.errors += 1
+            self.active -= 1
+            raise
+        response.stream = _TrackedStream(response.stream, self._finished)
+        return response
+
+    def _finished(self):
+        self.active -= 1
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[_InstrumentedTransport] = None
+
+def _http2_available() -> bool:
+    if not settings.HTTP_HTTP2:
+        return False
+    try:
+        import h2 # noqa: F401
+        return True
+    except ImportError:
+        print("h2 is not installed, object storage client falls back to HTTP/1.1")
+        return False
+
+def start_http_client() -> httpx.AsyncClient:
+    global _client, _transport
+    if _client is None:
+        _transport = _InstrumentedTransport(
+            http2=_http2_available(),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            retries=1, # Reconnect once when a pooled keep-alive connection was closed by the server
+        )
+        _client = httpx.AsyncClient(
+            transport=_transport,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+        )
+    return _client
+
+async def close_http_client():
+    global _client, _transport
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _transport = None
+
+def get_http_client() -> httpx.AsyncClient:
+    # Shared by every router and background worker; created lazily for scripts that skip the lifespan
+    return start_http_client()
+
+def http_stats() -> dict:
+    if _transport is None:
+        return {"started": False}
+    connections = list(getattr(_transport._pool, "connections", []))
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "started": True,
+        "http2": _transport._pool._http2,
+        "connections": len(connections),
+        "idleConnections": idle,
+        "maxConnections": settings.HTTP_MAX_CONNECTIONS,
+        "activeRequests": _transport.active,
+        "peakActiveRequests": _transport.peak_active,
+        "requests": _transport.requests,
+        "errors": _transport.errors,
+    }
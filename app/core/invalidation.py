@@ -0,0 +1,166 @@
+import asyncio
+from typing import Optional
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+from .config import settings
+from . import database
+from .principals import principal_cache
+from .entitlements import entitlement_cache
+from .reference import reference_cache
+
+# Invalidation of the principal, entitlement and reference data caches. Messages are
+# "user:<userId>", "all", "business:<businessId>", "entitlements" or "reference:<dataset>".
+#
+# The invalidate_* calls go inside the transaction that makes the change. This worker's caches
+# are cleared by the session's after_commit hook, never before: a request that reloads in
+# between would otherwise cache the old row for a full TTL. Other workers hear about it over
+# Postgres LISTEN/NOTIFY on PRINCIPAL_INVALIDATION_CHANNEL; NOTIFY is queued in the same
+# transaction and Postgres only delivers it once that commits, so it is after commit as well
+# and lost together with a rollback.
+#
+# LISTEN needs a session that stays on one server connection, which a transaction mode pooler
+# (DB_PROFILE "pgbouncer", Neon's -pooler host) does not give. The listener therefore uses its
+# own direct connection from PRINCIPAL_INVALIDATION_LISTEN_URL and refuses to start without one
+# on the pooled profile; NOTIFY itself works through the pooler.
+
+_SESSION_KEY = "invalidations"
+
+def _apply(message: str):
+    try:
+        if message.startswith("user:"):
+            principal_cache.invalidate_user(int(message[5:]))
+        elif message.startswith("business:"):
+            entitlement_cache.invalidate_business(int(message[9:]))
+        elif message == "entitlements":
+            entitlement_cache.clear()
+        elif message.startswith("reference:"):
+            reference_cache.invalidate(message[10:])
+        else:
+            principal_cache.clear()
+    except ValueError:
+        print(f"Ignoring invalidation message: {message}")
+
+async def _publish(db: AsyncSession, message: str):
+    # Applied locally by _invalidations_committed below, dropped on rollback
+    db.info.setdefault(_SESSION_KEY, []).append(message)
+    if settings.PRINCIPAL_INVALIDATION_CHANNEL:
+        await db.execute(
+            text("SELECT pg_notify(:channel, :message)"),
+            {"channel": settings.PRINCIPAL_INVALIDATION_CHANNEL, "message": message},
+        )
+
+@event.listens_for(Session, "after_commit")
+def _invalidations_committed(session: Session):
+    for message in dict.fromkeys(session.info.pop(_SESSION_KEY, [])):
+        _apply(message)
+
+@event.listens_for(Session, "after_rollback")
+def _invalidations_rolled_back(session: Session):
+    session.info.pop(_SESSION_KEY, None)
+
+async def invalidate_principals(db: AsyncSession, userId: Optional[int] = None):
+    # Call inside the transaction that changes the user or their roles, before the commit
+    await _publish(db, "all" if userId is None else f"user:{userId}")
+
+async def invalidate_entitlements(db: AsyncSession, businessId: Optional[int] = None):
+    # Call inside the transaction that changes a subscription, payment or plan, before the commit
+    await _publish(db, "entitlements" if businessId is None else f"business:{businessId}")
+
+async def invalidate_reference(db: AsyncSession, dataset: str):
+    # Call inside the transaction that writes the dataset's table, before the commit
+    await _publish(db, f"reference:{dataset}")
+
+def listen_url() -> Optional[str]:
+    # Direct connection for LISTEN; the application URL only when it does not go through the pooler
+    if settings.PRINCIPAL_INVALIDATION_LISTEN_URL:
+        return settings.PRINCIPAL_INVALIDATION_LISTEN_URL
+    if settings.DB_PROFILE == "pgbouncer" or "-pooler" in settings.PGHOST:
+        return None
+    return settings.DATABASE_URL
+
+class InvalidationListener:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self.received = 0
+        self.reconnects = 0
+        self.error: Optional[str] = None
+
+    def start(self):
+        if not settings.PRINCIPAL_INVALIDATION_CHANNEL or self._task is not None:
+            return
+        url = listen_url()
+        if url is None or "-pooler" in url:
+            # LISTEN through a transaction mode pooler subscribes a server connection that other
+            # clients then use; notifications would silently never arrive here
+            self.error = "PRINCIPAL_INVALIDATION_LISTEN_URL must be a direct (non-pooler) connection"
+            print(f"Invalidation listener not started: {self.error}. Other workers' changes show up after the cache TTLs.")
+            return
+        self.error = None
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run(url))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=5)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "channel": settings.PRINCIPAL_INVALIDATION_CHANNEL,
+            "running": self._task is not None,
+            "received": self.received,
+            "reconnects": self.reconnects,
+            "error": self.error,
+        }
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.received += 1
+        _apply(payload)
+
+    async def _run(self, url: str):
+        channel = settings.PRINCIPAL_INVALIDATION_CHANNEL
+        # One connection of its own, outside the application pool
+        engine = create_async_engine(url, poolclass=NullPool, connect_args=database.engine_options("prod")["connect_args"])
+        try:
+            await self._listen(engine, channel)
+        finally:
+            await engine.dispose()
+
+    async def _listen(self, engine, channel: str):
+        while not self._stopping.is_set():
+            try:
+                async with engine.connect() as conn:
+                    raw = await conn.get_raw_connection()
+                    listener = raw.driver_connection
+                    lost = asyncio.Event()
+                    listener.add_termination_listener(lambda _: lost.set())
+                    await listener.add_listener(channel, self._on_notify)
+                    # Anything sent while we were not listening is lost, start clean
+                    principal_cache.clear()
+                    entitlement_cache.clear()
+                    reference_cache.clear()
+                    stopping = asyncio.create_task(self._stopping.wait())
+                    closed = asyncio.create_task(lost.wait())
+                    await asyncio.wait({stopping, closed}, return_when=asyncio.FIRST_COMPLETED)
+                    stopping.cancel()
+                    closed.cancel()
+                    if not lost.is_set():
+                        await listener.remove_listener(channel, self._on_notify)
+            except Exception as e:
+                print(f"Invalidation listener error: {str(e)}")
+            if not self._stopping.is_set():
+                self.reconnects += 1
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=5)
+                except asyncio.TimeoutError:
+                    pass
+
+invalidation_listener = InvalidationListener()
@@ -0,0 +1,114 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple, Type, Union
+from fastapi import HTTPException, Query, Response
+from pydantic import BaseModel
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import ColumnProperty
+from .config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    if settings.FAST_LIST_RESPONSES:
+        print("orjson is not installed, list responses use the regular response_model path")
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Query parameters shared by every list endpoint: `Depends(PageParams)`
+class PageParams:
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description=f"Opaque cursor from the {NEXT_CURSOR_HEADER} response header"),
+        limit: int = Query(settings.PAGE_SIZE_DEFAULT, ge=1, description=f"Page size, capped at {settings.PAGE_SIZE_MAX}"),
+        skip: int = Query(0, ge=0, deprecated=True, description="OFFSET paging, use cursor instead"),
+    ):
+        self.cursor = cursor
+        self.limit = min(limit, settings.PAGE_SIZE_MAX)
+        self.skip = skip
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, keys: Sequence) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError()
+        return [
+            datetime.fromisoformat(value) if key.type.python_type is datetime else key.type.python_type(value)
+            for key, value in zip(keys, values)
+        ]
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+_list_columns_cache: Dict[Tuple[type, type], Optional[list]] = {}
+
+def list_columns(query: Select, keys: Sequence, schema: Type[BaseModel]) -> Optional[list]:
+    # The entity's columns named like the schema's fields, or None when the schema needs more than
+    # plain columns (relationships, computed fields) or leaves out a page key
+    entity = query.column_descriptions[0]["entity"]
+    cache_key = (entity, schema)
+    if cache_key not in _list_columns_cache:
+        columns = []
+        for name in schema.model_fields:
+            attribute = getattr(entity, name, None)
+            if attribute is None or not isinstance(getattr(attribute, "property", None), ColumnProperty):
+                columns = None
+                break
+            columns.append(attribute)
+        if columns is not None and any(key.key not in schema.model_fields for key in keys):
+            columns = None
+        _list_columns_cache[cache_key] = columns
+    return _list_columns_cache[cache_key]
+
+def encode_rows(names: Sequence[str], rows: Sequence) -> bytes:
+    # Same JSON as the response_model path for flat schemas: UTC datetimes end in "Z"
+    return orjson.dumps([dict(zip(names, row)) for row in rows], option=orjson.OPT_UTC_Z)
+
+async def paginate(
+    db: AsyncSession,
+    query: Select,
+    keys: Sequence,
+    page: PageParams,
+    response: Response,
+    schema: Optional[Type[BaseModel]] = None,
+) -> Union[List, Response]:
+    # Keyset pagination, newest first: WHERE (createdOn, id) < (cursor) ORDER BY createdOn DESC, id DESC.
+    # `keys` must be NOT NULL (rows with a NULL key fall out of the comparison) and end with a
+    # unique column so the order is total. The body stays a plain list,
+    # the cursor for the next page (if any) goes in the X-Next-Cursor header.
+    # With FAST_LIST_RESPONSES and the endpoint's response schema, flat schemas skip the ORM and
+    # Pydantic: only the schema's columns are selected and the rows go straight to orjson.
+    query = query.order_by(*[key.desc() for key in keys])
+    if page.cursor:
+        values = decode_cursor(page.cursor, keys)
+        if len(keys) == 1:
+            query = query.where(keys[0] < values[0])
+        else:
+            query = query.where(tuple_(*keys) < tuple_(*values))
+    elif page.skip:
+        query = query.offset(page.skip)
+
+    columns = None
+    if schema is not None and settings.FAST_LIST_RESPONSES and orjson is not None:
+        columns = list_columns(query, keys, schema)
+    if columns is not None:
+        rows = (await db.execute(query.with_only_columns(*columns).limit(page.limit + 1))).all()
+        headers = {}
+        if len(rows) > page.limit:
+            rows = rows[:page.limit]
+            headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+        return Response(content=encode_rows([column.key for column in columns], rows), media_type="application/json", headers=headers)
+
+    rows = (await db.execute(query.limit(page.limit + 1))).scalars().all()
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+    return rows
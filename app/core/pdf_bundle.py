@@ -0,0 +1,84 @@
+import asyncio
+import io
+import os
+import tempfile
+import time
+import zipfile
+from typing import AsyncIterator, List, Tuple
+import fitz # PyMuPDF
+
+CHUNK_SIZE = 64 * 1024
+
+class _ZipSink(io.RawIOBase):
+    # Unseekable sink, so zipfile writes data descriptors and we can flush after every entry
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+async def stream_zip(documents: AsyncIterator[Tuple[str, bytes]]) -> AsyncIterator[bytes]:
+    sink = _ZipSink()
+    # PDFs are already compressed, storing them keeps the archive cheap to build
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        async for filename, content in documents:
+            info = zipfile.ZipInfo(filename, date_time=time.localtime()[:6])
+            archive.writestr(info, content)
+            yield sink.drain()
+    yield sink.drain()
+
+async def stream_merged_pdf(documents: AsyncIterator[Tuple[str, bytes]], flush_every: int = 25) -> AsyncIterator[bytes]:
+    # The xref table can only be written once every page is known, so pages are appended to a
+    # temporary file, flush_every documents per incremental save, and the merged file is sent from
+    # disk at the end. Only one flush worth of rendered buffers is held in memory at a time.
+    with tempfile.TemporaryDirectory(prefix="merged-pdf-") as workdir:
+        parts_path = os.path.join(workdir, "parts.pdf")
+        merged_path = os.path.join(workdir, "merged.pdf")
+        pending = []
+        async for _, content in documents:
+            pending.append(content)
+            if len(pending) >= flush_every:
+                await asyncio.to_thread(_append_pdfs, parts_path, pending)
+                pending = []
+        if pending:
+            await asyncio.to_thread(_append_pdfs, parts_path, pending)
+            pending = []
+        if not os.path.exists(parts_path):
+            return
+        # garbage=3 folds the template resources every page shares into one copy
+        await asyncio.to_thread(_compact_pdf, parts_path, merged_path)
+        os.remove(parts_path)
+        with open(merged_path, "rb") as merged:
+            while True:
+                chunk = await asyncio.to_thread(merged.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+def _append_pdfs(path: str, contents: List[bytes]):
+    # Reopened for every flush so pages already on disk are not kept in memory
+    existing = os.path.exists(path)
+    merged = fitz.open(path) if existing else fitz.open()
+    try:
+        for content in contents:
+            with fitz.open(stream=content, filetype="pdf") as doc:
+                merged.insert_pdf(doc)
+        if existing:
+            merged.saveIncr()
+        else:
+            merged.save(path)
+    finally:
+        merged.close()
+
+def _compact_pdf(source: str, target: str):
+    with fitz.open(source) as doc:
+        doc.save(target, garbage=3, deflate=True)
@@ -0,0 +1,58 @@
+import json
+from typing import Any, Dict, List, Tuple
+import fitz # PyMuPDF
+
+# Storage names of the artifacts produced from an ACTIVE template
+TEMPLATE_FILENAME = "receipt_fields.pdf"
+BASE_FILENAME = "receipt_base.pdf"
+LAYOUT_FILENAME = "receipt_layout.json"
+
+LAYOUT_VERSION = 1
+
+def compile_template(template_content: bytes) -> Tuple[bytes, List[Dict[str, Any]]]:
+    # Record where every form field sits, then strip the widgets so renders only stamp text
+    doc = fitz.open(stream=template_content, filetype="pdf")
+    try:
+        page = doc.load_page(0)
+        fields = []
+        for widget in page.widgets():
+            rect = widget.rect
+            fields.append({
+                "name": widget.field_name,
+                "rect": [rect.x0, rect.y0, rect.x1, rect.y1],
+            })
+            page.delete_widget(widget)
+        base_content = doc.write(garbage=1, deflate=True)
+    finally:
+        doc.close()
+    return base_content, fields
+
+def dump_layout(fields: List[Dict[str, Any]]) -> bytes:
+    return json.dumps({"version": LAYOUT_VERSION, "page": 0, "fields": fields}).encode("utf-8")
+
+def load_layout(layout_content: bytes) -> List[Dict[str, Any]]:
+    layout = json.loads(layout_content)
+    if layout.get("version") != LAYOUT_VERSION:
+        raise ValueError(f"Unsupported template layout version: {layout.get('version')}")
+    return layout["fields"]
+
+def render_invoice(base_content: bytes, fields: List[Dict[str, Any]], values: Dict[str, Any]) -> bytes:
+    doc = fitz.open(stream=base_content, filetype="pdf")
+    try:
+        page = doc.load_page(0)
+        for field in fields:
+            value = values.get(field["name"])
+            if value is None:
+                continue
+            x0, y0, x1, y1 = field["rect"]
+            # Same placement the widget based fill used: left edge, just above the bottom
+            page.insert_text(
+                (x0, y1 - 3),
+                str(value),
+                fontname="hebo", # Helvetica Bold
+                fontsize=12,
+                color=(0, 0, 0) # Black text
+            )
+        return doc.write()
+    finally:
+        doc.close()
@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from .config import settings
+
+# What most endpoints need to know about the caller, without an ORM User attached to a session
+@dataclass(frozen=True)
+class Principal:
+    userId: int
+    emailId: str
+    isActive: bool
+    roles: Tuple[str, ...]
+
+    def has_role(self, roleName: str) -> bool:
+        return roleName.lower() in (role.lower() for role in self.roles)
+
+@dataclass
+class _Entry:
+    principal: Principal
+    loaded_at: float
+
+# Resolved principals by token subject (the email), bounded by entries and age.
+# Entries are dropped on user and role changes; the TTL bounds staleness for changes
+# made by other workers when no invalidation channel is configured.
+class PrincipalCache:
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._subjects: Dict[int, str] = {} # userId -> subject, for invalidation by id
+        # Bumped by every invalidation; a load that overlapped one is not cached
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, subject: str) -> Optional[Principal]:
+        entry = self._entries.get(subject)
+        if entry and time.monotonic() - entry.loaded_at < self.ttl_seconds:
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            return entry.principal
+        self.misses += 1
+        return None
+
+    def put(self, subject: str, principal: Principal, generation: Optional[int] = None):
+        # generation: the value read before loading the principal
+        if self.max_entries <= 0 or self.ttl_seconds <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        self._pop(subject)
+        self._entries[subject] = _Entry(principal=principal, loaded_at=time.monotonic())
+        self._subjects[principal.userId] = subject
+        while len(self._entries) > self.max_entries:
+            self._pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate_user(self, userId: int):
+        self.generation += 1
+        subject = self._subjects.get(userId)
+        if subject is not None:
+            self._pop(subject)
+            self.invalidations += 1
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._subjects.clear()
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _pop(self, subject: str):
+        entry = self._entries.pop(subject, None)
+        if entry and self._subjects.get(entry.principal.userId) == subject:
+            del self._subjects[entry.principal.userId]
+
+principal_cache = PrincipalCache(
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
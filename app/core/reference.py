@@ -0,0 +1,152 @@
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, Type
+from fastapi import Request, Response
+from pydantic import BaseModel
+from .config import settings
+from . import database
+from .conditional import bytes_response, content_etag, etag_matches
+
+# Nearly static lists (plans, business types, roles) kept as serialized JSON, one entry per
+# dataset and fixed view ("all", "active"). Pages and single rows are cut from that entry, so
+# request parameters never create entries or trigger loads. A conditional GET with a current
+# ETag is answered from memory without a session. Writes bump the dataset's version, which drops
+# every entry of it once the write commits (see invalidation.py); a load that overlapped that is
+# served but not kept. The TTL bounds how long another worker can serve an old copy when no
+# invalidation channel is configured.
+
+@dataclass
+class _Entry:
+    items: List[bytes] # Each row's JSON, in query order
+    ids: Dict[Hashable, int] # Row id -> position in items
+    body: bytes
+    etag: str
+    version: int
+    loaded_at: float
+
+Loader = Callable[[], Awaitable[Tuple[List[bytes], List[Hashable]]]]
+
+class ReferenceCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._versions: Dict[str, int] = defaultdict(int)
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = defaultdict(asyncio.Lock)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    async def get(self, dataset: str, view: str, load: Loader) -> _Entry:
+        entry = self._current(dataset, view)
+        if entry:
+            self.hits += 1
+            return entry
+        # One load per view at a time, a cold start doesn't send every waiting request to the DB
+        async with self._locks[(dataset, view)]:
+            entry = self._current(dataset, view)
+            if entry:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            version = self._versions[dataset]
+            items, ids = await load()
+            body = b"[" + b",".join(items) + b"]"
+            entry = _Entry(
+                items=items,
+                ids={row_id: position for position, row_id in enumerate(ids)},
+                body=body,
+                etag=content_etag(body),
+                version=version,
+                loaded_at=time.monotonic(),
+            )
+            # Invalidated while loading: serve this copy once, don't keep it
+            if self.ttl_seconds > 0 and version == self._versions[dataset]:
+                self._entries[(dataset, view)] = entry
+            return entry
+
+    def invalidate(self, dataset: str):
+        self._versions[dataset] += 1
+        for cached in [cached for cached in self._entries if cached[0] == dataset]:
+            del self._entries[cached]
+        self.invalidations += 1
+
+    def clear(self):
+        for dataset in list(self._versions):
+            self._versions[dataset] += 1
+        self._entries.clear()
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "versions": dict(self._versions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "notModified": self.not_modified,
+            "invalidations": self.invalidations,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _current(self, dataset: str, view: str) -> Optional[_Entry]:
+        entry = self._entries.get((dataset, view))
+        if entry and entry.version == self._versions[dataset] and time.monotonic() - entry.loaded_at < self.ttl_seconds:
+            return entry
+        return None
+
+reference_cache = ReferenceCache(ttl_seconds=settings.REFERENCE_CACHE_TTL_SECONDS)
+
+def query_loader(query, schema: Type[BaseModel], id_field: str) -> Loader:
+    # Runs the query only when the cache misses. Always on the primary: a load right after an
+    # invalidation must see the committed change, which a lagging replica may not have yet
+    async def load() -> Tuple[List[bytes], List[Hashable]]:
+        async with database.AsyncSessionLocal() as db:
+            rows = (await db.execute(query)).scalars().all()
+        items = [schema.model_validate(row) for row in rows]
+        return [item.model_dump_json().encode() for item in items], [getattr(item, id_field) for item in items]
+    return load
+
+def _response(request: Request, body: bytes, etag: str, public: bool) -> Response:
+    # Clients reuse their copy for max-age, then revalidate with If-None-Match
+    scope = "public" if public else "private"
+    headers = {"Cache-Control": f"{scope}, max-age={settings.REFERENCE_CACHE_MAX_AGE_SECONDS}"}
+    if etag_matches(request, etag):
+        reference_cache.not_modified += 1
+    return bytes_response(request, body, "application/json", etag=etag, headers=headers)
+
+async def reference_response(
+    request: Request,
+    dataset: str,
+    view: str,
+    load: Loader,
+    public: bool = True,
+    skip: int = 0,
+    limit: Optional[int] = None,
+) -> Response:
+    # The view as a JSON list, or the skip/limit slice of it
+    entry = await reference_cache.get(dataset, view, load)
+    skip = max(skip, 0)
+    end = len(entry.items) if limit is None else min(skip + max(limit, 0), len(entry.items))
+    if skip == 0 and end == len(entry.items):
+        return _response(request, entry.body, entry.etag, public)
+    body = b"[" + b",".join(entry.items[skip:end]) + b"]"
+    return _response(request, body, content_etag(body), public)
+
+async def reference_item_response(
+    request: Request,
+    dataset: str,
+    view: str,
+    load: Loader,
+    row_id: Hashable,
+    public: bool = True,
+) -> Optional[Response]:
+    # One row of the view by id, None when it is not there
+    entry = await reference_cache.get(dataset, view, load)
+    position = entry.ids.get(row_id)
+    if position is None:
+        return None
+    body = entry.items[position]
+    return _response(request, body, content_etag(body), public)
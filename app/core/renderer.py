@@ -0,0 +1,161 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+from .config import settings
+
+class RenderQueueFull(Exception):
+    pass
+
+def _timed_call(fn: Callable, args: tuple):
+    # Runs inside the worker so we can tell render time apart from queue wait
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+def _percentile(values, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+# Runs CPU bound PyMuPDF work off the event loop in a bounded pool
+class RenderExecutor:
+    def __init__(self, mode: str, workers: int, max_queue: int, timeout_seconds: Optional[float]):
+        self.mode = mode
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+        self.active_mode: Optional[str] = None
+        self._executor: Optional[Executor] = None
+        self._swap_lock = threading.Lock()
+        self._in_flight = 0
+        # Free places in the queue, so callers that can wait don't poll for one
+        self._slots = asyncio.Semaphore(max_queue)
+        self._render_times = deque(maxlen=512)
+        self._wait_times = deque(maxlen=512)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.mode == "process":
+            try:
+                # spawn keeps workers clear of the event loop and connections held by this process
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                self.active_mode = "process"
+                return
+            except (OSError, NotImplementedError, ImportError) as e:
+                print(f"Process pool unavailable, falling back to threads: {str(e)}")
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        self.active_mode = "thread"
+
+    def _finished(self):
+        self._in_flight -= 1
+        self._slots.release()
+
+    def _finished_threadsafe(self, loop: asyncio.AbstractEventLoop):
+        # Done callbacks run on the executor's threads
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(self._finished)
+
+    def _replace_executor(self, broken: Executor):
+        # Every render in flight fails when a pool breaks; only the first one to get here replaces it
+        with self._swap_lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+            self.start()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def shutdown(self):
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        await asyncio.to_thread(executor.shutdown, True)
+
+    async def run(self, fn: Callable, *args: Any, wait_seconds: Optional[float] = None):
+        # Without wait_seconds a full queue is refused at once; with it the call waits up to
+        # that long for a place before giving up with RenderQueueFull
+        if self._executor is None:
+            self.start()
+        if self._slots.locked() and not wait_seconds:
+            self.rejected += 1
+            raise RenderQueueFull()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), wait_seconds)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise RenderQueueFull()
+
+        self._in_flight += 1
+        started = time.perf_counter()
+        executor = self._executor
+        loop = asyncio.get_running_loop()
+        work = None
+        try:
+            work = executor.submit(_timed_call, fn, args)
+            # The place is given back when the work really ends, not when the caller stops waiting:
+            # a render that timed out keeps its worker busy, so it keeps counting against the queue
+            work.add_done_callback(lambda _: self._finished_threadsafe(loop))
+            result, render_seconds = await asyncio.wait_for(asyncio.wrap_future(work), self.timeout_seconds)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge template), replace the pool for the next render
+            self.failed += 1
+            self._replace_executor(executor)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            if work is None:
+                self._finished()
+
+        elapsed = time.perf_counter() - started
+        self.completed += 1
+        self._render_times.append(render_seconds * 1000)
+        self._wait_times.append(max(0.0, elapsed - render_seconds) * 1000)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.active_mode or self.mode,
+            "workers": self.workers,
+            "inFlight": self._in_flight,
+            "queueDepth": max(0, self._in_flight - self.workers),
+            "maxQueue": self.max_queue,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "renderMs": {
+                "p50": round(_percentile(self._render_times, 0.5), 2),
+                "p95": round(_percentile(self._render_times, 0.95), 2),
+                "max": round(max(self._render_times, default=0.0), 2),
+            },
+            "waitMs": {
+                "p50": round(_percentile(self._wait_times, 0.5), 2),
+                "p95": round(_percentile(self._wait_times, 0.95), 2),
+                "max": round(max(self._wait_times, default=0.0), 2),
+            },
+        }
+
+renderer = RenderExecutor(
+    mode=settings.RENDER_POOL,
+    workers=settings.RENDER_WORKERS,
+    max_queue=settings.RENDER_MAX_QUEUE,
+    timeout_seconds=settings.RENDER_TIMEOUT_SECONDS,
+)
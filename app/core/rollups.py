@@ -0,0 +1,190 @@
+# SQL for the /admin/stats rollups. Triggers keep epay_stats_counters and epay_stats_invoice_daily
+# in step with the base tables inside the writing transaction, whichever code path does the write.
+#
+# Counters are sharded by backend (pg_backend_pid() % STATS_SHARDS) so concurrent writers for
+# different tenants do not queue on one hot row; readers sum the shards. Days are UTC dates.
+#
+# models.py installs TRIGGER_SQL when tables come from Base.metadata.create_all.
+# migrations/versions/0004_stats_rollups.py has a frozen copy of both lists. Everything is
+# CREATE OR REPLACE, so a change here ships as a new migration carrying the new SQL.
+
+STATS_SHARDS = 16
+
+def invoice_day(alias: str = "") -> str:
+    # The UTC day an invoice is counted under; createdOn covers rows inserted with a NULL date
+    prefix = f"{alias}." if alias else ""
+    return f"""(COALESCE({prefix}"invoiceDate", {prefix}"createdOn") AT TIME ZONE 'UTC')::date"""
+
+INVOICE_DAY = invoice_day()
+
+TRIGGER_SQL = [
+    f"""
+    CREATE OR REPLACE FUNCTION epay_stats_bump(name text, delta bigint) RETURNS void AS $$
+    BEGIN
+        IF delta IS NULL OR delta = 0 THEN
+            RETURN;
+        END IF;
+        INSERT INTO epay_stats_counters ("counterName", shard, value)
+        VALUES (name, pg_backend_pid() % {STATS_SHARDS}, delta)
+        ON CONFLICT ("counterName", shard) DO UPDATE SET value = epay_stats_counters.value + EXCLUDED.value;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_apply_invoice_delta(business_ids integer[], days date[], deltas bigint[]) RETURNS void AS $$
+    BEGIN
+        IF business_ids IS NULL THEN
+            RETURN;
+        END IF;
+        -- Fixed lock order keeps concurrent batches from deadlocking on the daily rows
+        INSERT INTO epay_stats_invoice_daily ("businessId", day, "invoiceCount")
+        SELECT b, d, sum(n) FROM unnest(business_ids, days, deltas) AS t(b, d, n)
+        GROUP BY b, d ORDER BY b, d
+        ON CONFLICT ("businessId", day) DO UPDATE SET "invoiceCount" = epay_stats_invoice_daily."invoiceCount" + EXCLUDED."invoiceCount";
+        PERFORM epay_stats_bump('invoices:' || to_char(d, 'YYYY-MM-DD'), sum(n)::bigint)
+        FROM unnest(business_ids, days, deltas) AS t(b, d, n) GROUP BY d ORDER BY d;
+        PERFORM epay_stats_bump('invoices', (SELECT sum(n) FROM unnest(deltas) AS n)::bigint);
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION epay_stats_invoices_inserted() RETURNS trigger AS $$
+    BEGIN
+        PERFORM epay_stats_apply_invoice_delta(array_agg(b), array_agg(d), array_agg(n))
+        FROM (SELECT "businessId" AS b, {INVOICE_DAY} AS d, count(*) AS n FROM new_rows GROUP BY 1, 2) t;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION epay_stats_invoices_deleted() RETURNS trigger AS $$
+    BEGIN
+        PERFORM epay_stats_apply_invoice_delta(array_agg(b), array_agg(d), array_agg(n))
+        FROM (SELECT "businessId" AS b, {INVOICE_DAY} AS d, -count(*) AS n FROM old_rows GROUP BY 1, 2) t;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION epay_stats_invoices_updated() RETURNS trigger AS $$
+    BEGIN
+        -- Only rows that moved to another business or day change the rollup
+        PERFORM epay_stats_apply_invoice_delta(array_agg(b), array_agg(d), array_agg(n))
+        FROM (
+            WITH moved AS (
+                SELECT o."businessId" AS old_b, {invoice_day("o")} AS old_d,
+                       r."businessId" AS new_b, {invoice_day("r")} AS new_d
+                FROM old_rows o JOIN new_rows r ON r."invoiceId" = o."invoiceId"
+            )
+            SELECT old_b AS b, old_d AS d, -count(*) AS n FROM moved
+            WHERE (old_b, old_d) IS DISTINCT FROM (new_b, new_d) GROUP BY 1, 2
+            UNION ALL
+            SELECT new_b, new_d, count(*) FROM moved
+            WHERE (old_b, old_d) IS DISTINCT FROM (new_b, new_d) GROUP BY 1, 2
+        ) t;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_business() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD."templateStatus" IS NOT DISTINCT FROM NEW."templateStatus" THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+            PERFORM epay_stats_bump('businesses', 1);
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM epay_stats_bump('businesses', -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD."templateStatus" IS NOT NULL THEN
+            PERFORM epay_stats_bump('templates:' || OLD."templateStatus", -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW."templateStatus" IS NOT NULL THEN
+            PERFORM epay_stats_bump('templates:' || NEW."templateStatus", 1);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_users() RETURNS trigger AS $$
+    BEGIN
+        PERFORM epay_stats_bump('users', CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    # Statement level with transition tables: a 500 invoice batch is one rollup update, not 500
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_invoices_inserted AFTER INSERT ON epay_invoices
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION epay_stats_invoices_inserted()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_invoices_deleted AFTER DELETE ON epay_invoices
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION epay_stats_invoices_deleted()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_invoices_updated AFTER UPDATE ON epay_invoices
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION epay_stats_invoices_updated()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_business AFTER INSERT OR DELETE OR UPDATE OF "templateStatus" ON epay_business
+    FOR EACH ROW EXECUTE FUNCTION epay_stats_business()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_users AFTER INSERT OR DELETE ON epay_users
+    FOR EACH ROW EXECUTE FUNCTION epay_stats_users()
+    """,
+]
+
+# Recomputes both rollup tables from the base tables. SHARE locks hold off writers (readers are
+# unaffected) so the rebuilt numbers and the triggers agree once the transaction commits.
+REBUILD_SQL = [
+    "LOCK TABLE epay_users, epay_business, epay_invoices IN SHARE MODE",
+    "DELETE FROM epay_stats_invoice_daily",
+    "DELETE FROM epay_stats_counters",
+    f"""
+    INSERT INTO epay_stats_invoice_daily ("businessId", day, "invoiceCount")
+    SELECT "businessId", {INVOICE_DAY}, count(*) FROM epay_invoices GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO epay_stats_counters ("counterName", shard, value)
+    SELECT 'invoices:' || to_char(day, 'YYYY-MM-DD'), 0, sum("invoiceCount") FROM epay_stats_invoice_daily GROUP BY day
+    """,
+    """
+    INSERT INTO epay_stats_counters ("counterName", shard, value)
+    SELECT 'invoices', 0, count(*) FROM epay_invoices
+    UNION ALL SELECT 'businesses', 0, count(*) FROM epay_business
+    UNION ALL SELECT 'users', 0, count(*) FROM epay_users
+    UNION ALL SELECT 'templates:' || "templateStatus", 0, count(*) FROM epay_business
+              WHERE "templateStatus" IS NOT NULL GROUP BY "templateStatus"
+    """,
+]
+
+# Rows where the rollups disagree with a fresh aggregate: (kind, key, stored, actual)
+RECONCILE_SQL = f"""
+WITH actual_counters AS (
+    SELECT 'invoices' AS name, count(*) AS value FROM epay_invoices
+    UNION ALL SELECT 'businesses', count(*) FROM epay_business
+    UNION ALL SELECT 'users', count(*) FROM epay_users
+    UNION ALL SELECT 'templates:' || "templateStatus", count(*) FROM epay_business
+              WHERE "templateStatus" IS NOT NULL GROUP BY "templateStatus"
+    UNION ALL SELECT 'invoices:' || to_char({INVOICE_DAY}, 'YYYY-MM-DD'), count(*) FROM epay_invoices GROUP BY 1
+),
+stored_counters AS (
+    SELECT "counterName" AS name, sum(value) AS value FROM epay_stats_counters GROUP BY 1
+),
+actual_daily AS (
+    SELECT "businessId", {INVOICE_DAY} AS day, count(*) AS value FROM epay_invoices GROUP BY 1, 2
+)
+SELECT 'counter' AS kind, COALESCE(a.name, s.name) AS key, COALESCE(s.value, 0) AS stored, COALESCE(a.value, 0) AS actual
+FROM actual_counters a FULL JOIN stored_counters s ON s.name = a.name
+WHERE COALESCE(s.value, 0) <> COALESCE(a.value, 0)
+UNION ALL
+SELECT 'daily', COALESCE(a."businessId", s."businessId") || ':' || COALESCE(a.day, s.day),
+       COALESCE(s."invoiceCount", 0), COALESCE(a.value, 0)
+FROM actual_daily a FULL JOIN epay_stats_invoice_daily s ON s."businessId" = a."businessId" AND s.day = a.day
+WHERE COALESCE(s."invoiceCount", 0) <> COALESCE(a.value, 0)
+ORDER BY 1, 2
+"""
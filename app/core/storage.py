@@ -0,0 +1,294 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterable, AsyncIterator, Dict, Optional, Tuple, Union
+import httpx
+from fastapi import Depends
+from .config import settings
+from .http import get_http_client
+
+CHUNK_SIZE = 64 * 1024
+
+Body = Union[bytes, AsyncIterable[bytes]]
+
+class StorageError(Exception):
+    pass
+
+class ObjectNotFound(StorageError):
+    pass
+
+@dataclass
+class ObjectInfo:
+    key: str
+    size: Optional[int] = None
+    etag: Optional[str] = None
+    content_type: Optional[str] = None
+
+# Common interface for where templates and generated invoices live. Keys look like
+# "{businessId}/receipt_fields.pdf" or "{businessId}/invoices/{filename}".
+class StorageBackend:
+    name = "abstract"
+
+    async def head(self, key: str) -> Optional[ObjectInfo]:
+        raise NotImplementedError
+
+    async def get(self, key: str, if_none_match: Optional[str] = None) -> Tuple[ObjectInfo, Optional[bytes]]:
+        # Whole object in memory, content is None when it still matches if_none_match
+        raise NotImplementedError
+
+    def stream(self, key: str, start: Optional[int] = None, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        # Chunks of the object, or of the inclusive byte range start..end
+        raise NotImplementedError
+
+    async def put(self, key: str, body: Body, content_type: Optional[str] = None) -> ObjectInfo:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def url_for(self, key: str) -> str:
+        raise NotImplementedError
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def with_client(self, client: httpx.AsyncClient) -> "StorageBackend":
+        # Backends that talk HTTP return a copy that sends through client, the rest ignore it
+        return self
+
+def _range_header(start: Optional[int], end: Optional[int]) -> Dict[str, str]:
+    if start is None and end is None:
+        return {}
+    return {"Range": f"bytes={start or 0}-{'' if end is None else end}"}
+
+# Oracle Object Storage through a pre-authenticated request (PAR) URL
+class OCIParStorage(StorageBackend):
+    name = "oci"
+
+    def __init__(self, base_url: str, client: Optional[httpx.AsyncClient] = None):
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        # None means the shared client, looked up per call (the upload worker outlives any request)
+        self.client = client
+
+    def _client(self) -> httpx.AsyncClient:
+        return self.client or get_http_client()
+
+    def with_client(self, client: httpx.AsyncClient) -> "OCIParStorage":
+        return OCIParStorage(self.base_url, client)
+
+    def _info(self, key: str, response) -> ObjectInfo:
+        size = response.headers.get("Content-Length")
+        return ObjectInfo(
+            key=key,
+            size=int(size) if size is not None else None,
+            etag=response.headers.get("ETag"),
+            content_type=response.headers.get("Content-Type"),
+        )
+
+    async def head(self, key: str) -> Optional[ObjectInfo]:
+        response = await self._client().head(self.url_for(key))
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise StorageError(f"HEAD {key} failed: {response.status_code}")
+        return self._info(key, response)
+
+    async def get(self, key: str, if_none_match: Optional[str] = None) -> Tuple[ObjectInfo, Optional[bytes]]:
+        headers = {"If-None-Match": if_none_match} if if_none_match else {}
+        response = await self._client().get(self.url_for(key), headers=headers)
+        if response.status_code == 304:
+            return ObjectInfo(key=key, etag=if_none_match), None
+        if response.status_code == 404:
+            raise ObjectNotFound(key)
+        if response.status_code != 200:
+            raise StorageError(f"GET {key} failed: {response.status_code}")
+        return self._info(key, response), response.content
+
+    async def stream(self, key: str, start: Optional[int] = None, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        async with self._client().stream("GET", self.url_for(key), headers=_range_header(start, end)) as response:
+            if response.status_code == 404:
+                raise ObjectNotFound(key)
+            if response.status_code not in [200, 206]:
+                raise StorageError(f"GET {key} failed: {response.status_code}")
+            async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                yield chunk
+
+    async def put(self, key: str, body: Body, content_type: Optional[str] = None) -> ObjectInfo:
+        headers = {"Content-Type": content_type} if content_type else {}
+        response = await self._client().put(self.url_for(key), content=body, headers=headers)
+        if response.status_code not in [200, 201]:
+            raise StorageError(f"PUT {key} failed: {response.status_code} - {response.text}")
+        return ObjectInfo(key=key, etag=response.headers.get("ETag"), content_type=content_type)
+
+    async def delete(self, key: str) -> bool:
+        # OCI PAR URLs typically support DELETE if configured correctly
+        response = await self._client().delete(self.url_for(key))
+        if response.status_code == 404:
+            return False
+        if response.status_code not in [200, 204]:
+            raise StorageError(f"DELETE {key} failed: {response.status_code}")
+        return True
+
+    def url_for(self, key: str) -> str:
+        return f"{self.base_url}{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        if url and url.startswith(self.base_url):
+            return url[len(self.base_url):]
+        return None
+
+# Plain directory tree, for local NVMe deployments and offline benchmarks
+class LocalFileStorage(StorageBackend):
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root not in path.parents:
+            raise StorageError(f"Invalid storage key: {key}")
+        return path
+
+    def _info(self, key: str, path: Path) -> ObjectInfo:
+        stat = path.stat()
+        return ObjectInfo(
+            key=key,
+            size=stat.st_size,
+            etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            content_type=mimetypes.guess_type(path.name)[0],
+        )
+
+    async def head(self, key: str) -> Optional[ObjectInfo]:
+        path = self._path(key)
+        if not path.is_file():
+            return None
+        return self._info(key, path)
+
+    async def get(self, key: str, if_none_match: Optional[str] = None) -> Tuple[ObjectInfo, Optional[bytes]]:
+        info = await self.head(key)
+        if info is None:
+            raise ObjectNotFound(key)
+        if if_none_match and if_none_match == info.etag:
+            return info, None
+        return info, await asyncio.to_thread(self._path(key).read_bytes)
+
+    async def stream(self, key: str, start: Optional[int] = None, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        path = self._path(key)
+        if not path.is_file():
+            raise ObjectNotFound(key)
+        remaining = None if end is None else end - (start or 0) + 1
+        f = await asyncio.to_thread(open, path, "rb")
+        try:
+            if start:
+                f.seek(start)
+            while remaining is None or remaining > 0:
+                size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    async def put(self, key: str, body: Body, content_type: Optional[str] = None) -> ObjectInfo:
+        path = self._path(key)
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            if isinstance(body, (bytes, bytearray)):
+                await asyncio.to_thread(f.write, body)
+            else:
+                async for chunk in body:
+                    await asyncio.to_thread(f.write, chunk)
+        finally:
+            f.close()
+        os.replace(tmp_path, path)
+        return self._info(key, path)
+
+    async def delete(self, key: str) -> bool:
+        path = self._path(key)
+        if not path.is_file():
+            return False
+        await asyncio.to_thread(path.unlink)
+        return True
+
+    def url_for(self, key: str) -> str:
+        return self._path(key).as_uri()
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        prefix = self.root.as_uri() + "/"
+        if url and url.startswith(prefix):
+            return url[len(prefix):]
+        return None
+
+# Process local dict, for tests and benchmarks without any I/O
+class MemoryStorage(StorageBackend):
+    name = "memory"
+
+    def __init__(self):
+        self._objects: Dict[str, Tuple[bytes, Optional[str], str]] = {}
+
+    async def head(self, key: str) -> Optional[ObjectInfo]:
+        if key not in self._objects:
+            return None
+        content, content_type, etag = self._objects[key]
+        return ObjectInfo(key=key, size=len(content), etag=etag, content_type=content_type)
+
+    async def get(self, key: str, if_none_match: Optional[str] = None) -> Tuple[ObjectInfo, Optional[bytes]]:
+        info = await self.head(key)
+        if info is None:
+            raise ObjectNotFound(key)
+        if if_none_match and if_none_match == info.etag:
+            return info, None
+        return info, self._objects[key][0]
+
+    async def stream(self, key: str, start: Optional[int] = None, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        if key not in self._objects:
+            raise ObjectNotFound(key)
+        content = self._objects[key][0]
+        content = content[start or 0:None if end is None else end + 1]
+        for offset in range(0, len(content), CHUNK_SIZE):
+            yield content[offset:offset + CHUNK_SIZE]
+
+    async def put(self, key: str, body: Body, content_type: Optional[str] = None) -> ObjectInfo:
+        if isinstance(body, (bytes, bytearray)):
+            content = bytes(body)
+        else:
+            content = b"".join([chunk async for chunk in body])
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        self._objects[key] = (content, content_type, etag)
+        return ObjectInfo(key=key, size=len(content), etag=etag, content_type=content_type)
+
+    async def delete(self, key: str) -> bool:
+        return self._objects.pop(key, None) is not None
+
+    def url_for(self, key: str) -> str:
+        return f"memory://{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        if url and url.startswith("memory://"):
+            return url[len("memory://"):]
+        return None
+
+def create_storage() -> StorageBackend:
+    if settings.STORAGE_BACKEND == "oci":
+        return OCIParStorage(settings.OCI_PAR_URL)
+    if settings.STORAGE_BACKEND == "local":
+        return LocalFileStorage(settings.STORAGE_LOCAL_ROOT)
+    if settings.STORAGE_BACKEND == "memory":
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+
+storage = create_storage()
+
+def get_storage(http_client: httpx.AsyncClient = Depends(get_http_client)) -> StorageBackend:
+    # Routers get the storage backend bound to the pooled client from get_http_client, so tests
+    # can swap the client through app.dependency_overrides
+    return storage.with_client(http_client)
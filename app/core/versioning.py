@@ -0,0 +1,111 @@
+from datetime import datetime
+from typing import Any, List, Optional, Type
+from fastapi import HTTPException, Request, Response
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .conditional import etag_matches, not_modified
+
+# Row versions for conditional GETs. Versioned tables carry "updatedOn", set by a BEFORE UPDATE
+# trigger so every write path bumps it (ORM, raw SQL, upserts, the upload worker). It is strictly
+# increasing per row and left alone by updates that change nothing. A user's version also moves
+# when their roles change, the role names are part of the user response.
+#
+# models.py installs TRIGGER_SQL when tables come from Base.metadata.create_all;
+# migrations/versions/0006_row_versions.py has a frozen copy, a change here needs a new migration.
+
+VERSIONED_TABLES = [
+    "epay_users",
+    "epay_business",
+    "epay_customers",
+    "epay_invoices",
+    "epay_subscriptions",
+    "epay_subscription_payments",
+    "epay_subscription_usages",
+]
+
+TRIGGER_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION epay_touch_updated_on() RETURNS trigger AS $$
+    BEGIN
+        NEW."updatedOn" := GREATEST(clock_timestamp(), OLD."updatedOn" + interval '1 microsecond');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_touch_user_roles() RETURNS trigger AS $$
+    BEGIN
+        UPDATE epay_users SET "updatedOn" = clock_timestamp()
+        WHERE "userId" IN (SELECT "userId" FROM changed_roles);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    *[
+        f"""
+        CREATE OR REPLACE TRIGGER {table}_touch BEFORE UPDATE ON {table}
+        FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION epay_touch_updated_on()
+        """
+        for table in VERSIONED_TABLES
+    ],
+    """
+    CREATE OR REPLACE TRIGGER epay_user_roles_touch_insert AFTER INSERT ON epay_user_roles
+    REFERENCING NEW TABLE AS changed_roles FOR EACH STATEMENT EXECUTE FUNCTION epay_touch_user_roles()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_user_roles_touch_delete AFTER DELETE ON epay_user_roles
+    REFERENCING OLD TABLE AS changed_roles FOR EACH STATEMENT EXECUTE FUNCTION epay_touch_user_roles()
+    """,
+]
+
+TRIGGERS = [(f"{table}_touch", table) for table in VERSIONED_TABLES] + [
+    ("epay_user_roles_touch_insert", "epay_user_roles"),
+    ("epay_user_roles_touch_delete", "epay_user_roles"),
+]
+FUNCTIONS = ["epay_touch_updated_on()", "epay_touch_user_roles()"]
+
+# Conditional responses revalidate every time; the ETag check is what saves the work
+CACHE_CONTROL = "private, no-cache"
+
+def _micros(moment: Optional[datetime]) -> int:
+    return int(moment.timestamp() * 1_000_000) if moment else 0
+
+def version_etag(*parts: Any) -> str:
+    # Weak: it names a version of the entity, not the exact bytes
+    return 'W/"' + "-".join(str(_micros(part) if part is None or isinstance(part, datetime) else part) for part in parts) + '"'
+
+def _json(content: bytes, etag: str) -> Response:
+    return Response(content=content, media_type="application/json", headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+async def entity_response(request: Request, db: AsyncSession, model, where, schema: Type[BaseModel], not_found: str) -> Response:
+    # With If-None-Match, only the version is read first; a current copy gets a 304 without loading
+    # or serializing the row
+    table = model.__tablename__
+    headers = {"Cache-Control": CACHE_CONTROL}
+    if request.headers.get("if-none-match"):
+        version = (await db.execute(select(model.updatedOn).where(where))).first()
+        if version is None:
+            raise HTTPException(status_code=404, detail=not_found)
+        etag = version_etag(table, version[0])
+        if etag_matches(request, etag):
+            return not_modified(etag, headers)
+    row = (await db.execute(select(model).where(where))).scalars().first()
+    if row is None:
+        raise HTTPException(status_code=404, detail=not_found)
+    return _json(schema.model_validate(row).model_dump_json().encode(), version_etag(table, row.updatedOn))
+
+async def collection_response(request: Request, db: AsyncSession, model, where, order_by, schema: Type[BaseModel]) -> Response:
+    # Version of a small list: row count and newest updatedOn, so additions, deletions and edits all show
+    table = model.__tablename__
+    headers = {"Cache-Control": CACHE_CONTROL}
+    if request.headers.get("if-none-match"):
+        count, newest = (await db.execute(select(func.count(), func.max(model.updatedOn)).where(where))).one()
+        etag = version_etag(table, count, newest)
+        if etag_matches(request, etag):
+            return not_modified(etag, headers)
+    rows = (await db.execute(select(model).where(where).order_by(*order_by))).scalars().all()
+    adapter = TypeAdapter(List[schema])
+    content = adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+    newest = max((row.updatedOn for row in rows), default=None)
+    return _json(content, version_etag(table, len(rows), newest))
@@ -3,20 +3,22 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 from .core.database import get_db
 from .core.config import settings
+from .core.principals import Principal, principal_cache
 from .schemas import TokenData
-from .models import User
+from .models import User, UserRole, Role
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def _token_subject(token: str) -> str:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
@@ -25,8 +27,34 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: An
         token_data = TokenData(emailId=email)
     except JWTError:
         raise credentials_exception
-    
-    result = await db.execute(select(User).where(User.emailId == token_data.emailId))
+    return token_data.emailId
+
+async def get_current_principal(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]) -> Principal:
+    # Who is calling and with which roles, from the cache or one query (user row plus role names)
+    subject = _token_subject(token)
+    principal = principal_cache.get(subject)
+    if principal is not None:
+        return principal
+
+    generation = principal_cache.generation
+    result = await db.execute(
+        select(User.userId, User.emailId, User.isActive, func.array_remove(func.array_agg(Role.roleName), None))
+        .outerjoin(UserRole, UserRole.userId == User.userId)
+        .outerjoin(Role, Role.roleId == UserRole.roleId)
+        .where(User.emailId == subject)
+        .group_by(User.userId)
+    )
+    row = result.first()
+    if row is None:
+        raise credentials_exception
+    principal = Principal(userId=row[0], emailId=row[1], isActive=bool(row[2]), roles=tuple(row[3] or ()))
+    principal_cache.put(subject, principal, generation)
+    return principal
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Annotated[AsyncSession, Depends(get_db)]):
+    # The full ORM user, for endpoints that return or modify it. Everything else uses get_current_principal.
+    subject = _token_subject(token)
+    result = await db.execute(select(User).where(User.emailId == subject))
     user = result.scalars().first()
     if user is None:
         raise credentials_exception
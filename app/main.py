@@ -1,16 +1,33 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .core.database import engine, Base
+from .core.config import settings
+from .core.pagination import NEXT_CURSOR_HEADER
+from .core.renderer import renderer
+from .core.http import start_http_client, close_http_client
+from .core.invalidation import invalidation_listener
+from .services.uploads import upload_worker
+from .services.usage import usage_meter
 from .routers import auth, users, roles, user_roles, business_types, businesses, customers, invoices, subscriptions, pdf, admin
 from contextlib import asynccontextmanager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables on start
-    async with engine.begin() as conn:
-        # In production this should be managed by Alembic
-        await conn.run_sync(Base.metadata.create_all)
+    # Schema changes go through `alembic upgrade head`, create_all is only for scratch databases
+    if settings.DB_CREATE_TABLES:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    start_http_client()
+    renderer.start()
+    upload_worker.start()
+    invalidation_listener.start()
+    usage_meter.start()
     yield
+    await usage_meter.stop()
+    await invalidation_listener.stop()
+    await upload_worker.stop()
+    await renderer.shutdown()
+    await close_http_client()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -20,6 +37,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 app.include_router(auth.router)
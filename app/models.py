@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, UniqueConstraint, Text
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Boolean, Date, DateTime, ForeignKey, UniqueConstraint, Index, Text, LargeBinary, DDL, FetchedValue, event, text
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .core.database import Base
+from .core.rollups import TRIGGER_SQL
+from .core import versioning
 
 class User(Base):
     __tablename__ = "epay_users"
@@ -13,11 +15,16 @@ class User(Base):
     hashPassword = Column(String, nullable=False)
     algoPassword = Column(String, nullable=False)
     isActive = Column(Boolean, default=True)
-    createdOn = Column(DateTime(timezone=True), server_default=func.now())
+    createdOn = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updatedOn = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False) # Row version, see core/versioning.py
     lastLoginOn = Column(DateTime(timezone=True), server_default=func.now())
     
     roles = relationship("Role", secondary="epay_user_roles", backref="users", lazy="selectin")
 
+    __table_args__ = (
+        Index("ix_users_created", "createdOn", "userId"),
+    )
+
 class Role(Base):
     __tablename__ = "epay_roles"
 
@@ -62,9 +69,21 @@ class Business(Base):
     businessWebsite = Column(String, nullable=True)
     isActive = Column(Boolean, default=True)
     templateStatus = Column(String(20), default="MISSING") # MISSING, PENDING, ACTIVE
-    createdOn = Column(DateTime(timezone=True), server_default=func.now())
+    templateKey = Column(String, nullable=True) # Storage key of the uploaded file
+    templateMediaType = Column(String(50), nullable=True)
+    templateSize = Column(Integer, nullable=True)
+    templateHash = Column(String(64), nullable=True) # sha256 of the uploaded file
+    createdOn = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updatedOn = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False) # Row version, see core/versioning.py
     lastLoginOn = Column(DateTime(timezone=True), server_default=func.now())
 
+    __table_args__ = (
+        Index("ix_business_user", "userId"),
+        Index("ix_business_created", "createdOn", "businessId"),
+        # Only the admin review states, ACTIVE is the bulk of the table
+        Index("ix_business_template_open", "templateStatus", postgresql_where=text("\"templateStatus\" <> 'ACTIVE'")),
+    )
+
 
 class Customer(Base):
     __tablename__ = "epay_customers"
@@ -74,7 +93,16 @@ class Customer(Base):
     customerName = Column(String(100), nullable=False)
     customerPhone = Column(String, nullable=False)
     customerFullAddress = Column(String, nullable=False)
-    createdOn = Column(DateTime(timezone=True), server_default=func.now())
+    createdOn = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updatedOn = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False) # Row version, see core/versioning.py
+
+    __table_args__ = (
+        # Find-or-create key, also serves the lookup by business
+        UniqueConstraint("businessId", "customerName", "customerPhone", name="ux_customer_identity"),
+        # Keyset pagination, newest first
+        Index("ix_customers_created", "createdOn", "customerId"),
+        Index("ix_customers_business_created", "businessId", "createdOn", "customerId"),
+    )
 
 
 class Invoice(Base):
@@ -94,6 +122,28 @@ class Invoice(Base):
     billCollector = Column(String, nullable=True)
     Nazim = Column(String, nullable=True)
     pdfURL = Column(Text, nullable=True)
+    uploadStatus = Column(String(20), nullable=True) # PENDING, UPLOADED, FAILED (None when no PDF was generated)
+    createdOn = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updatedOn = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False) # Row version, see core/versioning.py
+
+    __table_args__ = (
+        Index("ix_invoices_business_date", "businessId", "invoiceDate"),
+        Index("ix_invoices_invoice_date", "invoiceDate"),
+        # Keyset pagination, newest first
+        Index("ix_invoices_created", "createdOn", "invoiceId"),
+        Index("ix_invoices_business_created", "businessId", "createdOn", "invoiceId"),
+    )
+
+class InvoiceUpload(Base):
+    __tablename__ = "epay_invoice_uploads"
+
+    invoiceUploadId = Column(Integer, primary_key=True)
+    invoiceId = Column(Integer, ForeignKey("epay_invoices.invoiceId", ondelete="CASCADE"), nullable=False, unique=True)
+    objectURL = Column(Text, nullable=False)
+    pdfData = Column(LargeBinary, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    nextAttemptOn = Column(DateTime(timezone=True), server_default=func.now(), nullable=True) # NULL once attempts are exhausted
+    lastError = Column(Text, nullable=True)
     createdOn = Column(DateTime(timezone=True), server_default=func.now())
     
 class SubscriptionPlan(Base):
@@ -105,6 +155,7 @@ class SubscriptionPlan(Base):
     subscriptionPlanPrice = Column(Integer, nullable=False)
     subscriptionPlanDuration = Column(Integer, nullable=False)
     subscriptionPlanStatus = Column(Boolean, default=True)
+    invoiceLimit = Column(Integer, nullable=True) # Invoices per calendar month (UTC), NULL = unlimited
     createdOn = Column(DateTime(timezone=True), server_default=func.now())
 
 class Subscription(Base):
@@ -118,6 +169,7 @@ class Subscription(Base):
     subscriptionEndDate = Column(DateTime(timezone=True), server_default=func.now())
     autoRenew = Column(Boolean, default=True)
     createdOn = Column(DateTime(timezone=True), server_default=func.now())
+    updatedOn = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False) # Row version, see core/versioning.py
     
 class SubscriptionPayment(Base):
     __tablename__ = "epay_subscription_payments"
@@ -130,7 +182,12 @@ class SubscriptionPayment(Base):
     paymentMode = Column(String, nullable=False)
     paymentType = Column(String, nullable=False)
     paymentPurpose = Column(String, nullable=False)
-    createdOn = Column(DateTime(timezone=True), server_default=func.now())
+    createdOn = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updatedOn = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False) # Row version, see core/versioning.py
+
+    __table_args__ = (
+        Index("ix_subscription_payments_subscription_created", "subscriptionId", "createdOn", "subscriptionPaymentId"),
+    )
 
 class SubscriptionUsage(Base):
     __tablename__ = "epay_subscription_usages"
@@ -140,7 +197,26 @@ class SubscriptionUsage(Base):
     usageMonth = Column(String(7), nullable=False)
     invoiceCount  = Column(Integer, nullable=False)
     createdOn = Column(DateTime(timezone=True), server_default=func.now())
+    updatedOn = Column(DateTime(timezone=True), server_default=func.now(), server_onupdate=FetchedValue(), nullable=False) # Row version, see core/versioning.py
     __table_args__ = (
         UniqueConstraint("subscriptionId", "usageMonth", name="ux_subscription_usage"),
     )
-   
\ No newline at end of file
+   
+# Rollups behind /admin/stats, maintained by the triggers in core/rollups.py
+class StatsCounter(Base):
+    __tablename__ = "epay_stats_counters"
+
+    counterName = Column(String(50), primary_key=True) # invoices, businesses, users, templates:<status>, invoices:<YYYY-MM-DD>
+    shard = Column(SmallInteger, primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+class InvoiceDailyStat(Base):
+    __tablename__ = "epay_stats_invoice_daily"
+
+    businessId = Column(Integer, primary_key=True) # No foreign key: written only by triggers and rebuilds
+    day = Column(Date, primary_key=True) # UTC
+    invoiceCount = Column(BigInteger, nullable=False, default=0)
+
+# Databases built with create_all get the triggers too; migrations install them in 0004 and 0006
+for statement in TRIGGER_SQL + versioning.TRIGGER_SQL:
+    event.listen(Base.metadata, "after_create", DDL(statement.replace("%", "%%")))
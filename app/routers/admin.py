@@ -1,68 +1,139 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
 from .. import models, deps
-from ..core.database import get_db
-from datetime import datetime, timedelta
+from ..core.database import get_db, get_read_db, engine_stats, replica
+from ..core.cache import template_cache, invoice_cache
+from ..core.renderer import renderer
+from ..core.http import http_stats
+from ..core.storage import storage
+from ..core.principals import Principal, principal_cache
+from ..core.reference import reference_cache
+from ..core.invalidation import invalidation_listener, invalidate_entitlements
+from ..services.uploads import upload_worker, retry_upload
+from ..services import stats as stats_service
+from ..services import usage as usage_service
+from ..services.usage import usage_meter
+from ..services.quota import quota_stats
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
+def _ensure_admin(user: Principal):
+    if not user.has_role('admin'):
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+MAX_STATS_DAYS = 3660
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+
 @router.get("/stats")
 async def get_admin_stats(
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    date_from: Optional[date] = Query(None, alias="from", description="First day of the invoice timeline (UTC), default 6 days before `to`"),
+    date_to: Optional[date] = Query(None, alias="to", description="Last day of the invoice timeline (UTC), default today"),
+    businessId: Optional[int] = Query(None, description="Timeline for one business instead of all"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # Check if user is admin
-    is_admin = any(role.roleName.lower() == 'admin' for role in current_user.roles)
-    if not is_admin:
-        raise HTTPException(status_code=403, detail="Not authorized")
+    _ensure_admin(current_user)
 
-    # Counts
-    business_count = await db.scalar(select(func.count(models.Business.businessId)))
-    invoice_count = await db.scalar(select(func.count(models.Invoice.invoiceId)))
-    pending_templates = await db.scalar(select(func.count(models.Business.businessId)).where(models.Business.templateStatus == 'PENDING'))
-    missing_templates = await db.scalar(select(func.count(models.Business.businessId)).where(models.Business.templateStatus == 'MISSING'))
-    active_templates = await db.scalar(select(func.count(models.Business.businessId)).where(models.Business.templateStatus == 'ACTIVE'))
-    user_count = await db.scalar(select(func.count(models.User.userId)))
+    # Served from the rollup tables, see core/rollups.py
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=6)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="from must not be after to")
+    if (date_to - date_from).days >= MAX_STATS_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_STATS_DAYS} days")
+    return await stats_service.read_stats(db, date_from, date_to, businessId)
 
-    # Chart Data: Invoices over last 7 days
-    today = datetime.now()
-    seven_days_ago = today - timedelta(days=6)
-    
-    invoice_stats_query = select(
-        func.date(models.Invoice.invoiceDate).label('date'),
-        func.count(models.Invoice.invoiceId).label('count')
-    ).where(
-        models.Invoice.invoiceDate >= seven_days_ago
-    ).group_by(
-        func.date(models.Invoice.invoiceDate)
-    ).order_by(
-        func.date(models.Invoice.invoiceDate)
-    )
-    
-    invoice_stats_result = await db.execute(invoice_stats_query)
-    invoice_stats = invoice_stats_result.all()
+@router.post("/stats/rebuild")
+async def rebuild_admin_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    _ensure_admin(current_user)
+    await stats_service.rebuild_stats(db)
+    await db.commit()
+    return {"message": "Stats rebuilt"}
 
-    # Fill in missing days with zero
-    invoice_chart_data = []
-    for i in range(7):
-        date = (seven_days_ago + timedelta(days=i)).date()
-        date_str = date.strftime('%Y-%m-%d')
-        count = next((row.count for row in invoice_stats if str(row.date) == date_str), 0)
-        invoice_chart_data.append({"date": date_str, "count": count})
+@router.get("/stats/reconcile")
+async def reconcile_admin_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    # Read only drift report, POST to the same path rebuilds the rollups
+    _ensure_admin(current_user)
+    drift = await stats_service.reconcile_stats(db)
+    return {"drift": drift, "fixed": False}
+
+@router.post("/stats/reconcile")
+async def fix_admin_stats(
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    # Rebuilds the rollups only when drift is found
+    _ensure_admin(current_user)
+    drift = await stats_service.reconcile_stats(db, fix=True)
+    await db.commit()
+    return {"drift": drift, "fixed": bool(drift)}
+
+@router.get("/usage/reconcile")
+async def reconcile_usage(
+    month: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="YYYY-MM, all months when omitted"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    # Read only report of counters against a recount of epay_invoices, POST to the same path repairs them
+    _ensure_admin(current_user)
+    drift = await usage_service.reconcile_usage(db, month=month)
+    return {"drift": drift, "fixed": False}
+
+@router.post("/usage/reconcile")
+async def fix_usage(
+    month: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="YYYY-MM, all months when omitted"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    # Overwrites the counters that differ with the recount, e.g. after a crash lost buffered counts
+    _ensure_admin(current_user)
+    drift = await usage_service.reconcile_usage(db, month=month, fix=True)
+    if drift:
+        await invalidate_entitlements(db)
+    await db.commit()
+    return {"drift": drift, "fixed": bool(drift)}
+
+@router.post("/uploads/{invoice_id}/retry")
+async def retry_invoice_upload(
+    invoice_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    # Invoices whose upload ran out of attempts (uploadStatus FAILED) go back on the queue
+    _ensure_admin(current_user)
+    retried = await retry_upload(db, invoice_id)
+    if retried is None:
+        raise HTTPException(status_code=404, detail="No queued upload for this invoice")
+    if not retried:
+        raise HTTPException(status_code=409, detail="Upload is still being retried")
+    await db.commit()
+    upload_worker.notify()
+    return {"message": "Upload queued"}
 
+@router.get("/metrics")
+async def get_metrics(current_user: Principal = Depends(deps.get_current_principal)):
+    _ensure_admin(current_user)
     return {
-        "businesses": business_count,
-        "invoices": invoice_count,
-        "pendingTemplates": pending_templates,
-        "missingTemplates": missing_templates,
-        "users": user_count,
-        "charts": {
-            "invoiceTimeline": invoice_chart_data,
-            "templateDistribution": [
-                {"label": "Active", "value": active_templates},
-                {"label": "Pending", "value": pending_templates},
-                {"label": "Missing", "value": missing_templates}
-            ]
-        }
+        "templateCache": template_cache.stats(),
+        "invoiceCache": invoice_cache.stats(),
+        "principalCache": principal_cache.stats(),
+        "principalInvalidation": invalidation_listener.stats(),
+        "referenceCache": reference_cache.stats(),
+        "renderer": renderer.stats(),
+        "uploads": upload_worker.stats(),
+        "usageMeter": usage_meter.stats(),
+        "quota": quota_stats.as_dict(),
+        "httpClient": http_stats(),
+        "database": engine_stats(),
+        "readReplica": replica.stats(),
+        "storageBackend": storage.name,
     }
@@ -1,17 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from .. import schemas, models, deps
 from ..core.database import get_db
+from ..core.principals import Principal
+from ..core.reference import reference_response, reference_item_response, query_loader
+from ..core.invalidation import invalidate_reference
 
 router = APIRouter(prefix="/business-types", tags=["Business Types"])
 
+# Every business type, cached once; pages and single rows are cut from it
+_all_business_types = query_loader(
+    select(models.BusinessType).order_by(models.BusinessType.businessTypeId),
+    schemas.BusinessTypeResponse,
+    "businessTypeId",
+)
+
 @router.post("/", response_model=schemas.BusinessTypeResponse)
 async def create_business_type(
     bt: schemas.BusinessTypeCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.BusinessType).where(models.BusinessType.businessTypeName == bt.businessTypeName))
     if result.scalars().first():
@@ -19,33 +29,32 @@ async def create_business_type(
     
     new_bt = models.BusinessType(**bt.model_dump())
     db.add(new_bt)
+    await invalidate_reference(db, "business_types")
     await db.commit()
     await db.refresh(new_bt)
     return new_bt
 
 @router.get("/", response_model=List[schemas.BusinessTypeResponse])
 async def list_business_types(
+    request: Request,
     skip: int = 0,
-    limit: int = 100,
-    db: AsyncSession = Depends(get_db)
+    limit: int = 100
 ):
-    result = await db.execute(select(models.BusinessType).offset(skip).limit(limit))
-    return result.scalars().all()
+    return await reference_response(request, "business_types", "all", _all_business_types, skip=skip, limit=limit)
 
 @router.get("/{bt_id}", response_model=schemas.BusinessTypeResponse)
-async def get_business_type(bt_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.BusinessType).where(models.BusinessType.businessTypeId == bt_id))
-    bt = result.scalars().first()
-    if not bt:
+async def get_business_type(bt_id: int, request: Request):
+    response = await reference_item_response(request, "business_types", "all", _all_business_types, bt_id)
+    if response is None:
         raise HTTPException(status_code=404, detail="Business type not found")
-    return bt
+    return response
 
 @router.put("/{bt_id}", response_model=schemas.BusinessTypeResponse)
 async def update_business_type(
     bt_id: int,
     bt_update: schemas.BusinessTypeCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.BusinessType).where(models.BusinessType.businessTypeId == bt_id))
     bt = result.scalars().first()
@@ -55,6 +64,7 @@ async def update_business_type(
     for key, value in bt_update.model_dump().items():
         setattr(bt, key, value)
     
+    await invalidate_reference(db, "business_types")
     await db.commit()
     await db.refresh(bt)
     return bt
@@ -63,7 +73,7 @@ async def update_business_type(
 async def delete_business_type(
     bt_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.BusinessType).where(models.BusinessType.businessTypeId == bt_id))
     bt = result.scalars().first()
@@ -71,5 +81,6 @@ async def delete_business_type(
         raise HTTPException(status_code=404, detail="Business type not found")
     
     bt.isActive = False
+    await invalidate_reference(db, "business_types")
     await db.commit()
     return {"message": "Business type deactivated"}
@@ -1,22 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List, Optional
 from .. import schemas, models, deps
-from ..core.database import get_db
+from ..core.database import get_db, get_read_db
+from ..core.pagination import PageParams, paginate
+from ..core.principals import Principal
+from ..core.reference import reference_response, query_loader
+from ..core.versioning import entity_response
+from ..core.invalidation import invalidate_reference
 
 router = APIRouter(prefix="/businesses", tags=["Businesses"])
 
 @router.get("/types/", response_model=List[schemas.BusinessTypeResponse])
-async def list_business_types(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.BusinessType).where(models.BusinessType.isActive == True))
-    return result.scalars().all()
+async def list_business_types(request: Request):
+    query = select(models.BusinessType).where(models.BusinessType.isActive == True).order_by(models.BusinessType.businessTypeId)
+    return await reference_response(request, "business_types", "active", query_loader(query, schemas.BusinessTypeResponse, "businessTypeId"))
 
 @router.post("/types/", response_model=schemas.BusinessTypeResponse)
 async def create_business_type(
     business_type: schemas.BusinessTypeCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # Check if exists
     result = await db.execute(select(models.BusinessType).where(models.BusinessType.businessTypeName == business_type.businessTypeName))
@@ -25,6 +30,7 @@ async def create_business_type(
     
     new_type = models.BusinessType(**business_type.model_dump())
     db.add(new_type)
+    await invalidate_reference(db, "business_types")
     await db.commit()
     await db.refresh(new_type)
     return new_type
@@ -33,7 +39,7 @@ async def create_business_type(
 async def create_business(
     business: schemas.BusinessCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # Check if business name exists
     result = await db.execute(select(models.Business).where(models.Business.businessName == business.businessName))
@@ -53,24 +59,20 @@ async def create_business(
 
 @router.get("/", response_model=List[schemas.BusinessResponse])
 async def list_businesses(
-    skip: int = 0,
-    limit: int = 100,
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    result = await db.execute(select(models.Business).offset(skip).limit(limit))
-    return result.scalars().all()
+    keys = (models.Business.createdOn, models.Business.businessId)
+    return await paginate(db, select(models.Business), keys, page, response, schemas.BusinessResponse)
 
 @router.get("/{business_id}", response_model=schemas.BusinessResponse)
-async def get_business(business_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
-    result = await db.execute(select(models.Business).where(models.Business.businessId == business_id))
-    business = result.scalars().first()
-    if not business:
-        raise HTTPException(status_code=404, detail="Business not found")
-    return business
+async def get_business(business_id: int, request: Request, db: AsyncSession = Depends(get_read_db), current_user: Principal = Depends(deps.get_current_principal)):
+    return await entity_response(request, db, models.Business, models.Business.businessId == business_id, schemas.BusinessResponse, "Business not found")
 
 @router.get("/user/{user_id}", response_model=List[schemas.BusinessResponse])
-async def get_user_businesses(user_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
+async def get_user_businesses(user_id: int, db: AsyncSession = Depends(get_read_db), current_user: Principal = Depends(deps.get_current_principal)):
     result = await db.execute(select(models.Business).where(models.Business.userId == user_id))
     return result.scalars().all()
 
@@ -79,7 +81,7 @@ async def update_business(
     business_id: int,
     business_update: schemas.BusinessCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.Business).where(models.Business.businessId == business_id))
     business = result.scalars().first()
@@ -101,7 +103,7 @@ async def update_business(
 async def delete_business(
     business_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.Business).where(models.Business.businessId == business_id))
     business = result.scalars().first()
@@ -1,17 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from sqlalchemy.exc import IntegrityError
+from typing import List, Literal, Optional
 from .. import schemas, models, deps
-from ..core.database import get_db
+from ..core.database import get_db, get_read_db
+from ..core.pagination import PageParams, paginate
+from ..core.principals import Principal
+from ..core.versioning import entity_response
+from ..services import imports as customer_import
+from ..services.imports import MEDIA_TYPES as IMPORT_MEDIA_TYPES
+from ..services.invoices import sqlstate
 
 router = APIRouter(prefix="/customers", tags=["Customers"])
 
+CUSTOMER_PAGE_KEYS = (models.Customer.createdOn, models.Customer.customerId)
+
+async def _commit_customer(db: AsyncSession):
+    # (businessId, customerName, customerPhone) is unique, see ux_customer_identity
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if sqlstate(e) == "23505":
+            raise HTTPException(status_code=409, detail="A customer with this name and phone already exists for this business")
+        if sqlstate(e) == "23503":
+            raise HTTPException(status_code=404, detail="Business not found")
+        raise
+
 @router.post("/", response_model=schemas.CustomerResponse)
 async def create_customer(
     customer: schemas.CustomerCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # Check if business exists
     business_result = await db.execute(select(models.Business).where(models.Business.businessId == customer.businessId))
@@ -20,47 +41,73 @@ async def create_customer(
     
     new_customer = models.Customer(**customer.model_dump())
     db.add(new_customer)
-    await db.commit()
+    await _commit_customer(db)
     await db.refresh(new_customer)
     return new_customer
 
+@router.post("/business/{business_id}/import")
+async def import_customers(
+    business_id: int,
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = Query(None, description="Defaults from Content-Type"),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    # The request body is the file itself (curl --data-binary @customers.csv -H "Content-Type: text/csv"),
+    # read as it arrives. Content-Encoding: gzip is accepted.
+    business_result = await db.execute(select(models.Business.businessId).where(models.Business.businessId == business_id))
+    if business_result.scalar() is None:
+        raise HTTPException(status_code=404, detail="Business not found")
+
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = format or IMPORT_MEDIA_TYPES.get(media_type)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson, or pass ?format=")
+    content_encoding = request.headers.get("content-encoding", "").lower()
+    if content_encoding not in ("", "identity", "gzip"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding {content_encoding}")
+
+    try:
+        return await customer_import.import_customers(db, business_id, request.stream(), fmt, gzip=content_encoding == "gzip")
+    except customer_import.ImportFailed as e:
+        # Earlier batches stay imported, re-sending the fixed file skips them
+        raise HTTPException(status_code=400, detail={"error": str(e), "report": e.report})
+
 @router.get("/", response_model=List[schemas.CustomerResponse])
 async def list_customers(
-    skip: int = 0,
-    limit: int = 100,
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    result = await db.execute(select(models.Customer).offset(skip).limit(limit))
-    return result.scalars().all()
+    return await paginate(db, select(models.Customer), CUSTOMER_PAGE_KEYS, page, response, schemas.CustomerResponse)
 
 @router.get("/{customer_id}", response_model=schemas.CustomerResponse)
 async def get_customer(
     customer_id: int, 
-    db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    request: Request,
+    db: AsyncSession = Depends(get_read_db), 
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    result = await db.execute(select(models.Customer).where(models.Customer.customerId == customer_id))
-    customer = result.scalars().first()
-    if not customer:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    return customer
+    return await entity_response(request, db, models.Customer, models.Customer.customerId == customer_id, schemas.CustomerResponse, "Customer not found")
 
 @router.get("/business/{business_id}", response_model=List[schemas.CustomerResponse])
 async def get_business_customers(
     business_id: int, 
-    db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db), 
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    result = await db.execute(select(models.Customer).where(models.Customer.businessId == business_id))
-    return result.scalars().all()
+    query = select(models.Customer).where(models.Customer.businessId == business_id)
+    return await paginate(db, query, CUSTOMER_PAGE_KEYS, page, response, schemas.CustomerResponse)
 
 @router.put("/{customer_id}", response_model=schemas.CustomerResponse)
 async def update_customer(
     customer_id: int,
     customer_update: schemas.CustomerCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.Customer).where(models.Customer.customerId == customer_id))
     customer = result.scalars().first()
@@ -70,7 +117,7 @@ async def update_customer(
     for key, value in customer_update.model_dump().items():
         setattr(customer, key, value)
     
-    await db.commit()
+    await _commit_customer(db)
     await db.refresh(customer)
     return customer
 
@@ -78,7 +125,7 @@ async def update_customer(
 async def delete_customer(
     customer_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.Customer).where(models.Customer.customerId == customer_id))
     customer = result.scalars().first()
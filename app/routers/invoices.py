@@ -1,112 +1,231 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
-import httpx
+from typing import List, Literal, Optional
+from collections import Counter
+from datetime import date
 from .. import schemas, models, deps
-from ..core.database import get_db
+from ..core.config import settings
+from ..core.database import get_db, get_read_db
+from ..core.storage import StorageBackend, StorageError, ObjectNotFound, get_storage
+from ..core.cache import invoice_cache
+from ..core.pagination import PageParams, paginate
+from ..core.conditional import accepts_encoding, bytes_response, content_etag
+from ..core.versioning import entity_response
+from ..services import invoices as invoice_service
+from ..services.usage import usage_meter
+from ..services.quota import check_quota, QuotaExceeded
+from ..services.exports import stream_invoice_export, MEDIA_TYPES as EXPORT_MEDIA_TYPES
+from ..core.principals import Principal
+from .pdf import render_saved_invoice
 
 router = APIRouter(prefix="/invoices", tags=["Invoices"])
 
+INVOICE_PAGE_KEYS = (models.Invoice.createdOn, models.Invoice.invoiceId)
+
 @router.post("/", response_model=schemas.InvoiceResponse)
 async def create_invoice(
     invoice_data: schemas.InvoiceWithCustomerCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    # Check if business exists
-    business_result = await db.execute(select(models.Business).where(models.Business.businessId == invoice_data.businessId))
-    if not business_result.scalars().first():
-        raise HTTPException(status_code=404, detail="Business not found")
-    
-    # 1. Handle Customer (Find or Create)
-    # We check if a customer with the same name and phone exists for this business
-    customer_query = await db.execute(
-        select(models.Customer).where(
-            models.Customer.businessId == invoice_data.businessId,
-            models.Customer.customerName == invoice_data.customerName,
-            models.Customer.customerPhone == invoice_data.customerPhone
-        )
-    )
-    customer = customer_query.scalars().first()
-    
-    if not customer:
-        # Create new customer
-        customer = models.Customer(
+    try:
+        await check_quota(db, invoice_data.businessId)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=402, detail=e.detail())
+
+    # Customer find-or-create and the invoice insert run as one statement
+    try:
+        new_invoice = await invoice_service.create_invoice(
+            db,
             businessId=invoice_data.businessId,
             customerName=invoice_data.customerName,
             customerPhone=invoice_data.customerPhone,
-            customerFullAddress=invoice_data.customerFullAddress
+            customerFullAddress=invoice_data.customerFullAddress,
+            invoiceNumber=invoice_data.invoiceNumber,
+            invoiceAmount=invoice_data.invoiceAmount,
+            amountInWords=invoice_data.amountInWords,
+            paymentMode=invoice_data.paymentMode,
+            paymentType=invoice_data.paymentType,
+            purpose=invoice_data.purpose,
+            pdfURL=invoice_data.pdfURL
         )
-        db.add(customer)
-        await db.commit()
-        await db.refresh(customer)
-    
-    # 2. Create Invoice
-    new_invoice = models.Invoice(
-        businessId=invoice_data.businessId,
-        customerId=customer.customerId,
-        invoiceNumber=invoice_data.invoiceNumber,
-        invoiceAmount=invoice_data.invoiceAmount,
-        amountInWords=invoice_data.amountInWords,
-        paymentMode=invoice_data.paymentMode,
-        paymentType=invoice_data.paymentType,
-        purpose=invoice_data.purpose,
-        pdfURL=invoice_data.pdfURL
-    )
-    db.add(new_invoice)
+    except invoice_service.BusinessNotFound:
+        raise HTTPException(status_code=404, detail="Business not found")
+    await usage_meter.record(db, [new_invoice])
     await db.commit()
-    await db.refresh(new_invoice)
     return new_invoice
 
+@router.post("/bulk", response_model=schemas.InvoiceBulkResponse)
+async def create_invoices_bulk(
+    bulk: schemas.InvoiceBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    # For collectors syncing receipts taken offline: one request and one commit instead of one per receipt
+    if not bulk.invoices:
+        raise HTTPException(status_code=400, detail="No invoices to create")
+    if len(bulk.invoices) > settings.INVOICE_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A bulk request can contain at most {settings.INVOICE_BULK_MAX_ITEMS} invoices")
+
+    # Quota per business for its share of the request, an over-quota business refuses the whole request
+    try:
+        for businessId, n in Counter(item.businessId for item in bulk.invoices).items():
+            await check_quota(db, businessId, n)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=402, detail=dict(e.detail(), businessId=e.entitlement.businessId))
+
+    try:
+        outcomes = await invoice_service.create_invoices(db, [item.model_dump() for item in bulk.invoices], atomic=bulk.atomic)
+    except invoice_service.BulkItemFailed as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail={"error": e.error, "index": e.index})
+    await usage_meter.record(db, [invoice for invoice, _ in outcomes if invoice is not None])
+    await db.commit()
+
+    results = [
+        schemas.InvoiceBulkResult(index=index, status="created", invoice=invoice) if invoice is not None
+        else schemas.InvoiceBulkResult(index=index, status="failed", error=error)
+        for index, (invoice, error) in enumerate(outcomes)
+    ]
+    created = sum(1 for result in results if result.status == "created")
+    return schemas.InvoiceBulkResponse(created=created, failed=len(results) - created, results=results)
+
 @router.get("/", response_model=List[schemas.InvoiceResponse])
 async def list_invoices(
-    skip: int = 0,
-    limit: int = 100,
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    result = await db.execute(select(models.Invoice).offset(skip).limit(limit))
-    return result.scalars().all()
+    return await paginate(db, select(models.Invoice), INVOICE_PAGE_KEYS, page, response, schemas.InvoiceResponse)
 
 @router.get("/{invoice_id}", response_model=schemas.InvoiceResponse)
 async def get_invoice(
     invoice_id: int, 
-    db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    request: Request,
+    db: AsyncSession = Depends(get_read_db), 
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    result = await db.execute(select(models.Invoice).where(models.Invoice.invoiceId == invoice_id))
-    invoice = result.scalars().first()
-    if not invoice:
+    return await entity_response(request, db, models.Invoice, models.Invoice.invoiceId == invoice_id, schemas.InvoiceResponse, "Invoice not found")
+
+async def _restore_invoice_pdf(storage: StorageBackend, key: str, content: bytes):
+    try:
+        await storage.put(key, content, content_type="application/pdf")
+    except Exception as e:
+        print(f"Restoring {key} failed: {str(e)}")
+
+@router.get("/{invoice_id}/pdf")
+async def get_invoice_pdf(
+    invoice_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    storage: StorageBackend = Depends(get_storage),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    result = await db.execute(
+        select(models.Invoice, models.Customer)
+        .join(models.Customer, models.Invoice.customerId == models.Customer.customerId)
+        .where(models.Invoice.invoiceId == invoice_id)
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Invoice not found")
-    return invoice
+    invoice, customer = row
+
+    key = storage.key_for_url(invoice.pdfURL) if invoice.pdfURL else None
+    filename = key.rsplit("/", 1)[-1] if key else f"invoice_{invoice.invoiceNumber}.pdf"
+    headers = {"Content-Disposition": f"inline; filename={filename}"}
+    content = etag = None
+
+    # Not uploaded yet: the outbox row holds the exact bytes that were returned at generation
+    if invoice.uploadStatus in ["PENDING", "FAILED"]:
+        pending = await db.execute(select(models.InvoiceUpload.pdfData).where(models.InvoiceUpload.invoiceId == invoice.invoiceId))
+        content = pending.scalar()
+        if content is not None:
+            etag = content_etag(content)
+
+    if content is None and key:
+        async def load(held_etag):
+            info, data = await storage.get(key, if_none_match=held_etag)
+            return data, info.etag
+        try:
+            content, etag = await invoice_cache.get_with_etag(key, load)
+        except ObjectNotFound:
+            pass
+        except StorageError as e:
+            print(f"Invoice PDF fetch failed: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to fetch invoice PDF from Cloud Storage")
+
+    if content is None:
+        # The stored file is gone: render it again from the saved fields, the DB is left untouched
+        content = await render_saved_invoice(storage, invoice, customer)
+        etag = content_etag(content)
+        if key:
+            await invoice_cache.put(key, content, etag)
+            background_tasks.add_task(_restore_invoice_pdf, storage, key, content)
+
+    return bytes_response(request, content, "application/pdf", etag=etag, headers=headers)
 
 @router.get("/business/{business_id}", response_model=List[schemas.InvoiceResponse])
 async def get_business_invoices(
     business_id: int, 
-    db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db), 
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    query = select(models.Invoice).where(models.Invoice.businessId == business_id)
+    return await paginate(db, query, INVOICE_PAGE_KEYS, page, response, schemas.InvoiceResponse)
+
+@router.get("/business/{business_id}/export")
+async def export_business_invoices(
+    business_id: int,
+    request: Request,
+    format: Literal["csv", "ndjson"] = "csv",
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    result = await db.execute(select(models.Invoice).where(models.Invoice.businessId == business_id))
-    return result.scalars().all()
+    business_result = await db.execute(select(models.Business.businessId).where(models.Business.businessId == business_id))
+    if business_result.scalar() is None:
+        raise HTTPException(status_code=404, detail="Business not found")
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    # Compressed on the fly when the client accepts it; browsers and curl --compressed unpack it transparently
+    use_gzip = accepts_encoding(request, "gzip")
+    filename = "_".join(["invoices", str(business_id), *[str(d) for d in (date_from, date_to) if d]]) + f".{format}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}", "Vary": "Accept-Encoding"}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        stream_invoice_export(business_id, format, date_from, date_to, gzip=use_gzip),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers=headers,
+    )
 
 @router.get("/user/{user_id}", response_model=List[schemas.InvoiceResponse])
 async def get_user_invoices(
     user_id: int, 
-    db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db), 
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # Join with Business table to filter invoices by user
     query = select(models.Invoice).join(models.Business).where(models.Business.userId == user_id)
-    result = await db.execute(query)
-    return result.scalars().all()
+    return await paginate(db, query, INVOICE_PAGE_KEYS, page, response, schemas.InvoiceResponse)
 
 @router.put("/{invoice_id}", response_model=schemas.InvoiceResponse)
 async def update_invoice(
     invoice_id: int,
     invoice_update: schemas.InvoiceCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.Invoice).where(models.Invoice.invoiceId == invoice_id))
     invoice = result.scalars().first()
@@ -124,21 +243,32 @@ async def update_invoice(
 async def delete_invoice(
     invoice_id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    storage: StorageBackend = Depends(get_storage),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.Invoice).where(models.Invoice.invoiceId == invoice_id))
     invoice = result.scalars().first()
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
+
+    # Hold a queued upload until the delete commits: an upload worker that already has the file
+    # in flight waits on this row and removes its object once it sees the invoice is gone
+    await db.execute(
+        select(models.InvoiceUpload.invoiceUploadId)
+        .where(models.InvoiceUpload.invoiceId == invoice_id)
+        .with_for_update()
+    )
     
     # Delete from Cloud Storage first if URL exists
     if invoice.pdfURL:
         try:
-            async with httpx.AsyncClient() as client:
-                # OCI PAR URLs typically support DELETE if configured correctly
-                del_response = await client.delete(invoice.pdfURL)
-                if del_response.status_code not in [200, 204]:
-                    print(f"Cloud Delete failed for {invoice.pdfURL}: {del_response.status_code}")
+            key = storage.key_for_url(invoice.pdfURL)
+            if key is None:
+                print(f"Cloud Delete skipped, {invoice.pdfURL} is not in the configured storage")
+            else:
+                invoice_cache.invalidate(key)
+                if not await storage.delete(key):
+                    print(f"Cloud Delete failed for {invoice.pdfURL}: not found")
         except Exception as e:
             print(f"Error deleting from cloud: {str(e)}")
 
@@ -1,24 +1,126 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Response
-import os
-import fitz # PyMuPDF
-import httpx
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Response, Request
+from fastapi.responses import StreamingResponse
+import asyncio
 from .. import schemas, models, deps
 from ..core import database
+from ..core.cache import template_cache
+from ..core import pdf_template
+from ..core.renderer import renderer, RenderQueueFull
+from ..core.pdf_bundle import stream_zip, stream_merged_pdf
+from ..core.config import settings
+from ..core.storage import StorageBackend, StorageError, ObjectNotFound, get_storage
+from ..core.conditional import stream_object_response
+from ..services.uploads import enqueue_upload, upload_worker
+from ..services.usage import usage_meter
+from ..services.quota import check_quota, QuotaExceeded
+from ..services import invoices as invoice_service
+from ..core.principals import Principal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-import io
-from typing import List
+import hashlib
+from typing import List, Tuple
 
 router = APIRouter(prefix="/pdf", tags=["PDF"])
 
-OCI_PAR_URL = "https://objectstorage.ap-mumbai-1.oraclecloud.com/p/IBDUyhhzwHNkcqt2_NvHqebRPyaN2tVfZuaqKpilDa0foleXa2TAU2xaiukX3NTB/n/bm3luqkdqbty/b/testing/o/"
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+async def _get_cached_template(storage: StorageBackend, businessId: int, filename: str) -> bytes:
+    key = f"{businessId}/{filename}"
+
+    async def load(etag):
+        try:
+            info, content = await storage.get(key, if_none_match=etag)
+        except ObjectNotFound:
+            raise HTTPException(status_code=404, detail=f"Template not found on Cloud Storage for business {businessId}")
+        return content, info.etag
+
+    return await template_cache.get(key, load)
+
+def _invoice_filename(data: schemas.InvoicePDFData) -> str:
+    safe_date = data.invoiceDate.replace("/", "-").replace("\\", "-")
+    return f"invoice_{data.invoiceNumber}_{safe_date}.pdf"
+
+def _saved_invoice_values(invoice: models.Invoice, customer: models.Customer) -> dict:
+    # The typed invoice date is only kept in the stored filename, invoiceDate is the fallback
+    invoice_date = invoice.invoiceDate.strftime("%d/%m/%Y") if invoice.invoiceDate else ""
+    filename = (invoice.pdfURL or "").rsplit("/", 1)[-1]
+    prefix = f"invoice_{invoice.invoiceNumber}_"
+    if filename.startswith(prefix) and filename.endswith(".pdf"):
+        invoice_date = filename[len(prefix):-len(".pdf")]
+    return {
+        "businessId": invoice.businessId,
+        "invoiceNumber": invoice.invoiceNumber,
+        "BookNo": invoice.BookNo,
+        "invoiceDate": invoice_date,
+        "CustomerName": customer.customerName,
+        "amountinwords": invoice.amountInWords,
+        "invoiceAmount": invoice.invoiceAmount,
+        "purpose": invoice.purpose,
+        "billCollector": invoice.billCollector,
+        "Nazim": invoice.Nazim,
+        "customerFullAddress": customer.customerFullAddress,
+        "customerPhone": customer.customerPhone,
+        "paymentMode": invoice.paymentMode,
+        "paymentType": invoice.paymentType,
+    }
+
+def _renderer_busy():
+    return HTTPException(status_code=503, detail="PDF renderer is busy, please retry", headers={"Retry-After": "1"})
+
+async def _put_object(storage: StorageBackend, key: str, body, content_type: str = None):
+    try:
+        return await storage.put(key, body, content_type=content_type)
+    except StorageError as e:
+        print(f"Storage Upload Failed: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to upload to Cloud Storage")
+
+async def _iter_upload(file: UploadFile, digest=None):
+    # Optionally hashes the chunks on the way through so the upload is read only once
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if digest is not None:
+            digest.update(chunk)
+        yield chunk
+
+async def _get_compiled_template(storage: StorageBackend, businessId: int):
+    try:
+        layout_content = await _get_cached_template(storage, businessId, pdf_template.LAYOUT_FILENAME)
+        base_content = await _get_cached_template(storage, businessId, pdf_template.BASE_FILENAME)
+        return base_content, pdf_template.load_layout(layout_content)
+    except HTTPException as e:
+        if e.status_code != 404:
+            raise e
+
+    # Templates uploaded before layouts existed: compile once and store the result
+    template_content = await _get_cached_template(storage, businessId, pdf_template.TEMPLATE_FILENAME)
+    base_content, fields = await renderer.run(pdf_template.compile_template, template_content)
+    try:
+        await _put_object(storage, f"{businessId}/{pdf_template.BASE_FILENAME}", base_content, "application/pdf")
+        await _put_object(storage, f"{businessId}/{pdf_template.LAYOUT_FILENAME}", pdf_template.dump_layout(fields), "application/json")
+        template_cache.invalidate(f"{businessId}/")
+    except HTTPException:
+        print(f"Could not store compiled template for business {businessId}")
+    return base_content, fields
+
+async def render_saved_invoice(storage: StorageBackend, invoice: models.Invoice, customer: models.Customer) -> bytes:
+    # Re-renders an existing invoice from its saved fields, used when the stored PDF is gone
+    try:
+        base_content, fields = await _get_compiled_template(storage, invoice.businessId)
+        return await renderer.run(pdf_template.render_invoice, base_content, fields, _saved_invoice_values(invoice, customer))
+    except RenderQueueFull:
+        raise _renderer_busy()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="PDF rendering timed out")
 
 @router.post("/upload-template/{businessId}")
 async def upload_template(
     businessId: int,
     file: UploadFile = File(...),
     db: AsyncSession = Depends(database.get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    storage: StorageBackend = Depends(get_storage),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # 1. Verify business exists
     business_result = await db.execute(select(models.Business).where(models.Business.businessId == businessId))
@@ -33,23 +135,49 @@ async def upload_template(
     if not is_pdf and not is_image:
         raise HTTPException(status_code=400, detail="Only PDF or Image (JPG, PNG) files are allowed")
 
-    # 2. Upload to Oracle Object Storage
+    # 2. Upload to object storage
     try:
-        file_content = await file.read()
-        filename = "receipt_fields.pdf" if is_pdf else f"raw_template.{file_ext}"
-        oci_upload_url = f"{OCI_PAR_URL}{businessId}/{filename}"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.put(oci_upload_url, content=file_content)
-            if response.status_code not in [200, 201]:
-                print(f"OCI Upload Failed: {response.status_code} - {response.text}")
-                raise HTTPException(status_code=500, detail="Failed to upload to Cloud Storage")
-        
+        if is_pdf:
+            file_content = await file.read()
+
+            # Parse ACTIVE templates once so renders skip widget discovery
+            try:
+                base_content, fields = await renderer.run(pdf_template.compile_template, file_content)
+            except RenderQueueFull:
+                raise _renderer_busy()
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Invalid PDF template: {str(e)}")
+
+            template_key = f"{businessId}/{pdf_template.TEMPLATE_FILENAME}"
+            media_type = "application/pdf"
+            await _put_object(storage, template_key, file_content, media_type)
+            await _put_object(storage, f"{businessId}/{pdf_template.BASE_FILENAME}", base_content, "application/pdf")
+            await _put_object(storage, f"{businessId}/{pdf_template.LAYOUT_FILENAME}", pdf_template.dump_layout(fields), "application/json")
+            template_size = len(file_content)
+            template_hash = hashlib.sha256(file_content).hexdigest()
+        else:
+            # Raw images are only stored for admin review, stream them straight through
+            template_key = f"{businessId}/raw_template.{file_ext}"
+            media_type = f"image/{file_ext if file_ext != 'jpg' else 'jpeg'}"
+            digest = hashlib.sha256()
+            info = await _put_object(storage, template_key, _iter_upload(file, digest), media_type)
+            template_size = info.size if info.size is not None else file.size
+            template_hash = digest.hexdigest()
+
+        # Drop any cached copy so the next render picks up the new file
+        template_cache.invalidate(f"{businessId}/")
+
         # 3. Update Business Status
         business.templateStatus = "ACTIVE" if is_pdf else "PENDING"
+        # Remember exactly what was stored so downloads need a single storage request
+        business.templateKey = template_key
+        business.templateMediaType = media_type
+        business.templateSize = template_size
+        business.templateHash = template_hash
         await db.commit()
 
     except Exception as e:
+        if isinstance(e, HTTPException): raise e
         print(f"Upload Error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
 
@@ -62,8 +190,10 @@ async def upload_template(
 @router.get("/template/{businessId}")
 async def get_template(
     businessId: int,
+    request: Request,
     db: AsyncSession = Depends(database.get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    storage: StorageBackend = Depends(get_storage),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # 1. Verify business exists and check status
     business_result = await db.execute(select(models.Business).where(models.Business.businessId == businessId))
@@ -74,91 +204,104 @@ async def get_template(
     if business.templateStatus == "MISSING":
         raise HTTPException(status_code=404, detail="No template has been uploaded for this business yet")
 
-    # 2. Determine filename and media type based on status
-    target_filename = "receipt_fields.pdf"
-    media_type = "application/pdf"
-    
-    if business.templateStatus == "PENDING":
-        # Try to find the raw image. We'll check common extensions.
-        # Note: In a production environment, you might store the exact extension in the DB.
-        found = False
-        for ext in ["jpg", "jpeg", "png"]:
-            oci_check_url = f"{OCI_PAR_URL}{businessId}/raw_template.{ext}"
-            async with httpx.AsyncClient() as client:
-                response = await client.get(oci_check_url)
-                if response.status_code == 200:
-                    target_filename = f"raw_template.{ext}"
-                    media_type = f"image/{ext if ext != 'jpg' else 'jpeg'}"
-                    content = response.content
-                    found = True
-                    break
-        if not found:
-            raise HTTPException(status_code=404, detail="Pending template file not found on Cloud Storage")
-    else:
-        # ACTIVE status
-        oci_download_url = f"{OCI_PAR_URL}{businessId}/{target_filename}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(oci_download_url)
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail=f"Active template PDF not found on Cloud Storage")
-            content = response.content
-
-    # 3. Return the file
-    return Response(
-        content=content,
-        media_type=media_type,
-        headers={
-            "Content-Disposition": f"inline; filename={target_filename}"
-        }
+    # 2. Businesses uploaded before the metadata columns existed are located and hashed once and backfilled
+    if not business.templateKey:
+        candidates = [(pdf_template.TEMPLATE_FILENAME, "application/pdf")]
+        if business.templateStatus == "PENDING":
+            candidates = [(f"raw_template.{ext}", f"image/{ext if ext != 'jpg' else 'jpeg'}") for ext in ["jpg", "jpeg", "png"]]
+        info = None
+        for filename, media_type in candidates:
+            info = await storage.head(f"{businessId}/{filename}")
+            if info:
+                break
+        if not info:
+            raise HTTPException(status_code=404, detail="Template file not found on Cloud Storage")
+        business.templateKey = info.key
+        business.templateMediaType = media_type
+        business.templateSize = info.size
+    if not business.templateHash:
+        # Same sha256 an upload records, so these businesses get ETags and 304s from now on
+        digest = hashlib.sha256()
+        try:
+            async for chunk in storage.stream(business.templateKey):
+                digest.update(chunk)
+        except ObjectNotFound:
+            raise HTTPException(status_code=404, detail="Template file not found on Cloud Storage")
+        business.templateHash = digest.hexdigest()
+        await db.commit()
+    etag = f'"{business.templateHash}"'
+
+    # 3. Stream the file, honouring If-None-Match and Range
+    filename = business.templateKey.rsplit("/", 1)[-1]
+    return await stream_object_response(
+        request,
+        storage,
+        business.templateKey,
+        media_type=business.templateMediaType or "application/octet-stream",
+        size=business.templateSize,
+        etag=etag,
+        headers={"Content-Disposition": f"inline; filename={filename}"},
     )
 
 @router.post("/generate-invoice")
 async def generate_invoice_pdf(
     data: schemas.InvoicePDFData, 
     db: AsyncSession = Depends(database.get_db),
-    current_user: models.User = Depends(deps.get_current_user)
+    storage: StorageBackend = Depends(get_storage),
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # 1. Database Operations
     # Verify business exists
-    business_result = await db.execute(select(models.Business).where(models.Business.businessId == data.businessId))
-    business = business_result.scalars().first()
-    if not business:
+    template_status = await db.scalar(select(models.Business.templateStatus).where(models.Business.businessId == data.businessId))
+    if template_status is None:
         raise HTTPException(status_code=404, detail="Business not found")
     
     # Check template status
-    if business.templateStatus != "ACTIVE":
+    if template_status != "ACTIVE":
          raise HTTPException(status_code=400, detail="Business template is not active. Please wait for admin approval if you uploaded an image.")
 
-    # Handle Customer (Find or Create)
-    customer_query = await db.execute(
-        select(models.Customer).where(
-            models.Customer.businessId == data.businessId,
-            models.Customer.customerName == data.CustomerName,
-            models.Customer.customerPhone == data.customerPhone
-        )
-    )
-    customer = customer_query.scalars().first()
-
-    if not customer:
-        customer = models.Customer(
-            businessId=data.businessId,
-            customerName=data.CustomerName,
-            customerPhone=data.customerPhone,
-            customerFullAddress=data.customerFullAddress
-        )
-        db.add(customer)
-        await db.commit()
-        await db.refresh(customer)
+    # Plan quota before any rendering work
+    try:
+        await check_quota(db, data.businessId)
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=402, detail=e.detail())
 
     # Define cloud storage path for the generated invoice
-    safe_date = data.invoiceDate.replace("/", "-").replace("\\", "-")
-    invoice_filename = f"invoice_{data.invoiceNumber}_{safe_date}.pdf"
-    cloud_invoice_url = f"{OCI_PAR_URL}{data.businessId}/invoices/{invoice_filename}"
+    invoice_filename = _invoice_filename(data)
+    cloud_invoice_url = storage.url_for(f"{data.businessId}/invoices/{invoice_filename}")
+
+    # 2. PDF Generation
+    # Fetch the precompiled template through the cache, only revalidating with storage when the entry is stale
+    try:
+        base_content, fields = await _get_compiled_template(storage, data.businessId)
+    except RenderQueueFull:
+        raise _renderer_busy()
+    except Exception as e:
+        if isinstance(e, HTTPException): raise e
+        raise HTTPException(status_code=500, detail=f"Error fetching template from Cloud: {str(e)}")
+    
+    try:
+        # Stamp the values at the recorded field positions of the widget-free base page.
+        # This runs in the render pool so a slow template doesn't block the event loop.
+        pdf_bytes = await renderer.run(pdf_template.render_invoice, base_content, fields, data.model_dump())
+    except RenderQueueFull:
+        raise _renderer_busy()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="PDF rendering timed out")
+    except Exception as e:
+        import traceback
+        print(f"PDF Error: {str(e)}")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
-    # Save Invoice
-    new_invoice = models.Invoice(
+    # 3. Save the invoice (customer find-or-create in the same statement) and queue the
+    # generated file for upload in one transaction; the background worker retries until it lands
+    new_invoice = await invoice_service.create_invoice(
+        db,
         businessId=data.businessId,
-        customerId=customer.customerId,
+        customerName=data.CustomerName,
+        customerPhone=data.customerPhone,
+        customerFullAddress=data.customerFullAddress,
         invoiceNumber=data.invoiceNumber,
         BookNo=data.BookNo,
         invoiceAmount=data.invoiceAmount,
@@ -168,80 +311,165 @@ async def generate_invoice_pdf(
         purpose=data.purpose,
         billCollector=data.billCollector,
         Nazim=data.Nazim,
-        pdfURL=cloud_invoice_url
+        pdfURL=cloud_invoice_url,
+        uploadStatus="PENDING"
     )
-    db.add(new_invoice)
+    enqueue_upload(db, new_invoice.invoiceId, cloud_invoice_url, pdf_bytes)
+    await usage_meter.record(db, [new_invoice])
     await db.commit()
-    await db.refresh(new_invoice)
+    upload_worker.notify()
 
-    # 2. PDF Generation
-    # Fetch template directly from OCI into memory
+    # Return the PDF directly from memory
+    return Response(
+        content=pdf_bytes,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename={invoice_filename}"
+        }
+    )
+
+async def _render_chunk(base_content: bytes, fields, items: List[schemas.InvoicePDFData]) -> List[bytes]:
+    # Renders one chunk of a batch, a small window at a time so one batch doesn't fill the pool;
+    # a full pool or a slow render fails the chunk before any of it is saved
+    window = asyncio.Semaphore(max(1, min(renderer.workers * 2, renderer.max_queue)))
+
+    async def render(values: dict) -> bytes:
+        async with window:
+            return await renderer.run(
+                pdf_template.render_invoice, base_content, fields, values,
+                wait_seconds=settings.PDF_BATCH_QUEUE_WAIT_SECONDS,
+            )
+
+    tasks = [asyncio.ensure_future(render(item.model_dump())) for item in items]
     try:
-        oci_download_url = f"{OCI_PAR_URL}{data.businessId}/receipt_fields.pdf"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(oci_download_url)
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail=f"Template not found on Cloud Storage for business {data.businessId}")
-            template_content = response.content
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _save_chunk(
+    db: AsyncSession,
+    storage: StorageBackend,
+    businessId: int,
+    items: List[schemas.InvoicePDFData],
+    rendered: List[bytes],
+) -> List[Tuple[str, bytes]]:
+    # Customers, invoices and their upload outbox rows for one chunk in a single transaction,
+    # customers in one upsert. Returns (filename, pdf) pairs ready to send.
+    customers = await invoice_service.upsert_customers(
+        db,
+        businessId,
+        [(item.CustomerName, item.customerPhone, item.customerFullAddress) for item in items]
+    )
+
+    jobs = []
+    for item, pdf_bytes in zip(items, rendered):
+        invoice_filename = _invoice_filename(item)
+        cloud_invoice_url = storage.url_for(f"{businessId}/invoices/{invoice_filename}")
+        new_invoice = models.Invoice(
+            businessId=businessId,
+            customerId=customers[(item.CustomerName, item.customerPhone)],
+            invoiceNumber=item.invoiceNumber,
+            BookNo=item.BookNo,
+            invoiceAmount=item.invoiceAmount,
+            amountInWords=item.amountinwords,
+            paymentMode=item.paymentMode,
+            paymentType=item.paymentType,
+            purpose=item.purpose,
+            billCollector=item.billCollector,
+            Nazim=item.Nazim,
+            pdfURL=cloud_invoice_url,
+            uploadStatus="PENDING"
+        )
+        db.add(new_invoice)
+        jobs.append((invoice_filename, cloud_invoice_url, new_invoice, pdf_bytes))
+    await db.flush()
+    for _, cloud_invoice_url, new_invoice, pdf_bytes in jobs:
+        enqueue_upload(db, new_invoice.invoiceId, cloud_invoice_url, pdf_bytes)
+    await usage_meter.record(db, [job[2] for job in jobs])
+    await db.commit()
+    upload_worker.notify()
+    return [(invoice_filename, pdf_bytes) for invoice_filename, _, _, pdf_bytes in jobs]
+
+@router.post("/generate-invoices/batch")
+async def generate_invoices_batch(
+    batch: schemas.InvoicePDFBatch,
+    db: AsyncSession = Depends(database.get_db),
+    storage: StorageBackend = Depends(get_storage),
+    current_user: Principal = Depends(deps.get_current_principal)
+):
+    if not batch.invoices:
+        raise HTTPException(status_code=400, detail="No invoices to generate")
+    if len(batch.invoices) > settings.PDF_BATCH_MAX_INVOICES:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {settings.PDF_BATCH_MAX_INVOICES} invoices")
+    if any(item.businessId != batch.businessId for item in batch.invoices):
+        raise HTTPException(status_code=400, detail="All invoices in a batch must belong to the same business")
+
+    # 1. Verify business and template once for the whole batch
+    business_result = await db.execute(select(models.Business).where(models.Business.businessId == batch.businessId))
+    business = business_result.scalars().first()
+    if not business:
+        raise HTTPException(status_code=404, detail="Business not found")
+    if business.templateStatus != "ACTIVE":
+        raise HTTPException(status_code=400, detail="Business template is not active. Please wait for admin approval if you uploaded an image.")
+    try:
+        await check_quota(db, batch.businessId, len(batch.invoices))
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=402, detail=e.detail())
+
+    try:
+        base_content, fields = await _get_compiled_template(storage, batch.businessId)
+    except RenderQueueFull:
+        raise _renderer_busy()
     except Exception as e:
         if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=f"Error fetching template from Cloud: {str(e)}")
-    
+
+    # 2. Render, save and send PDF_BATCH_CHUNK_SIZE invoices at a time. Each chunk is committed with
+    # its upload outbox rows before it is sent, so the stream only delivers saved invoices and only
+    # one chunk of PDFs is held at a time. The first chunk runs before the response starts, so a
+    # busy or failing renderer still gets a proper status; a later failure ends the stream early
+    # with the chunks sent so far saved.
+    chunk_size = max(1, settings.PDF_BATCH_CHUNK_SIZE)
+    chunks = [batch.invoices[offset:offset + chunk_size] for offset in range(0, len(batch.invoices), chunk_size)]
     try:
-        # Open PDF from memory stream
-        doc = fitz.open(stream=template_content, filetype="pdf")
-        page = doc.load_page(0)
-        
-        # Map pydantic data to a dictionary
-        raw_data = data.model_dump()
-        
-        # Fill form fields by inserting text at widget locations and then deleting widgets
-        for widget in page.widgets():
-            field_name = widget.field_name
-            if field_name in raw_data and raw_data[field_name] is not None:
-                text_value = str(raw_data[field_name])
-                
-                # Get widget properties
-                rect = widget.rect
-                
-                # Insert text directly onto the page at the widget's location
-                point = (rect.x0, rect.y1 - 3)
-                
-                page.insert_text(
-                    point, 
-                    text_value, 
-                    fontname="hebo", # Helvetica Bold
-                    fontsize=12,
-                    color=(0, 0, 0) # Black text
-                )
-            
-            # Delete the widget so the box is gone
-            page.delete_widget(widget)
-        
-        # Get the final PDF content in memory
-        pdf_bytes = doc.write()
-        doc.close()
-
-        # 3. Upload generated invoice to Cloud Storage
-        try:
-            async with httpx.AsyncClient() as client:
-                upload_response = await client.put(cloud_invoice_url, content=pdf_bytes)
-                if upload_response.status_code not in [200, 201]:
-                    print(f"Cloud Invoice Upload Failed: {upload_response.status_code} - {upload_response.text}")
-        except Exception as e:
-            print(f"Cloud Invoice Upload Error: {str(e)}")
-
-        # Return the PDF directly from memory
-        return Response(
-            content=pdf_bytes,
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f"attachment; filename={invoice_filename}"
-            }
-        )
-        
+        rendered = await _render_chunk(base_content, fields, chunks[0])
+    except RenderQueueFull:
+        raise _renderer_busy()
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="PDF rendering timed out")
     except Exception as e:
-        import traceback
         print(f"PDF Error: {str(e)}")
-        print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
+    ready = await _save_chunk(db, storage, batch.businessId, chunks[0], rendered)
+    del rendered
+
+    async def documents():
+        # Popping drops each PDF as soon as it is handed to the archive
+        while ready:
+            yield ready.pop(0)
+        if len(chunks) == 1:
+            return
+        async with database.AsyncSessionLocal() as session:
+            for items in chunks[1:]:
+                try:
+                    rendered = await _render_chunk(base_content, fields, items)
+                except Exception as e:
+                    print(f"PDF Error: batch for business {batch.businessId} stopped: {str(e) or type(e).__name__}")
+                    raise
+                ready.extend(await _save_chunk(session, storage, batch.businessId, items, rendered))
+                del rendered
+                while ready:
+                    yield ready.pop(0)
+
+    if batch.output == "pdf":
+        return StreamingResponse(
+            stream_merged_pdf(documents(), flush_every=chunk_size),
+            media_type="application/pdf",
+            headers={"Content-Disposition": f"attachment; filename=invoices_{batch.businessId}.pdf"}
+        )
+    return StreamingResponse(
+        stream_zip(documents()),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=invoices_{batch.businessId}.zip"}
+    )
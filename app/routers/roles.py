@@ -1,14 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from .. import schemas, models, deps
 from ..core.database import get_db
+from ..core.principals import Principal
+from ..core.invalidation import invalidate_principals, invalidate_reference
+from ..core.reference import reference_response, reference_item_response, query_loader
 
 router = APIRouter(prefix="/roles", tags=["Roles"])
 
+# Every role, cached once; pages and single rows are cut from it
+_all_roles = query_loader(select(models.Role).order_by(models.Role.roleId), schemas.RoleResponse, "roleId")
+
 @router.post("/", response_model=schemas.RoleResponse)
-async def create_role(role: schemas.RoleCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
+async def create_role(role: schemas.RoleCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(deps.get_current_principal)):
     # Check if role exists
     result = await db.execute(select(models.Role).where(models.Role.roleName == role.roleName))
     existing_role = result.scalars().first()
@@ -17,29 +23,31 @@ async def create_role(role: schemas.RoleCreate, db: AsyncSession = Depends(get_d
     
     new_role = models.Role(roleName=role.roleName)
     db.add(new_role)
+    await invalidate_reference(db, "roles")
     await db.commit()
     await db.refresh(new_role)
     return new_role
 
 @router.get("/", response_model=List[schemas.RoleResponse])
-async def read_roles(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
-    result = await db.execute(select(models.Role).offset(skip).limit(limit))
-    return result.scalars().all()
+async def read_roles(request: Request, skip: int = 0, limit: int = 100, current_user: Principal = Depends(deps.get_current_principal)):
+    return await reference_response(request, "roles", "all", _all_roles, public=False, skip=skip, limit=limit)
 
 @router.get("/{role_id}", response_model=schemas.RoleResponse)
-async def read_role(role_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
-    result = await db.execute(select(models.Role).where(models.Role.roleId == role_id))
-    role = result.scalars().first()
-    if not role:
+async def read_role(role_id: int, request: Request, current_user: Principal = Depends(deps.get_current_principal)):
+    response = await reference_item_response(request, "roles", "all", _all_roles, role_id, public=False)
+    if response is None:
         raise HTTPException(status_code=404, detail="Role not found")
-    return role
+    return response
 
 @router.delete("/{role_id}")
-async def delete_role(role_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
+async def delete_role(role_id: int, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(deps.get_current_principal)):
     result = await db.execute(select(models.Role).where(models.Role.roleId == role_id))
     role = result.scalars().first()
     if not role:
         raise HTTPException(status_code=404, detail="Role not found")
     await db.delete(role)
+    # Role names are cached on every principal holding it
+    await invalidate_principals(db)
+    await invalidate_reference(db, "roles")
     await db.commit()
     return {"message": "Role deleted"}
@@ -1,32 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from .. import schemas, models, deps
-from ..core.database import get_db
+from ..core.database import get_db, get_read_db
+from ..core.pagination import PageParams, paginate
+from ..core.principals import Principal
+from ..core.invalidation import invalidate_entitlements, invalidate_reference
+from ..core.reference import reference_response, query_loader
+from ..core.versioning import collection_response
+from ..services.usage import set_usage
 
 router = APIRouter(prefix="/subscriptions", tags=["Subscriptions"])
 
 # --- Subscription Plans ---
 @router.post("/plans", response_model=schemas.SubscriptionPlanResponse)
-async def create_plan(plan: schemas.SubscriptionPlanCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
+async def create_plan(plan: schemas.SubscriptionPlanCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(deps.get_current_principal)):
     new_plan = models.SubscriptionPlan(**plan.model_dump())
     db.add(new_plan)
+    await invalidate_reference(db, "plans")
     await db.commit()
     await db.refresh(new_plan)
     return new_plan
 
 @router.get("/plans", response_model=List[schemas.SubscriptionPlanResponse])
-async def list_plans(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.SubscriptionPlan).where(models.SubscriptionPlan.subscriptionPlanStatus == True))
-    return result.scalars().all()
+async def list_plans(request: Request):
+    query = select(models.SubscriptionPlan).where(models.SubscriptionPlan.subscriptionPlanStatus == True).order_by(models.SubscriptionPlan.subscriptionPlanId)
+    return await reference_response(request, "plans", "active", query_loader(query, schemas.SubscriptionPlanResponse, "subscriptionPlanId"))
 
 @router.put("/plans/{plan_id}", response_model=schemas.SubscriptionPlanResponse)
 async def update_plan(
     plan_id: int, 
     plan_update: schemas.SubscriptionPlanUpdate, 
     db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.SubscriptionPlan).where(models.SubscriptionPlan.subscriptionPlanId == plan_id))
     plan = result.scalars().first()
@@ -37,13 +44,16 @@ async def update_plan(
     for key, value in update_data.items():
         setattr(plan, key, value)
     
+    # Every business on the plan is affected, plan changes are rare enough to drop them all
+    await invalidate_entitlements(db)
+    await invalidate_reference(db, "plans")
     await db.commit()
     await db.refresh(plan)
     return plan
 
 # --- Subscriptions ---
 @router.post("/", response_model=schemas.SubscriptionResponse)
-async def create_subscription(sub: schemas.SubscriptionCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
+async def create_subscription(sub: schemas.SubscriptionCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(deps.get_current_principal)):
     # Verify business and plan exist
     bus = await db.execute(select(models.Business).where(models.Business.businessId == sub.businessId))
     if not bus.scalars().first():
@@ -60,21 +70,24 @@ async def create_subscription(sub: schemas.SubscriptionCreate, db: AsyncSession
 
     new_sub = models.Subscription(**sub.model_dump())
     db.add(new_sub)
+    await invalidate_entitlements(db, sub.businessId)
     await db.commit()
     await db.refresh(new_sub)
     return new_sub
 
 @router.get("/business/{business_id}", response_model=List[schemas.SubscriptionResponse])
-async def get_business_subscriptions(business_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
-    result = await db.execute(select(models.Subscription).where(models.Subscription.businessId == business_id))
-    return result.scalars().all()
+async def get_business_subscriptions(business_id: int, request: Request, db: AsyncSession = Depends(get_read_db), current_user: Principal = Depends(deps.get_current_principal)):
+    return await collection_response(
+        request, db, models.Subscription, models.Subscription.businessId == business_id,
+        (models.Subscription.subscriptionId,), schemas.SubscriptionResponse,
+    )
 
 @router.put("/{sub_id}", response_model=schemas.SubscriptionResponse)
 async def update_subscription(
     sub_id: int, 
     sub_update: schemas.SubscriptionUpdate, 
     db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.Subscription).where(models.Subscription.subscriptionId == sub_id))
     sub = result.scalars().first()
@@ -89,37 +102,44 @@ async def update_subscription(
         if not plan_check.scalars().first():
             raise HTTPException(status_code=404, detail="New subscription plan not found")
 
+    previous_business = sub.businessId
     for key, value in update_data.items():
         setattr(sub, key, value)
     
+    await invalidate_entitlements(db, previous_business)
+    if sub.businessId != previous_business:
+        await invalidate_entitlements(db, sub.businessId)
     await db.commit()
     await db.refresh(sub)
     return sub
 
 # --- Payments ---
 @router.post("/payments", response_model=schemas.SubscriptionPaymentResponse)
-async def create_payment(payment: schemas.SubscriptionPaymentCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
+async def create_payment(payment: schemas.SubscriptionPaymentCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(deps.get_current_principal)):
     sub = await db.execute(select(models.Subscription).where(models.Subscription.subscriptionId == payment.subscriptionId))
-    if not sub.scalars().first():
+    subscription = sub.scalars().first()
+    if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
 
     new_payment = models.SubscriptionPayment(**payment.model_dump())
     db.add(new_payment)
+    await invalidate_entitlements(db, subscription.businessId)
     await db.commit()
     await db.refresh(new_payment)
     return new_payment
 
 @router.get("/payments/subscription/{subscription_id}", response_model=List[schemas.SubscriptionPaymentResponse])
-async def list_payments(subscription_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
-    result = await db.execute(select(models.SubscriptionPayment).where(models.SubscriptionPayment.subscriptionId == subscription_id))
-    return result.scalars().all()
+async def list_payments(subscription_id: int, response: Response, page: PageParams = Depends(), db: AsyncSession = Depends(get_read_db), current_user: Principal = Depends(deps.get_current_principal)):
+    query = select(models.SubscriptionPayment).where(models.SubscriptionPayment.subscriptionId == subscription_id)
+    keys = (models.SubscriptionPayment.createdOn, models.SubscriptionPayment.subscriptionPaymentId)
+    return await paginate(db, query, keys, page, response, schemas.SubscriptionPaymentResponse)
 
 @router.put("/payments/{payment_id}", response_model=schemas.SubscriptionPaymentResponse)
 async def update_payment(
     payment_id: int, 
     payment_update: schemas.SubscriptionPaymentUpdate, 
     db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.SubscriptionPayment).where(models.SubscriptionPayment.subscriptionPaymentId == payment_id))
     payment = result.scalars().first()
@@ -130,51 +150,41 @@ async def update_payment(
     for key, value in update_data.items():
         setattr(payment, key, value)
     
+    businessId = await db.scalar(select(models.Subscription.businessId).where(models.Subscription.subscriptionId == payment.subscriptionId))
+    if businessId is not None:
+        await invalidate_entitlements(db, businessId)
     await db.commit()
     await db.refresh(payment)
     return payment
 
 # --- Usage ---
 @router.post("/usage", response_model=schemas.SubscriptionUsageResponse)
-async def log_usage(usage: schemas.SubscriptionUsageCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
+async def log_usage(usage: schemas.SubscriptionUsageCreate, db: AsyncSession = Depends(get_db), current_user: Principal = Depends(deps.get_current_principal)):
     sub = await db.execute(select(models.Subscription).where(models.Subscription.subscriptionId == usage.subscriptionId))
-    if not sub.scalars().first():
+    subscription = sub.scalars().first()
+    if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
 
-    # Check if usage for this month already exists
-    exists = await db.execute(
-        select(models.SubscriptionUsage).where(
-            models.SubscriptionUsage.subscriptionId == usage.subscriptionId,
-            models.SubscriptionUsage.usageMonth == usage.usageMonth
-        )
-    )
-    existing_usage = exists.scalars().first()
-    if existing_usage:
-        existing_usage.invoiceCount = usage.invoiceCount
-        db.add(existing_usage)
-    else:
-        new_usage = models.SubscriptionUsage(**usage.model_dump())
-        db.add(new_usage)
-    
+    # Sets the month's count outright; invoice creation keeps it up to date on its own
+    saved = await set_usage(db, usage.subscriptionId, usage.usageMonth, usage.invoiceCount)
+    await invalidate_entitlements(db, subscription.businessId)
     await db.commit()
-    if existing_usage:
-        await db.refresh(existing_usage)
-        return existing_usage
-    else:
-        await db.refresh(new_usage)
-        return new_usage
+    return saved
 
 @router.get("/usage/{subscription_id}", response_model=List[schemas.SubscriptionUsageResponse])
-async def get_usage(subscription_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(deps.get_current_user)):
-    result = await db.execute(select(models.SubscriptionUsage).where(models.SubscriptionUsage.subscriptionId == subscription_id))
-    return result.scalars().all()
+async def get_usage(subscription_id: int, request: Request, db: AsyncSession = Depends(get_read_db), current_user: Principal = Depends(deps.get_current_principal)):
+    # Polled by dashboards; usage rows move with every invoice, so the version changes whenever the counts do
+    return await collection_response(
+        request, db, models.SubscriptionUsage, models.SubscriptionUsage.subscriptionId == subscription_id,
+        (models.SubscriptionUsage.usageMonth,), schemas.SubscriptionUsageResponse,
+    )
 
 @router.put("/usage/{usage_id}", response_model=schemas.SubscriptionUsageResponse)
 async def update_usage(
     usage_id: int, 
     usage_update: schemas.SubscriptionUsageUpdate, 
     db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.SubscriptionUsage).where(models.SubscriptionUsage.subscriptionUsageId == usage_id))
     usage = result.scalars().first()
@@ -185,6 +195,9 @@ async def update_usage(
     for key, value in update_data.items():
         setattr(usage, key, value)
     
+    businessId = await db.scalar(select(models.Subscription.businessId).where(models.Subscription.subscriptionId == usage.subscriptionId))
+    if businessId is not None:
+        await invalidate_entitlements(db, businessId)
     await db.commit()
     await db.refresh(usage)
     return usage
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
 from .. import schemas, models, deps
-from ..core.database import get_db
+from ..core.database import get_db, get_read_db
+from ..core.pagination import PageParams, paginate
+from ..core.principals import Principal
+from ..core.invalidation import invalidate_principals
 
 router = APIRouter(prefix="/user-roles", tags=["User Roles"])
 
@@ -11,7 +14,7 @@ router = APIRouter(prefix="/user-roles", tags=["User Roles"])
 async def assign_role_to_user(
     user_role: schemas.UserRoleBase, 
     db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     # Check if user exists
     user_result = await db.execute(select(models.User).where(models.User.userId == user_role.userId))
@@ -35,25 +38,26 @@ async def assign_role_to_user(
     
     new_user_role = models.UserRole(userId=user_role.userId, roleId=user_role.roleId)
     db.add(new_user_role)
+    await invalidate_principals(db, user_role.userId)
     await db.commit()
     await db.refresh(new_user_role)
     return new_user_role
 
 @router.get("/", response_model=List[schemas.UserRoleResponse])
 async def list_user_roles(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_read_db), 
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
-    result = await db.execute(select(models.UserRole).offset(skip).limit(limit))
-    return result.scalars().all()
+    # No createdOn on this table, the primary key alone orders it
+    return await paginate(db, select(models.UserRole), (models.UserRole.userRoleId,), page, response, schemas.UserRoleResponse)
 
 @router.get("/user/{user_id}", response_model=List[schemas.UserRoleResponse])
 async def get_roles_for_user(
     user_id: int, 
-    db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    db: AsyncSession = Depends(get_read_db), 
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.UserRole).where(models.UserRole.userId == user_id))
     return result.scalars().all()
@@ -62,7 +66,7 @@ async def get_roles_for_user(
 async def remove_role_from_user(
     user_role_id: int, 
     db: AsyncSession = Depends(get_db), 
-    current_user: models.User = Depends(deps.get_current_user)
+    current_user: Principal = Depends(deps.get_current_principal)
 ):
     result = await db.execute(select(models.UserRole).where(models.UserRole.userRoleId == user_role_id))
     ur = result.scalars().first()
@@ -70,5 +74,6 @@ async def remove_role_from_user(
         raise HTTPException(status_code=404, detail="UserRole assignment not found")
     
     await db.delete(ur)
+    await invalidate_principals(db, ur.userId)
     await db.commit()
     return {"message": "Role removed from user"}
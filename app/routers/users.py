@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List, Optional
 from .. import schemas, models, deps
-from ..core.database import get_db
+from ..core.database import get_db, get_read_db
+from ..core.pagination import PageParams, paginate
 from ..core import security
+from ..core.principals import Principal
+from ..core.invalidation import invalidate_principals
+from ..core.versioning import entity_response
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -13,12 +17,8 @@ async def read_users_me(current_user: models.User = Depends(deps.get_current_use
     return current_user
 
 @router.get("/{user_id}", response_model=schemas.UserResponse)
-async def read_user(user_id: int, current_user: models.User = Depends(deps.get_current_user), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.User).where(models.User.userId == user_id))
-    user = result.scalars().first()
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+async def read_user(user_id: int, request: Request, current_user: Principal = Depends(deps.get_current_principal), db: AsyncSession = Depends(get_read_db)):
+    return await entity_response(request, db, models.User, models.User.userId == user_id, schemas.UserResponse, "User not found")
 
 @router.put("/me", response_model=schemas.UserResponse)
 async def update_user(
@@ -44,12 +44,13 @@ async def update_user(
         current_user.hashPassword = security.get_password_hash(update_data.password)
 
     db.add(current_user)
+    await invalidate_principals(db, current_user.userId)
     await db.commit()
     await db.refresh(current_user)
     return current_user
 
 @router.delete("/{user_id}", response_model=schemas.UserResponse)
-async def delete_user(user_id: int, current_user: models.User = Depends(deps.get_current_user), db: AsyncSession = Depends(get_db)):
+async def delete_user(user_id: int, current_user: Principal = Depends(deps.get_current_principal), db: AsyncSession = Depends(get_db)):
     # In a real app, check permissions (e.g., if user_id == current_user.userId or is admin)
     result = await db.execute(select(models.User).where(models.User.userId == user_id))
     user = result.scalars().first()
@@ -58,6 +59,7 @@ async def delete_user(user_id: int, current_user: models.User = Depends(deps.get
     
     user.isActive = False
     db.add(user)
+    await invalidate_principals(db, user.userId)
     await db.commit()
     await db.refresh(user)
     return user
@@ -65,12 +67,11 @@ async def delete_user(user_id: int, current_user: models.User = Depends(deps.get
 # Admin route example (logic only)
 @router.get("/", response_model=List[schemas.UserResponse])
 async def read_users(
-    skip: int = 0, 
-    limit: int = 100, 
-    current_user: models.User = Depends(deps.get_current_user), 
-    db: AsyncSession = Depends(get_db)
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: Principal = Depends(deps.get_current_principal), 
+    db: AsyncSession = Depends(get_read_db)
 ):
     # In a real app, check if current_user is admin
-    result = await db.execute(select(models.User).offset(skip).limit(limit))
-    users = result.scalars().all()
-    return users
+    keys = (models.User.createdOn, models.User.userId)
+    return await paginate(db, select(models.User), keys, page, response, schemas.UserResponse)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
 
 class UserBase(BaseModel):
@@ -104,6 +104,9 @@ class BusinessCreate(BusinessBase):
 
 class BusinessResponse(BusinessBase):
     businessId: int
+    templateMediaType: Optional[str] = None
+    templateSize: Optional[int] = None
+    templateHash: Optional[str] = None
     createdOn: datetime
     lastLoginOn: datetime
     
@@ -145,6 +148,7 @@ class InvoiceCreate(InvoiceBase):
 class InvoiceResponse(InvoiceBase):
     invoiceId: int
     invoiceDate: datetime
+    uploadStatus: Optional[str] = None
     createdOn: datetime
     
     class Config:
@@ -164,6 +168,21 @@ class InvoiceWithCustomerCreate(BaseModel):
     customerPhone: str
     customerFullAddress: str
 
+class InvoiceBulkCreate(BaseModel):
+    invoices: List[InvoiceWithCustomerCreate]
+    atomic: bool = False # All or nothing instead of per-item results
+
+class InvoiceBulkResult(BaseModel):
+    index: int # Position in the request
+    status: Literal["created", "failed"]
+    invoice: Optional[InvoiceResponse] = None
+    error: Optional[str] = None
+
+class InvoiceBulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[InvoiceBulkResult]
+
 
 # Subscription Plan Schemas
 class SubscriptionPlanBase(BaseModel):
@@ -172,6 +191,7 @@ class SubscriptionPlanBase(BaseModel):
     subscriptionPlanPrice: int
     subscriptionPlanDuration: int
     subscriptionPlanStatus: bool = True
+    invoiceLimit: Optional[int] = None # Per month, None = unlimited
 
 class SubscriptionPlanCreate(SubscriptionPlanBase):
     pass
@@ -182,6 +202,7 @@ class SubscriptionPlanUpdate(BaseModel):
     subscriptionPlanPrice: Optional[int] = None
     subscriptionPlanDuration: Optional[int] = None
     subscriptionPlanStatus: Optional[bool] = None
+    invoiceLimit: Optional[int] = None
 
 class SubscriptionPlanResponse(SubscriptionPlanBase):
     subscriptionPlanId: int
@@ -279,6 +300,11 @@ class InvoicePDFData(BaseModel):
     paymentMode: str
     paymentType: str
 
+class InvoicePDFBatch(BaseModel):
+    businessId: int
+    invoices: List[InvoicePDFData]
+    output: Literal["zip", "pdf"] = "zip" # ZIP of individual PDFs or one merged PDF
+
 class DashboardStats(BaseModel):
     totalBusinesses: int
     totalInvoices: int
@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, time, timedelta, timezone
+from typing import AsyncIterator, Optional
+from sqlalchemy import select
+from .. import models
+from ..core import database
+from ..core.config import settings
+
+EXPORT_COLUMNS = [
+    models.Invoice.invoiceId,
+    models.Invoice.invoiceNumber,
+    models.Invoice.BookNo,
+    models.Invoice.invoiceDate,
+    models.Customer.customerName,
+    models.Customer.customerPhone,
+    models.Customer.customerFullAddress,
+    models.Invoice.invoiceAmount,
+    models.Invoice.amountInWords,
+    models.Invoice.paymentMode,
+    models.Invoice.paymentType,
+    models.Invoice.purpose,
+    models.Invoice.billCollector,
+    models.Invoice.Nazim,
+    models.Invoice.uploadStatus,
+    models.Invoice.pdfURL,
+    models.Invoice.createdOn,
+]
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+def invoice_export_query(businessId: int, date_from: Optional[date], date_to: Optional[date]):
+    # Served by ix_invoices_business_date, in date order like an accounting ledger
+    query = (
+        select(*EXPORT_COLUMNS)
+        .join(models.Customer, models.Invoice.customerId == models.Customer.customerId)
+        .where(models.Invoice.businessId == businessId)
+        .order_by(models.Invoice.invoiceDate, models.Invoice.invoiceId)
+    )
+    if date_from:
+        query = query.where(models.Invoice.invoiceDate >= datetime.combine(date_from, time.min, timezone.utc))
+    if date_to:
+        # Inclusive of the whole last day
+        query = query.where(models.Invoice.invoiceDate < datetime.combine(date_to + timedelta(days=1), time.min, timezone.utc))
+    return query
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _format_csv(rows, header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow([column.key for column in EXPORT_COLUMNS])
+    for row in rows:
+        writer.writerow(["" if value is None else value.isoformat() if isinstance(value, datetime) else value for value in row])
+    return buffer.getvalue()
+
+def _format_ndjson(rows) -> str:
+    names = [column.key for column in EXPORT_COLUMNS]
+    return "".join(json.dumps(dict(zip(names, row)), default=_json_default, ensure_ascii=False) + "\n" for row in rows)
+
+async def stream_invoice_export(
+    businessId: int,
+    fmt: str,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    gzip: bool = False,
+) -> AsyncIterator[bytes]:
+    # Opens its own session (on the read replica when there is one): the response body is
+    # produced after the request's session is gone.
+    # yield_per turns the query into a server-side cursor, so only one batch of rows is in memory.
+    compressor = zlib.compressobj(settings.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None # wbits 31 = gzip container
+    query = invoice_export_query(businessId, date_from, date_to).execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+    first = True
+
+    async with await database.open_read_session() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            text = _format_csv(rows, header=first) if fmt == "csv" else _format_ndjson(rows)
+            first = False
+            chunk = text.encode("utf-8")
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    if fmt == "csv" and first:
+        # No rows, still send the header line
+        chunk = _format_csv([], header=True).encode("utf-8")
+        yield compressor.compress(chunk) if compressor else chunk
+    if compressor:
+        yield compressor.flush()
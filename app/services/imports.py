@@ -0,0 +1,223 @@
+import codecs
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator, List, Optional, Tuple
+from sqlalchemy import String, text, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..core.config import settings
+
+IMPORT_FIELDS = ["customerName", "customerPhone", "customerFullAddress"]
+MAX_NAME_LENGTH = models.Customer.customerName.type.length
+
+MEDIA_TYPES = {"text/csv": "csv", "application/csv": "csv", "application/x-ndjson": "ndjson", "application/jsonl": "ndjson"}
+
+# One statement and one round trip per batch whatever its size: the batch travels as three
+# arrays and unnest() turns them back into rows. Rows already on file are skipped by the
+# unique constraint, RETURNING tells us which ones were new.
+INSERT_BATCH = text("""
+INSERT INTO epay_customers ("businessId", "customerName", "customerPhone", "customerFullAddress")
+SELECT CAST(:businessId AS integer), name, phone, address FROM unnest(:names, :phones, :addresses) AS t(name, phone, address)
+ON CONFLICT ON CONSTRAINT ux_customer_identity DO NOTHING
+RETURNING "customerName", "customerPhone"
+""").bindparams(
+    bindparam("names", type_=ARRAY(String)),
+    bindparam("phones", type_=ARRAY(String)),
+    bindparam("addresses", type_=ARRAY(String)),
+)
+
+class ImportFailed(Exception):
+    # The upload as a whole is unusable (bad header, bad gzip, too many rows). Batches before
+    # the failure are already committed, report says how far the import got.
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.report: Optional[dict] = None
+
+class ImportReport:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.existing = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < settings.CUSTOMER_IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "existing": self.existing,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errorsTruncated": self.failed > len(self.errors),
+        }
+
+async def _decoded(chunks: AsyncIterator[bytes], gzip: bool) -> AsyncIterator[str]:
+    decompressor = zlib.decompressobj(31) if gzip else None # wbits 31 = gzip container
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    try:
+        async for chunk in chunks:
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+            if chunk:
+                yield decoder.decode(chunk)
+        tail = decompressor.flush() if decompressor else b""
+        if decompressor and not decompressor.eof:
+            raise ImportFailed("Truncated gzip body")
+        yield decoder.decode(tail, final=True)
+    except zlib.error as e:
+        raise ImportFailed(f"Invalid gzip body: {e}")
+    except UnicodeDecodeError as e:
+        raise ImportFailed(f"Body is not UTF-8: {e}")
+
+def _complete_text(buffer: str) -> int:
+    # End of the last complete CSV record in buffer: the last newline outside quotes
+    end = 0
+    quoted = False
+    start = 0
+    while True:
+        newline = buffer.find("\n", start)
+        if newline < 0:
+            return end
+        quoted ^= buffer.count('"', start, newline) % 2 == 1
+        if not quoted:
+            end = newline + 1
+        start = newline + 1
+
+async def _csv_records(texts: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    header = None
+    row = 0
+    buffer = ""
+    done = False
+    while not done:
+        try:
+            buffer += await texts.__anext__()
+            end = _complete_text(buffer)
+        except StopAsyncIteration:
+            # Whatever is left: an unterminated last line, or a quote that never closes
+            done = True
+            end = len(buffer)
+        if not end:
+            continue
+        complete, buffer = buffer[:end], buffer[end:]
+        for values in csv.reader(io.StringIO(complete)):
+            if not values:
+                continue
+            if header is None:
+                header = [value.strip() for value in values]
+                missing = [field for field in IMPORT_FIELDS if field not in header]
+                if missing:
+                    raise ImportFailed(f"CSV header is missing {', '.join(missing)}")
+                continue
+            row += 1
+            if len(values) != len(header):
+                yield row, None, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            yield row, dict(zip(header, values)), None
+    if header is None:
+        raise ImportFailed("CSV header is missing")
+
+async def _ndjson_records(texts: AsyncIterator[str]) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    row = 0
+    buffer = ""
+    async for part in texts:
+        buffer += part
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            row += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield row, None, "Expected a JSON object"
+                continue
+            yield row, record, None
+    if buffer.strip():
+        row += 1
+        try:
+            record = json.loads(buffer)
+            yield (row, record, None) if isinstance(record, dict) else (row, None, "Expected a JSON object")
+        except ValueError as e:
+            yield row, None, f"Invalid JSON: {e}"
+
+def _validate(record: dict) -> Tuple[Optional[Tuple[str, str, str]], Optional[str]]:
+    values = []
+    for field in IMPORT_FIELDS:
+        value = record.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value) # Phone numbers written as JSON numbers
+        if not isinstance(value, str) or not value.strip():
+            return None, f"{field} is required"
+        values.append(value.strip())
+    if len(values[0]) > MAX_NAME_LENGTH:
+        return None, f"customerName is longer than {MAX_NAME_LENGTH} characters"
+    return tuple(values), None
+
+async def _flush(db: AsyncSession, businessId: int, batch: List[Tuple[str, str, str]], report: ImportReport):
+    result = await db.execute(INSERT_BATCH, {
+        "businessId": businessId,
+        "names": [row[0] for row in batch],
+        "phones": [row[1] for row in batch],
+        "addresses": [row[2] for row in batch],
+    })
+    inserted = len(result.all())
+    # Committed per batch: locks on the unique index are held briefly and a retried upload
+    # picks up where a failed one stopped, the rows already in are counted as existing
+    await db.commit()
+    report.inserted += inserted
+    report.existing += len(batch) - inserted
+
+async def import_customers(
+    db: AsyncSession,
+    businessId: int,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    gzip: bool = False,
+) -> dict:
+    # Rows are validated and deduplicated on (customerName, customerPhone) as they stream in,
+    # the first occurrence wins. Only one batch of rows is held besides the keys seen so far.
+    report = ImportReport()
+    seen = set()
+    batch: List[Tuple[str, str, str]] = []
+    texts = _decoded(chunks, gzip)
+    records = _csv_records(texts) if fmt == "csv" else _ndjson_records(texts)
+
+    try:
+        async for row, record, problem in records:
+            report.received += 1
+            if report.received > settings.CUSTOMER_IMPORT_MAX_ROWS:
+                raise ImportFailed(f"Imports are limited to {settings.CUSTOMER_IMPORT_MAX_ROWS} rows")
+            if problem is None:
+                values, problem = _validate(record)
+            if problem is not None:
+                report.error(row, problem)
+                continue
+            key = values[:2]
+            if key in seen:
+                report.duplicates += 1
+                continue
+            seen.add(key)
+            batch.append(values)
+            if len(batch) >= settings.CUSTOMER_IMPORT_BATCH_SIZE:
+                await _flush(db, businessId, batch, report)
+                batch = []
+        if batch:
+            await _flush(db, businessId, batch, report)
+    except ImportFailed as e:
+        e.report = report.as_dict()
+        raise
+    return report.as_dict()
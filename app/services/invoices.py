@@ -0,0 +1,183 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+
+INVOICE_COLUMNS = [
+    "invoiceNumber", "BookNo", "invoiceAmount", "amountInWords", "paymentMode", "paymentType",
+    "purpose", "billCollector", "Nazim", "pdfURL", "uploadStatus",
+]
+
+class BusinessNotFound(Exception):
+    pass
+
+async def create_invoice(
+    db: AsyncSession,
+    businessId: int,
+    customerName: str,
+    customerPhone: str,
+    customerFullAddress: str,
+    **invoice_fields,
+) -> models.Invoice:
+    # Find-or-create the customer and insert the invoice in one statement:
+    #   WITH customer AS (INSERT ... ON CONFLICT (ux_customer_identity) DO UPDATE ... RETURNING "customerId")
+    #   INSERT INTO epay_invoices SELECT ... FROM customer RETURNING *
+    # The no-op DO UPDATE makes RETURNING yield the existing row, so concurrent requests
+    # for the same customer share one row instead of racing to create two.
+    # Runs in the caller's transaction; the caller commits.
+    customer = insert(models.Customer).values(
+        businessId=businessId,
+        customerName=customerName,
+        customerPhone=customerPhone,
+        customerFullAddress=customerFullAddress,
+    )
+    customer = customer.on_conflict_do_update(
+        constraint="ux_customer_identity",
+        set_={"customerName": customer.excluded.customerName},
+    ).returning(models.Customer.customerId).cte("customer")
+    columns = [name for name in INVOICE_COLUMNS if name in invoice_fields]
+    source = select(
+        literal(businessId).label("businessId"),
+        customer.c.customerId,
+        *[literal(invoice_fields[name], type_=getattr(models.Invoice, name).type).label(name) for name in columns],
+    )
+    statement = (
+        insert(models.Invoice)
+        .from_select(["businessId", "customerId", *columns], source)
+        .returning(models.Invoice)
+    )
+    try:
+        return (await db.scalars(statement)).one()
+    except IntegrityError as e:
+        # The customer insert is the first to hit the business foreign key
+        if sqlstate(e) == "23503":
+            raise BusinessNotFound(businessId)
+        raise
+
+async def upsert_customers(
+    db: AsyncSession,
+    businessId: int,
+    customers: Iterable[Tuple[str, str, str]],
+) -> Dict[Tuple[str, str], int]:
+    # Set based find-or-create for (name, phone, address) tuples, one statement for the whole batch.
+    # Returns customerId by (name, phone); the first address given for a customer wins.
+    rows = {}
+    for name, phone, address in customers:
+        rows.setdefault((name, phone), address)
+    if not rows:
+        return {}
+    statement = insert(models.Customer).values([
+        {"businessId": businessId, "customerName": name, "customerPhone": phone, "customerFullAddress": address}
+        for (name, phone), address in rows.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        constraint="ux_customer_identity",
+        set_={"customerName": statement.excluded.customerName},
+    ).returning(models.Customer.customerId, models.Customer.customerName, models.Customer.customerPhone)
+    try:
+        result = await db.execute(statement)
+    except IntegrityError as e:
+        if sqlstate(e) == "23503":
+            raise BusinessNotFound(businessId)
+        raise
+    return {(row.customerName, row.customerPhone): row.customerId for row in result}
+
+async def create_invoices(
+    db: AsyncSession,
+    items: List[dict],
+    atomic: bool = False,
+) -> List[Tuple[Optional[models.Invoice], Optional[str]]]:
+    # Bulk version of create_invoice, one (invoice, error) per item in request order.
+    # Businesses are checked with one query, customers are upserted with one statement per business
+    # and the invoices go in as one multi-row INSERT ... RETURNING. If that fails, items are retried
+    # one savepoint each so a bad item does not take the rest down, unless atomic is set: then the
+    # first failure raises and the caller rolls back. Runs in the caller's transaction.
+    results: List[Tuple[Optional[models.Invoice], Optional[str]]] = [(None, None)] * len(items)
+    business_ids = {item["businessId"] for item in items}
+    existing = set((await db.scalars(select(models.Business.businessId).where(models.Business.businessId.in_(business_ids)))).all())
+
+    pending = []
+    for index, item in enumerate(items):
+        problem = _check_item(item, existing)
+        if problem:
+            if atomic:
+                raise BulkItemFailed(index, problem)
+            results[index] = (None, problem)
+        else:
+            pending.append(index)
+    if not pending:
+        return results
+
+    try:
+        async with db.begin_nested():
+            invoices = await _insert_invoices(db, [items[index] for index in pending])
+        for index, invoice in zip(pending, invoices):
+            results[index] = (invoice, None)
+        return results
+    except DBAPIError as e:
+        if e.connection_invalidated:
+            raise
+        if atomic:
+            raise BulkItemFailed(None, _describe(e))
+
+    for index in pending:
+        item = dict(items[index])
+        try:
+            async with db.begin_nested():
+                invoice = await create_invoice(
+                    db, item.pop("businessId"), item.pop("customerName"), item.pop("customerPhone"), item.pop("customerFullAddress"), **item
+                )
+            results[index] = (invoice, None)
+        except BusinessNotFound:
+            results[index] = (None, "Business not found")
+        except DBAPIError as e:
+            if e.connection_invalidated:
+                raise
+            results[index] = (None, _describe(e))
+    return results
+
+class BulkItemFailed(Exception):
+    # An atomic bulk request failed; index is None when the failing item is not known
+    def __init__(self, index: Optional[int], error: str):
+        super().__init__(error)
+        self.index = index
+        self.error = error
+
+def _check_item(item: dict, existing_businesses: set) -> Optional[str]:
+    if item["businessId"] not in existing_businesses:
+        return "Business not found"
+    if len(item["customerName"]) > models.Customer.customerName.type.length:
+        return f"customerName is longer than {models.Customer.customerName.type.length} characters"
+    return None
+
+async def _insert_invoices(db: AsyncSession, items: List[dict]) -> List[models.Invoice]:
+    customers = {}
+    for businessId in {item["businessId"] for item in items}:
+        ids = await upsert_customers(db, businessId, [
+            (item["customerName"], item["customerPhone"], item["customerFullAddress"])
+            for item in items if item["businessId"] == businessId
+        ])
+        customers.update({(businessId, *key): customerId for key, customerId in ids.items()})
+    # executemany needs the same keys in every row
+    columns = [name for name in INVOICE_COLUMNS if any(name in item for item in items)]
+    rows = [
+        {
+            "businessId": item["businessId"],
+            "customerId": customers[(item["businessId"], item["customerName"], item["customerPhone"])],
+            **{name: item.get(name) for name in columns},
+        }
+        for item in items
+    ]
+    # Batched into multi-row INSERT ... RETURNING, rows come back in parameter order
+    statement = insert(models.Invoice).returning(models.Invoice, sort_by_parameter_order=True)
+    return list((await db.scalars(statement, rows)).all())
+
+def _describe(error: Exception) -> str:
+    # First line of the driver's message, without the "<class '...'>: " prefix the adapter adds
+    message = str(getattr(error, "orig", error)).split("\n")[0]
+    return message.split(">: ", 1)[-1]
+
+def sqlstate(error: IntegrityError) -> Optional[str]:
+    return getattr(error.orig, "sqlstate", None) or getattr(error.orig, "pgcode", None)
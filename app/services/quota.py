@@ -0,0 +1,152 @@
+import asyncio
+from typing import Optional, Set
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..core import database
+from ..core.config import settings
+from ..core.entitlements import Entitlement, entitlement_cache
+from .usage import usage_meter, usage_month
+
+# Plan quota checks for invoice creation. A cached decision is a dict lookup and a few
+# comparisons; the database is only read on a miss, once per business per TTL.
+#
+# Policy (QUOTA_ENFORCEMENT):
+#   "off"  no checks
+#   "soft" over-limit, expired, inactive and missing subscriptions are allowed, counted in
+#          /admin/metrics and logged once per business, month and reason
+#   "hard" they are refused with QuotaExceeded (402 at the API)
+# Stale entries: within ENTITLEMENT_STALE_GRACE_SECONDS past the TTL the old entitlement decides
+# and one background reload replaces it; past that the request waits for a reload.
+# Limits are enforced per worker between reloads, so concurrent workers can overshoot a limit
+# by what they create within one TTL. Unknown businesses are left to the endpoint (404).
+
+class QuotaExceeded(Exception):
+    def __init__(self, entitlement: Entitlement, reason: str):
+        super().__init__(reason)
+        self.entitlement = entitlement
+        self.reason = reason
+
+    def detail(self) -> dict:
+        messages = {
+            "no_subscription": "Business has no subscription",
+            "subscription_inactive": "Subscription is not active",
+            "subscription_expired": "Subscription has expired",
+            "invoice_limit_reached": "Monthly invoice limit of the plan reached",
+        }
+        return {
+            "error": messages[self.reason],
+            "reason": self.reason,
+            "invoiceLimit": self.entitlement.invoiceLimit,
+            "used": self.entitlement.used,
+        }
+
+class QuotaStats:
+    def __init__(self):
+        self.checks = 0
+        self.denied = 0
+        self.soft_violations = 0
+        self.reloads = 0
+        self.background_reloads = 0
+        self.reload_failures = 0
+        self._warned: Set[tuple] = set()
+        self._reloading: Set[int] = set()
+
+    def as_dict(self) -> dict:
+        return {
+            "enforcement": settings.QUOTA_ENFORCEMENT,
+            "checks": self.checks,
+            "denied": self.denied,
+            "softViolations": self.soft_violations,
+            "reloads": self.reloads,
+            "backgroundReloads": self.background_reloads,
+            "reloadFailures": self.reload_failures,
+            "cache": entitlement_cache.stats(),
+        }
+
+quota_stats = QuotaStats()
+
+# Background reloads in flight; the event loop only keeps weak references to tasks
+_reload_tasks: Set[asyncio.Task] = set()
+
+async def load_entitlement(db: AsyncSession, businessId: int) -> Optional[Entitlement]:
+    # Business, subscription, plan and this month's counter in one round trip
+    month = usage_month()
+    generation = entitlement_cache.generation
+    result = await db.execute(
+        select(
+            models.Business.businessId,
+            models.Subscription.subscriptionId,
+            models.Subscription.subscriptionStatus,
+            models.Subscription.subscriptionEndDate,
+            models.SubscriptionPlan.invoiceLimit,
+            models.SubscriptionUsage.invoiceCount,
+        )
+        .select_from(models.Business)
+        .outerjoin(models.Subscription, models.Subscription.businessId == models.Business.businessId)
+        .outerjoin(models.SubscriptionPlan, models.SubscriptionPlan.subscriptionPlanId == models.Subscription.subscriptionPlanId)
+        .outerjoin(models.SubscriptionUsage, and_(
+            models.SubscriptionUsage.subscriptionId == models.Subscription.subscriptionId,
+            models.SubscriptionUsage.usageMonth == month,
+        ))
+        .where(models.Business.businessId == businessId)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    quota_stats.reloads += 1
+    entitlement = Entitlement(
+        businessId=businessId,
+        subscriptionId=row.subscriptionId,
+        active=bool(row.subscriptionStatus),
+        endsAt=row.subscriptionEndDate,
+        invoiceLimit=row.invoiceLimit,
+        usageMonth=month,
+        # Counts this worker has buffered but not yet written are not in the counter
+        used=(row.invoiceCount or 0) + usage_meter.pending(businessId, month),
+    )
+    entitlement_cache.put(entitlement, generation)
+    return entitlement
+
+async def _reload_in_background(businessId: int):
+    try:
+        async with database.AsyncSessionLocal() as db:
+            await load_entitlement(db, businessId)
+        quota_stats.background_reloads += 1
+    except Exception as e:
+        # The stale entry keeps deciding until the grace period runs out
+        quota_stats.reload_failures += 1
+        print(f"Entitlement reload for business {businessId} failed: {str(e)}")
+    finally:
+        quota_stats._reloading.discard(businessId)
+
+async def get_entitlement(db: AsyncSession, businessId: int) -> Optional[Entitlement]:
+    entitlement, fresh = entitlement_cache.get(businessId)
+    if entitlement is None:
+        return await load_entitlement(db, businessId)
+    if not fresh and businessId not in quota_stats._reloading:
+        quota_stats._reloading.add(businessId)
+        task = asyncio.create_task(_reload_in_background(businessId))
+        _reload_tasks.add(task)
+        task.add_done_callback(_reload_tasks.discard)
+    return entitlement
+
+async def check_quota(db: AsyncSession, businessId: int, n: int = 1):
+    # Call before creating n invoices for businessId
+    if settings.QUOTA_ENFORCEMENT == "off":
+        return
+    quota_stats.checks += 1
+    entitlement = await get_entitlement(db, businessId)
+    if entitlement is None:
+        return
+    reason = entitlement.denial(n)
+    if reason is None:
+        return
+    if settings.QUOTA_ENFORCEMENT == "hard":
+        quota_stats.denied += 1
+        raise QuotaExceeded(entitlement, reason)
+    quota_stats.soft_violations += 1
+    warning = (businessId, entitlement.usageMonth, reason)
+    if warning not in quota_stats._warned:
+        quota_stats._warned.add(warning)
+        print(f"Quota: business {businessId} allowed despite {reason} (used {entitlement.used}, limit {entitlement.invoiceLimit})")
@@ -0,0 +1,72 @@
+from datetime import date, timedelta
+from typing import List, Optional
+from sqlalchemy import select, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..core.rollups import REBUILD_SQL, RECONCILE_SQL
+
+TEMPLATE_STATUSES = ["ACTIVE", "PENDING", "MISSING"]
+
+def _day_counter(day: date) -> str:
+    return f"invoices:{day.isoformat()}"
+
+async def read_stats(db: AsyncSession, date_from: date, date_to: date, businessId: Optional[int] = None) -> dict:
+    # Two small reads whatever the table sizes: the totals (one row per counter shard) and
+    # one row per day of the range, from the global day counters or the business's daily rows.
+    counter = models.StatsCounter
+    totals = dict((await db.execute(
+        select(counter.counterName, func.sum(counter.value))
+        .where(counter.counterName.in_(["invoices", "businesses", "users", *[f"templates:{s}" for s in TEMPLATE_STATUSES]]))
+        .group_by(counter.counterName)
+    )).all())
+
+    if businessId is None:
+        # Zero padded ISO dates sort like the dates themselves
+        rows = (await db.execute(
+            select(counter.counterName, func.sum(counter.value))
+            .where(counter.counterName.between(_day_counter(date_from), _day_counter(date_to)))
+            .group_by(counter.counterName)
+        )).all()
+        per_day = {name.split(":", 1)[1]: count for name, count in rows}
+    else:
+        daily = models.InvoiceDailyStat
+        rows = (await db.execute(
+            select(daily.day, daily.invoiceCount)
+            .where(daily.businessId == businessId, daily.day.between(date_from, date_to))
+        )).all()
+        per_day = {day.isoformat(): count for day, count in rows}
+
+    timeline = []
+    day = date_from
+    while day <= date_to:
+        timeline.append({"date": day.isoformat(), "count": int(per_day.get(day.isoformat(), 0))})
+        day += timedelta(days=1)
+
+    templates = {status: int(totals.get(f"templates:{status}", 0)) for status in TEMPLATE_STATUSES}
+    return {
+        "businesses": int(totals.get("businesses", 0)),
+        "invoices": int(totals.get("invoices", 0)),
+        "pendingTemplates": templates["PENDING"],
+        "missingTemplates": templates["MISSING"],
+        "users": int(totals.get("users", 0)),
+        "charts": {
+            "invoiceTimeline": timeline,
+            "templateDistribution": [
+                {"label": "Active", "value": templates["ACTIVE"]},
+                {"label": "Pending", "value": templates["PENDING"]},
+                {"label": "Missing", "value": templates["MISSING"]}
+            ]
+        }
+    }
+
+async def rebuild_stats(db: AsyncSession):
+    # Full recompute from the base tables; blocks writers (not readers) until the caller commits
+    for statement in REBUILD_SQL:
+        await db.execute(text(statement))
+
+async def reconcile_stats(db: AsyncSession, fix: bool = False) -> List[dict]:
+    # Drift between the rollups and a fresh aggregate, rebuilt in the same transaction when fix is set
+    drift = [dict(row._mapping) for row in await db.execute(text(RECONCILE_SQL))]
+    if drift and fix:
+        await rebuild_stats(db)
+    return drift
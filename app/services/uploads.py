@@ -0,0 +1,166 @@
+import asyncio
+import random
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..core import database
+from ..core.config import settings
+from ..core.storage import storage, StorageError
+
+def enqueue_upload(db: AsyncSession, invoice_id: int, object_url: str, pdf_bytes: bytes):
+    # Added to the caller's transaction; the invoice itself is created with uploadStatus PENDING
+    db.add(models.InvoiceUpload(invoiceId=invoice_id, objectURL=object_url, pdfData=pdf_bytes, attempts=0))
+
+def _retry_delay(attempts: int) -> float:
+    delay = min(settings.UPLOAD_RETRY_MAX_SECONDS, settings.UPLOAD_RETRY_BASE_SECONDS * (2 ** (attempts - 1)))
+    # Jitter keeps a storage outage from turning into synchronized retry waves
+    return delay * random.uniform(0.8, 1.2)
+
+async def retry_upload(db: AsyncSession, invoice_id: int) -> Optional[bool]:
+    # Requeues an upload that ran out of attempts. None when the invoice has no queued upload,
+    # False when it is still being retried. Runs in the caller's transaction.
+    result = await db.execute(
+        update(models.InvoiceUpload)
+        .where(models.InvoiceUpload.invoiceId == invoice_id, models.InvoiceUpload.nextAttemptOn.is_(None))
+        .values(attempts=0, nextAttemptOn=func.now(), lastError=None)
+        .returning(models.InvoiceUpload.invoiceUploadId)
+    )
+    if result.first() is None:
+        queued = await db.scalar(select(models.InvoiceUpload.invoiceUploadId).where(models.InvoiceUpload.invoiceId == invoice_id))
+        return None if queued is None else False
+    await db.execute(update(models.Invoice).where(models.Invoice.invoiceId == invoice_id).values(uploadStatus="PENDING"))
+    return True
+
+async def _put_object(url: str, content: bytes):
+    key = storage.key_for_url(url)
+    if key is None:
+        raise StorageError(f"{url} is not in the configured storage")
+    await storage.put(key, content, content_type="application/pdf")
+
+# Drains epay_invoice_uploads in the background with bounded concurrency and exponential backoff
+class UploadWorker:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._limit = asyncio.Semaphore(settings.UPLOAD_CONCURRENCY)
+        self._stopping = False
+        self.uploaded = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=30)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "uploaded": self.uploaded,
+            "retried": self.retried,
+            "failed": self.failed,
+            "lastError": self.last_error,
+        }
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                claimed = await self.drain_once()
+            except Exception as e:
+                print(f"Upload worker error: {str(e)}")
+                claimed = 0
+            if claimed < settings.UPLOAD_BATCH_SIZE:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.UPLOAD_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def drain_once(self) -> int:
+        async with database.AsyncSessionLocal() as db:
+            # SKIP LOCKED lets several app workers drain the same table without double uploads
+            result = await db.execute(
+                select(models.InvoiceUpload)
+                .where(models.InvoiceUpload.nextAttemptOn <= func.now())
+                .order_by(models.InvoiceUpload.nextAttemptOn)
+                .limit(settings.UPLOAD_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            jobs = result.scalars().all()
+            if not jobs:
+                return 0
+            await db.execute(
+                update(models.InvoiceUpload)
+                .where(models.InvoiceUpload.invoiceUploadId.in_([job.invoiceUploadId for job in jobs]))
+                .values(nextAttemptOn=func.now() + timedelta(seconds=settings.UPLOAD_LEASE_SECONDS))
+            )
+            await db.commit()
+
+        await asyncio.gather(*[self._upload(job) for job in jobs])
+        return len(jobs)
+
+    async def _upload(self, job: models.InvoiceUpload):
+        error = None
+        async with self._limit:
+            try:
+                await _put_object(job.objectURL, job.pdfData)
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+
+        async with database.AsyncSessionLocal() as db:
+            if error is None:
+                self.uploaded += 1
+                # Waits for a delete_invoice holding the row; if the invoice is gone by then, so is the row
+                removed = await db.execute(
+                    delete(models.InvoiceUpload)
+                    .where(models.InvoiceUpload.invoiceUploadId == job.invoiceUploadId)
+                    .returning(models.InvoiceUpload.invoiceUploadId)
+                )
+                if removed.first() is None:
+                    await self._remove_orphan(job)
+                    return
+                await db.execute(update(models.Invoice).where(models.Invoice.invoiceId == job.invoiceId).values(uploadStatus="UPLOADED"))
+            else:
+                attempts = job.attempts + 1
+                self.last_error = f"Invoice {job.invoiceId}: {error}"
+                print(f"Cloud Invoice Upload Failed (attempt {attempts}): {self.last_error}")
+                if attempts >= settings.UPLOAD_MAX_ATTEMPTS:
+                    # Keep the row and its bytes for POST /admin/uploads/{invoiceId}/retry, but stop polling it
+                    self.failed += 1
+                    next_attempt = None
+                    await db.execute(update(models.Invoice).where(models.Invoice.invoiceId == job.invoiceId).values(uploadStatus="FAILED"))
+                else:
+                    self.retried += 1
+                    next_attempt = func.now() + timedelta(seconds=_retry_delay(attempts))
+                await db.execute(
+                    update(models.InvoiceUpload)
+                    .where(models.InvoiceUpload.invoiceUploadId == job.invoiceUploadId)
+                    .values(attempts=attempts, nextAttemptOn=next_attempt, lastError=error)
+                )
+            await db.commit()
+
+    async def _remove_orphan(self, job: models.InvoiceUpload):
+        # The invoice was deleted while its PDF was being uploaded
+        try:
+            await storage.delete(storage.key_for_url(job.objectURL))
+        except Exception as e:
+            print(f"Cloud Delete failed for {job.objectURL} of deleted invoice {job.invoiceId}: {str(e)}")
+
+upload_worker = UploadWorker()
@@ -0,0 +1,201 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Integer, String, event, inspect, text, bindparam
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .. import models
+from ..core import database
+from ..core.config import settings
+from ..core.entitlements import entitlement_cache
+
+# Invoice counts per (subscriptionId, usageMonth) in epay_subscription_usages, bumped whenever
+# invoices are created. USAGE_METERING decides when the bump is written:
+#   "inline"   in the transaction that creates the invoices, exact at all times
+#   "buffered" added up in memory after that transaction commits and written every
+#              USAGE_FLUSH_INTERVAL_SECONDS, one statement per flush however many invoices.
+#              Counts not yet flushed are lost if the process dies; reconcile_usage repairs that.
+#   "off"      not metered
+
+UsageKey = Tuple[int, str] # (businessId, usageMonth)
+
+_SESSION_KEY = "usage_pending"
+
+# Atomic increment, one row per (subscription, month); businesses without a subscription are skipped
+INCREMENT_USAGE = text("""
+INSERT INTO epay_subscription_usages ("subscriptionId", "usageMonth", "invoiceCount")
+SELECT s."subscriptionId", t.month, sum(t.n)
+FROM unnest(:business_ids, :months, :counts) AS t(business_id, month, n)
+JOIN epay_subscriptions s ON s."businessId" = t.business_id
+GROUP BY 1, 2
+ORDER BY 1, 2
+ON CONFLICT ON CONSTRAINT ux_subscription_usage
+DO UPDATE SET "invoiceCount" = epay_subscription_usages."invoiceCount" + EXCLUDED."invoiceCount"
+""").bindparams(
+    bindparam("business_ids", type_=ARRAY(Integer)),
+    bindparam("months", type_=ARRAY(String)),
+    bindparam("counts", type_=ARRAY(Integer)),
+)
+
+USAGE_MONTH = """to_char(COALESCE(i."invoiceDate", i."createdOn") AT TIME ZONE 'UTC', 'YYYY-MM')"""
+
+# Recomputes counters from epay_invoices and returns the rows that changed
+RECONCILE_USAGE = text(f"""
+WITH actual AS (
+    SELECT s."subscriptionId", {USAGE_MONTH} AS "usageMonth", count(*)::int AS "invoiceCount"
+    FROM epay_invoices i JOIN epay_subscriptions s ON s."businessId" = i."businessId"
+    WHERE CAST(:month AS text) IS NULL OR {USAGE_MONTH} = :month
+    GROUP BY 1, 2
+),
+stored AS (
+    SELECT "subscriptionId", "usageMonth", "invoiceCount" FROM epay_subscription_usages
+    WHERE CAST(:month AS text) IS NULL OR "usageMonth" = :month
+),
+drift AS (
+    SELECT COALESCE(a."subscriptionId", s."subscriptionId") AS "subscriptionId",
+           COALESCE(a."usageMonth", s."usageMonth") AS "usageMonth",
+           s."invoiceCount" AS stored, COALESCE(a."invoiceCount", 0) AS actual
+    FROM actual a FULL JOIN stored s ON s."subscriptionId" = a."subscriptionId" AND s."usageMonth" = a."usageMonth"
+    WHERE s."invoiceCount" IS DISTINCT FROM COALESCE(a."invoiceCount", 0)
+),
+fixed AS (
+    INSERT INTO epay_subscription_usages ("subscriptionId", "usageMonth", "invoiceCount")
+    SELECT "subscriptionId", "usageMonth", actual FROM drift WHERE CAST(:fix AS boolean)
+    ORDER BY 1, 2
+    ON CONFLICT ON CONSTRAINT ux_subscription_usage DO UPDATE SET "invoiceCount" = EXCLUDED."invoiceCount"
+)
+SELECT * FROM drift ORDER BY 1, 2
+""")
+
+def usage_month(moment: Optional[datetime] = None) -> str:
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime("%Y-%m")
+
+def invoice_counts(invoices: Iterable[models.Invoice]) -> Dict[UsageKey, int]:
+    # invoiceDate is a server default and may not be loaded yet; that is the database's now(), and so is ours
+    return Counter((invoice.businessId, usage_month(inspect(invoice).dict.get("invoiceDate"))) for invoice in invoices)
+
+async def _increment(db: AsyncSession, counts: Dict[UsageKey, int]):
+    items = [(businessId, month, n) for (businessId, month), n in counts.items() if n]
+    if not items:
+        return
+    await db.execute(INCREMENT_USAGE, {
+        "business_ids": [item[0] for item in items],
+        "months": [item[1] for item in items],
+        "counts": [item[2] for item in items],
+    })
+
+class UsageMeter:
+    def __init__(self):
+        self._pending: Counter = Counter()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self.flushes = 0
+        self.flushed_invoices = 0
+        self.failed_flushes = 0
+        self.last_error: Optional[str] = None
+
+    async def record(self, db: AsyncSession, invoices: Iterable[models.Invoice]):
+        # Call before committing the transaction that created the invoices
+        if settings.USAGE_METERING == "off":
+            return
+        counts = invoice_counts(invoices)
+        if settings.USAGE_METERING == "inline":
+            await _increment(db, counts)
+        # Picked up by the after_commit hook below, dropped on rollback
+        db.info.setdefault(_SESSION_KEY, Counter()).update(counts)
+
+    def start(self):
+        if settings.USAGE_METERING == "buffered" and self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        counts, self._pending = self._pending, Counter()
+        try:
+            async with database.AsyncSessionLocal() as db:
+                await _increment(db, counts)
+                await db.commit()
+        except Exception as e:
+            # Keep the counts for the next flush
+            self._pending.update(counts)
+            self.failed_flushes += 1
+            self.last_error = str(e)
+            print(f"Usage flush failed: {self.last_error}")
+            return 0
+        self.flushes += 1
+        self.flushed_invoices += sum(counts.values())
+        return sum(counts.values())
+
+    def stats(self) -> dict:
+        return {
+            "mode": settings.USAGE_METERING,
+            "running": self._task is not None,
+            "pendingInvoices": sum(self._pending.values()),
+            "flushes": self.flushes,
+            "flushedInvoices": self.flushed_invoices,
+            "failedFlushes": self.failed_flushes,
+            "lastError": self.last_error,
+        }
+
+    def pending(self, businessId: int, usageMonth: str) -> int:
+        return self._pending.get((businessId, usageMonth), 0)
+
+    def _committed(self, counts: Counter):
+        if settings.USAGE_METERING == "buffered":
+            self._pending.update(counts)
+        # Cached entitlements count this worker's invoices without waiting for a reload
+        for (businessId, month), n in counts.items():
+            entitlement_cache.add_usage(businessId, month, n)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=settings.USAGE_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+usage_meter = UsageMeter()
+
+@event.listens_for(Session, "after_commit")
+def _usage_committed(session: Session):
+    counts = session.info.pop(_SESSION_KEY, None)
+    if counts:
+        usage_meter._committed(counts)
+
+@event.listens_for(Session, "after_rollback")
+def _usage_rolled_back(session: Session):
+    session.info.pop(_SESSION_KEY, None)
+
+async def set_usage(db: AsyncSession, subscriptionId: int, usageMonth: str, invoiceCount: int) -> models.SubscriptionUsage:
+    # Absolute count in one upsert, no read-modify-write race between concurrent callers
+    statement = insert(models.SubscriptionUsage).values(
+        subscriptionId=subscriptionId, usageMonth=usageMonth, invoiceCount=invoiceCount,
+    )
+    statement = statement.on_conflict_do_update(
+        constraint="ux_subscription_usage",
+        set_={"invoiceCount": statement.excluded.invoiceCount},
+    ).returning(models.SubscriptionUsage)
+    return (await db.scalars(statement, execution_options={"populate_existing": True})).one()
+
+async def reconcile_usage(db: AsyncSession, month: Optional[str] = None, fix: bool = False) -> List[dict]:
+    # Buffered counts of this worker go in first so they are not added on top of the recount.
+    # A report without fix writes nothing, so counts still buffered may show up as drift.
+    if fix:
+        await usage_meter.flush()
+    result = await db.execute(RECONCILE_USAGE, {"month": month, "fix": fix})
+    return [dict(row._mapping) for row in result]
@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from typing import List
+from pydantic import TypeAdapter
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas
+from app.core.config import settings
+from app.core.database import build_engine
+from app.core.pagination import list_columns, encode_rows, orjson
+
+# Benchmark for list responses: the response_model path (ORM rows, Pydantic validation, stdlib
+# json) against FAST_LIST_RESPONSES (selected columns straight to orjson). Reads the newest
+# invoices of an existing database, nothing is written.
+#
+#   python benchmark_lists.py
+#   python benchmark_lists.py --url postgresql+asyncpg://user@host/db --rows 1000 --rows 10000
+#   python benchmark_lists.py --json results.json
+
+DEFAULT_ROWS = [1000, 10000, 100000]
+PATHS = ["regular", "fast"]
+
+KEYS = (models.Invoice.createdOn, models.Invoice.invoiceId)
+
+def _query(limit: int):
+    return select(models.Invoice).order_by(*[key.desc() for key in KEYS]).limit(limit)
+
+def _encode_regular(rows) -> bytes:
+    # What FastAPI does with response_model=List[InvoiceResponse]: validate from attributes,
+    # serialize in JSON mode, then JSONResponse.render
+    adapter = TypeAdapter(List[schemas.InvoiceResponse])
+    content = adapter.dump_python(adapter.validate_python(rows, from_attributes=True), mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+async def run_once(engine, path: str, limit: int, timings: dict) -> bytes:
+    async with engine.connect() as conn:
+        started = time.perf_counter()
+        if path == "regular":
+            async with AsyncSession(bind=conn) as db:
+                rows = (await db.execute(_query(limit))).scalars().all()
+                fetched = time.perf_counter()
+                body = _encode_regular(rows)
+        else:
+            query = _query(limit)
+            columns = list_columns(query, KEYS, schemas.InvoiceResponse)
+            rows = (await conn.execute(query.with_only_columns(*columns))).all()
+            fetched = time.perf_counter()
+            body = encode_rows([column.key for column in columns], rows)
+        done = time.perf_counter()
+    timings.setdefault("fetch", []).append((fetched - started) * 1000)
+    timings.setdefault("encode", []).append((done - fetched) * 1000)
+    timings.setdefault("total", []).append((done - started) * 1000)
+    return body
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        "p50": round(statistics.median(ordered), 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "mean": round(statistics.fmean(ordered), 3),
+    }
+
+async def run(url: str, sizes: List[int], iterations: int, warmup: int) -> list:
+    engine = build_engine(url, "benchmark")
+    try:
+        async with engine.connect() as conn:
+            available = await conn.scalar(select(func.count()).select_from(models.Invoice))
+        results = []
+        for size in sizes:
+            if size > available:
+                print(f"Skipping {size} rows, the database has {available} invoices")
+                continue
+            result = {"rows": size}
+            bodies = {}
+            for path in PATHS:
+                timings = {}
+                for i in range(warmup + iterations):
+                    body = await run_once(engine, path, size, timings if i >= warmup else {})
+                bodies[path] = body
+                total = _summary(timings["total"])
+                result[path] = {
+                    "fetchMs": _summary(timings["fetch"]),
+                    "encodeMs": _summary(timings["encode"]),
+                    "totalMs": total,
+                    "rowsPerSecond": round(size / total["mean"] * 1000) if total["mean"] else None,
+                    "outputBytes": len(body),
+                }
+            # The fast path is only a win if clients can't tell the difference
+            result["identical"] = bodies["regular"] == bodies["fast"]
+            results.append(result)
+        return results
+    finally:
+        await engine.dispose()
+
+def print_results(results):
+    print(f"{'rows':>8}  {'path':<9}{'fetch':>10}{'encode':>10}{'total p50':>11}{'p95':>10}{'rows/s':>11}{'out KB':>10}  same body")
+    for result in results:
+        for path in PATHS:
+            data = result[path]
+            print(
+                f"{result['rows']:>8}  {path:<9}{data['fetchMs']['p50']:>10.2f}{data['encodeMs']['p50']:>10.2f}"
+                f"{data['totalMs']['p50']:>11.2f}{data['totalMs']['p95']:>10.2f}{data['rowsPerSecond']:>11}"
+                f"{data['outputBytes'] / 1024:>10.1f}  {result['identical'] if path == 'fast' else ''}"
+            )
+        speedup = result["regular"]["totalMs"]["p50"] / result["fast"]["totalMs"]["p50"]
+        print(f"{'':>8}  fast path x{speedup:.1f}")
+    print("Times are milliseconds (p50 unless noted), measured in this process against the database.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list response serialization")
+    parser.add_argument("--url", default=settings.DATABASE_URL, help="Database with invoices to read, defaults to DATABASE_URL")
+    parser.add_argument("--rows", type=int, action="append", default=[], help="Page size to measure, can be repeated")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("orjson is not installed, the fast path needs it")
+        sys.exit(1)
+    results = asyncio.run(run(args.url, args.rows or DEFAULT_ROWS, args.iterations, args.warmup))
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import fitz # PyMuPDF
+from app.core import pdf_template
+
+# Offline benchmark for the invoice fill pipeline. Every scenario runs in a fresh process
+# so peak RSS belongs to that scenario only.
+#
+#   python benchmark_pdf.py
+#   python benchmark_pdf.py --sample app/storage/1/receipt_fields.pdf --json results.json
+#   python benchmark_pdf.py --compare results.json   (exit code 1 on regression)
+
+INVOICE_FIELDS = [
+    "invoiceNumber", "BookNo", "invoiceDate", "CustomerName", "amountinwords", "invoiceAmount", "purpose",
+    "billCollector", "Nazim", "customerFullAddress", "customerPhone", "paymentMode", "paymentType",
+]
+
+PAGE_SIZES = {"A5": fitz.paper_rect("a5"), "A4": fitz.paper_rect("a4"), "A3": fitz.paper_rect("a3")}
+
+# (name, fields, page size, embedded image edge in pixels)
+DEFAULT_SCENARIOS = [
+    ("receipt", 13, "A4", 0),
+    ("fields-40", 40, "A4", 0),
+    ("fields-120", 120, "A4", 0),
+    ("page-A5", 13, "A5", 0),
+    ("page-A3", 13, "A3", 0),
+    ("image-800", 13, "A4", 800),
+    ("image-2400", 13, "A4", 2400),
+]
+
+def field_names(count: int):
+    return [INVOICE_FIELDS[i] if i < len(INVOICE_FIELDS) else f"field{i}" for i in range(count)]
+
+def synthetic_template(fields: int, page_size: str, image_px: int) -> bytes:
+    doc = fitz.open()
+    rect = PAGE_SIZES[page_size]
+    page = doc.new_page(width=rect.width, height=rect.height)
+    if image_px:
+        # Noise does not compress, like a scanned letterhead
+        pix = fitz.Pixmap(fitz.csRGB, image_px, image_px, os.urandom(image_px * image_px * 3), 0)
+        page.insert_image(fitz.Rect(0, 0, rect.width, rect.width), pixmap=pix)
+    columns = 2 if fields > 40 else 1
+    row_height = (rect.height - 40) / ((fields + columns - 1) // columns)
+    col_width = (rect.width - 40) / columns
+    for i, name in enumerate(field_names(fields)):
+        col, row = i % columns, i // columns
+        x0, y0 = 20 + col * col_width, 20 + row * row_height
+        widget = fitz.Widget()
+        widget.field_name = name
+        widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+        widget.rect = fitz.Rect(x0, y0, x0 + col_width - 10, y0 + min(row_height - 2, 16))
+        page.add_widget(widget)
+    content = doc.tobytes(garbage=1, deflate=True)
+    doc.close()
+    return content
+
+def sample_values(names):
+    return {name: f"{name} value {i}" for i, name in enumerate(names)}
+
+def _stage(timings, name, started):
+    now = time.perf_counter()
+    timings.setdefault(name, []).append((now - started) * 1000)
+    return now
+
+def run_legacy(template: bytes, values: dict, timings: dict) -> bytes:
+    # The pre-compilation path: discover widgets on every render, stamp text, delete the widgets
+    started = time.perf_counter()
+    doc = fitz.open(stream=template, filetype="pdf")
+    page = doc.load_page(0)
+    started = _stage(timings, "open", started)
+    widgets = list(page.widgets())
+    fill_ms = delete_ms = 0.0
+    for widget in widgets:
+        t = time.perf_counter()
+        value = values.get(widget.field_name)
+        if value is not None:
+            page.insert_text((widget.rect.x0, widget.rect.y1 - 3), str(value), fontname="hebo", fontsize=12, color=(0, 0, 0))
+        t2 = time.perf_counter()
+        page.delete_widget(widget)
+        fill_ms += (t2 - t) * 1000
+        delete_ms += (time.perf_counter() - t2) * 1000
+    timings.setdefault("fill", []).append(fill_ms)
+    timings.setdefault("delete-widget", []).append(delete_ms)
+    started = time.perf_counter()
+    content = doc.write()
+    _stage(timings, "write", started)
+    doc.close()
+    return content
+
+def run_compiled(base: bytes, fields, values: dict, timings: dict) -> bytes:
+    # What the app does today (pdf_template.render_invoice), split into stages
+    started = time.perf_counter()
+    doc = fitz.open(stream=base, filetype="pdf")
+    page = doc.load_page(0)
+    started = _stage(timings, "open", started)
+    for field in fields:
+        value = values.get(field["name"])
+        if value is None:
+            continue
+        x0, y0, x1, y1 = field["rect"]
+        page.insert_text((x0, y1 - 3), str(value), fontname="hebo", fontsize=12, color=(0, 0, 0))
+    started = _stage(timings, "fill", started)
+    content = doc.write()
+    _stage(timings, "write", started)
+    doc.close()
+    return content
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {
+        "p50": round(statistics.median(ordered), 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        "mean": round(statistics.fmean(ordered), 3),
+    }
+
+def run_scenario(name: str, template: bytes, iterations: int, warmup: int) -> dict:
+    doc = fitz.open(stream=template, filetype="pdf")
+    names = [w.field_name for w in doc.load_page(0).widgets()]
+    doc.close()
+    values = sample_values(names)
+
+    started = time.perf_counter()
+    base, fields = pdf_template.compile_template(template)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    result = {"scenario": name, "fields": len(names), "templateBytes": len(template), "compileMs": round(compile_ms, 3)}
+    for path in ["legacy", "compiled"]:
+        timings = {}
+        for i in range(warmup + iterations):
+            stage_timings = timings if i >= warmup else {}
+            started = time.perf_counter()
+            if path == "legacy":
+                content = run_legacy(template, values, stage_timings)
+            else:
+                content = run_compiled(base, fields, values, stage_timings)
+            if i >= warmup:
+                timings.setdefault("total", []).append((time.perf_counter() - started) * 1000)
+        total = _summary(timings["total"])
+        result[path] = {
+            "stages": {stage: _summary(samples) for stage, samples in timings.items() if stage != "total"},
+            "totalMs": total,
+            "perCorePerSecond": round(1000 / total["mean"], 1) if total["mean"] else None,
+            "outputBytes": len(content),
+        }
+    # ru_maxrss is in kilobytes on Linux
+    result["peakRssMB"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+def _run_isolated(job):
+    # Templates are built in the child, ru_maxrss survives exec so the parent must stay small
+    name, source, iterations, warmup = job
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            template = f.read()
+    else:
+        template = synthetic_template(*source)
+    return run_scenario(name, template, iterations, warmup)
+
+def print_results(results):
+    print(f"{'scenario':<14}{'path':<10}{'open':>9}{'fill':>9}{'delete':>9}{'write':>9}{'total p50':>11}{'p95':>9}{'/s/core':>9}{'out KB':>9}{'RSS MB':>8}")
+    for result in results:
+        for path in ["legacy", "compiled"]:
+            data = result[path]
+            stage = lambda s: f"{data['stages'][s]['p50']:>9.2f}" if s in data["stages"] else f"{'-':>9}"
+            print(
+                f"{result['scenario']:<14}{path:<10}{stage('open')}{stage('fill')}{stage('delete-widget')}{stage('write')}"
+                f"{data['totalMs']['p50']:>11.2f}{data['totalMs']['p95']:>9.2f}{data['perCorePerSecond']:>9}"
+                f"{data['outputBytes'] / 1024:>9.1f}{result['peakRssMB']:>8}"
+            )
+    print("Times are milliseconds (p50 unless noted). /s/core is single-threaded renders per second.")
+
+def compare(results, baseline_path: str, threshold: float) -> bool:
+    with open(baseline_path, "r") as f:
+        baseline = {item["scenario"]: item for item in json.load(f)}
+    regressed = False
+    for result in results:
+        previous = baseline.get(result["scenario"])
+        if not previous:
+            continue
+        for path in ["legacy", "compiled"]:
+            before, after = previous[path]["totalMs"]["p50"], result[path]["totalMs"]["p50"]
+            ratio = after / before if before else 1.0
+            flag = "REGRESSION" if ratio > threshold else "ok"
+            regressed = regressed or ratio > threshold
+            print(f"{result['scenario']:<14}{path:<10}{before:>9.2f} -> {after:>9.2f} ms  x{ratio:.2f}  {flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the invoice PDF fill pipeline")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--sample", action="append", default=[], help="Real template PDF to include, can be repeated")
+    parser.add_argument("--only", action="append", default=[], help="Run only the named scenarios")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier --json run")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Allowed slowdown ratio before --compare fails")
+    args = parser.parse_args()
+
+    jobs = []
+    for name, fields, page_size, image_px in DEFAULT_SCENARIOS:
+        if not args.only or name in args.only:
+            jobs.append((name, (fields, page_size, image_px), args.iterations, args.warmup))
+    samples = args.sample or [p for p in ["app/storage/1/receipt_fields.pdf"] if os.path.exists(p)]
+    for path in samples:
+        name = f"sample:{os.path.basename(path)}"
+        if not args.only or name in args.only:
+            jobs.append((name, path, args.iterations, args.warmup))
+
+    results = []
+    for job in jobs:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results.append(pool.submit(_run_isolated, job).result())
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,13 @@ async def fix_business_schema():
                 print("Column added successfully.")
             else:
                 print("Column 'templateStatus' already exists.")
+
+            print("Adding template metadata columns...")
+            await conn.execute(text('ALTER TABLE epay_business ADD COLUMN IF NOT EXISTS "templateKey" VARCHAR;'))
+            await conn.execute(text('ALTER TABLE epay_business ADD COLUMN IF NOT EXISTS "templateMediaType" VARCHAR(50);'))
+            await conn.execute(text('ALTER TABLE epay_business ADD COLUMN IF NOT EXISTS "templateSize" INTEGER;'))
+            await conn.execute(text('ALTER TABLE epay_business ADD COLUMN IF NOT EXISTS "templateHash" VARCHAR(64);'))
+            print("Template metadata columns are in place.")
                 
         except Exception as e:
             print(f"Error updating schema: {e}")
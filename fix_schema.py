@@ -9,6 +9,7 @@ async def update_schema():
             await conn.execute(text('ALTER TABLE epay_invoices ADD COLUMN IF NOT EXISTS "BookNo" VARCHAR;'))
             await conn.execute(text('ALTER TABLE epay_invoices ADD COLUMN IF NOT EXISTS "billCollector" VARCHAR;'))
             await conn.execute(text('ALTER TABLE epay_invoices ADD COLUMN IF NOT EXISTS "Nazim" VARCHAR;'))
+            await conn.execute(text('ALTER TABLE epay_invoices ADD COLUMN IF NOT EXISTS "uploadStatus" VARCHAR(20);'))
             print("Successfully added missing columns.")
         except Exception as e:
             print(f"Error updating schema: {e}")
@@ -0,0 +1,46 @@
+import asyncio
+from logging.config import fileConfig
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+from alembic import context
+from app.core.config import settings
+from app.core.database import Base, engine_options
+from app import models # noqa: F401 (registers the tables on Base.metadata)
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+def _database_url() -> str:
+    # `alembic -x url=...` points a run at another database, e.g. a local copy
+    return context.get_x_argument(as_dictionary=True).get("url") or settings.DATABASE_URL
+
+def run_migrations_offline():
+    context.configure(
+        url=_database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def do_run_migrations(connection: Connection):
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def run_async_migrations():
+    # Same prepared statement settings as the app, DB_PROFILE=pgbouncer needs them off
+    connectable = create_async_engine(_database_url(), poolclass=pool.NullPool, connect_args=engine_options()["connect_args"])
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await connectable.dispose()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_async_migrations())
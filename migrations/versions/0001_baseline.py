@@ -0,0 +1,189 @@
+"""Baseline schema
+
+Schema as created by Base.metadata.create_all plus fix_schema.py / fix_business_schema.py.
+Existing databases should be stamped with this revision instead of upgraded through it.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-17 11:00:38.420920
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('epay_business_types',
+    sa.Column('businessTypeId', sa.Integer(), nullable=False),
+    sa.Column('businessTypeName', sa.String(length=50), nullable=False),
+    sa.Column('isActive', sa.Boolean(), nullable=True),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('businessTypeId'),
+    sa.UniqueConstraint('businessTypeName')
+    )
+    op.create_table('epay_roles',
+    sa.Column('roleId', sa.Integer(), nullable=False),
+    sa.Column('roleName', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('roleId'),
+    sa.UniqueConstraint('roleName')
+    )
+    op.create_table('epay_subscription_plans',
+    sa.Column('subscriptionPlanId', sa.Integer(), nullable=False),
+    sa.Column('subscriptionPlanName', sa.String(), nullable=False),
+    sa.Column('subscriptionPlanDescription', sa.String(), nullable=False),
+    sa.Column('subscriptionPlanPrice', sa.Integer(), nullable=False),
+    sa.Column('subscriptionPlanDuration', sa.Integer(), nullable=False),
+    sa.Column('subscriptionPlanStatus', sa.Boolean(), nullable=True),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('subscriptionPlanId')
+    )
+    op.create_table('epay_users',
+    sa.Column('userId', sa.Integer(), nullable=False),
+    sa.Column('fullName', sa.String(), nullable=False),
+    sa.Column('emailId', sa.String(), nullable=False),
+    sa.Column('phoneNumber', sa.String(), nullable=False),
+    sa.Column('hashPassword', sa.String(), nullable=False),
+    sa.Column('algoPassword', sa.String(), nullable=False),
+    sa.Column('isActive', sa.Boolean(), nullable=True),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('lastLoginOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('userId')
+    )
+    op.create_index(op.f('ix_epay_users_emailId'), 'epay_users', ['emailId'], unique=True)
+    op.create_index(op.f('ix_epay_users_userId'), 'epay_users', ['userId'], unique=False)
+    op.create_table('epay_business',
+    sa.Column('businessId', sa.Integer(), nullable=False),
+    sa.Column('businessName', sa.String(length=100), nullable=False),
+    sa.Column('businessTypeId', sa.Integer(), nullable=False),
+    sa.Column('userId', sa.Integer(), nullable=False),
+    sa.Column('businessLogo', sa.String(), nullable=True),
+    sa.Column('businessAddress', sa.String(), nullable=True),
+    sa.Column('businessCity', sa.String(), nullable=True),
+    sa.Column('businessState', sa.String(), nullable=True),
+    sa.Column('businessCountry', sa.String(), nullable=True),
+    sa.Column('businessZip', sa.String(), nullable=True),
+    sa.Column('businessPhone', sa.String(), nullable=True),
+    sa.Column('businessEmail', sa.String(), nullable=True),
+    sa.Column('businessWebsite', sa.String(), nullable=True),
+    sa.Column('isActive', sa.Boolean(), nullable=True),
+    sa.Column('templateStatus', sa.String(length=20), nullable=True),
+    sa.Column('templateKey', sa.String(), nullable=True),
+    sa.Column('templateMediaType', sa.String(length=50), nullable=True),
+    sa.Column('templateSize', sa.Integer(), nullable=True),
+    sa.Column('templateHash', sa.String(length=64), nullable=True),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('lastLoginOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['businessTypeId'], ['epay_business_types.businessTypeId'], ),
+    sa.ForeignKeyConstraint(['userId'], ['epay_users.userId'], ),
+    sa.PrimaryKeyConstraint('businessId'),
+    sa.UniqueConstraint('businessName')
+    )
+    op.create_table('epay_user_roles',
+    sa.Column('userRoleId', sa.Integer(), nullable=False),
+    sa.Column('userId', sa.Integer(), nullable=False),
+    sa.Column('roleId', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['roleId'], ['epay_roles.roleId'], ),
+    sa.ForeignKeyConstraint(['userId'], ['epay_users.userId'], ),
+    sa.PrimaryKeyConstraint('userRoleId'),
+    sa.UniqueConstraint('userId', 'roleId', name='ux_user_role')
+    )
+    op.create_table('epay_customers',
+    sa.Column('customerId', sa.Integer(), nullable=False),
+    sa.Column('businessId', sa.Integer(), nullable=False),
+    sa.Column('customerName', sa.String(length=100), nullable=False),
+    sa.Column('customerPhone', sa.String(), nullable=False),
+    sa.Column('customerFullAddress', sa.String(), nullable=False),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['businessId'], ['epay_business.businessId'], ),
+    sa.PrimaryKeyConstraint('customerId')
+    )
+    op.create_table('epay_subscriptions',
+    sa.Column('subscriptionId', sa.Integer(), nullable=False),
+    sa.Column('businessId', sa.Integer(), nullable=False),
+    sa.Column('subscriptionPlanId', sa.Integer(), nullable=False),
+    sa.Column('subscriptionStatus', sa.Boolean(), nullable=True),
+    sa.Column('subscriptionStartDate', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('subscriptionEndDate', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('autoRenew', sa.Boolean(), nullable=True),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['businessId'], ['epay_business.businessId'], ),
+    sa.ForeignKeyConstraint(['subscriptionPlanId'], ['epay_subscription_plans.subscriptionPlanId'], ),
+    sa.PrimaryKeyConstraint('subscriptionId'),
+    sa.UniqueConstraint('businessId')
+    )
+    op.create_table('epay_invoices',
+    sa.Column('invoiceId', sa.Integer(), nullable=False),
+    sa.Column('businessId', sa.Integer(), nullable=False),
+    sa.Column('customerId', sa.Integer(), nullable=False),
+    sa.Column('invoiceNumber', sa.String(), nullable=False),
+    sa.Column('BookNo', sa.String(), nullable=True),
+    sa.Column('invoiceDate', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('invoiceAmount', sa.Integer(), nullable=False),
+    sa.Column('amountInWords', sa.String(), nullable=False),
+    sa.Column('paymentMode', sa.String(), nullable=False),
+    sa.Column('paymentType', sa.String(), nullable=False),
+    sa.Column('purpose', sa.String(), nullable=False),
+    sa.Column('billCollector', sa.String(), nullable=True),
+    sa.Column('Nazim', sa.String(), nullable=True),
+    sa.Column('pdfURL', sa.Text(), nullable=True),
+    sa.Column('uploadStatus', sa.String(length=20), nullable=True),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['businessId'], ['epay_business.businessId'], ),
+    sa.ForeignKeyConstraint(['customerId'], ['epay_customers.customerId'], ),
+    sa.PrimaryKeyConstraint('invoiceId')
+    )
+    op.create_table('epay_subscription_payments',
+    sa.Column('subscriptionPaymentId', sa.Integer(), nullable=False),
+    sa.Column('subscriptionId', sa.Integer(), nullable=False),
+    sa.Column('paymentStatus', sa.Boolean(), nullable=True),
+    sa.Column('paymentDate', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('paymentAmount', sa.Integer(), nullable=False),
+    sa.Column('paymentMode', sa.String(), nullable=False),
+    sa.Column('paymentType', sa.String(), nullable=False),
+    sa.Column('paymentPurpose', sa.String(), nullable=False),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['subscriptionId'], ['epay_subscriptions.subscriptionId'], ),
+    sa.PrimaryKeyConstraint('subscriptionPaymentId')
+    )
+    op.create_table('epay_subscription_usages',
+    sa.Column('subscriptionUsageId', sa.Integer(), nullable=False),
+    sa.Column('subscriptionId', sa.Integer(), nullable=False),
+    sa.Column('usageMonth', sa.String(length=7), nullable=False),
+    sa.Column('invoiceCount', sa.Integer(), nullable=False),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['subscriptionId'], ['epay_subscriptions.subscriptionId'], ),
+    sa.PrimaryKeyConstraint('subscriptionUsageId'),
+    sa.UniqueConstraint('subscriptionId', 'usageMonth', name='ux_subscription_usage')
+    )
+    op.create_table('epay_invoice_uploads',
+    sa.Column('invoiceUploadId', sa.Integer(), nullable=False),
+    sa.Column('invoiceId', sa.Integer(), nullable=False),
+    sa.Column('objectURL', sa.Text(), nullable=False),
+    sa.Column('pdfData', sa.LargeBinary(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('nextAttemptOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('lastError', sa.Text(), nullable=True),
+    sa.Column('createdOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['invoiceId'], ['epay_invoices.invoiceId'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('invoiceUploadId'),
+    sa.UniqueConstraint('invoiceId')
+    )
+
+def downgrade():
+    op.drop_table('epay_invoice_uploads')
+    op.drop_table('epay_subscription_usages')
+    op.drop_table('epay_subscription_payments')
+    op.drop_table('epay_invoices')
+    op.drop_table('epay_subscriptions')
+    op.drop_table('epay_customers')
+    op.drop_table('epay_user_roles')
+    op.drop_table('epay_business')
+    op.drop_index(op.f('ix_epay_users_userId'), table_name='epay_users')
+    op.drop_index(op.f('ix_epay_users_emailId'), table_name='epay_users')
+    op.drop_table('epay_users')
+    op.drop_table('epay_subscription_plans')
+    op.drop_table('epay_roles')
+    op.drop_table('epay_business_types')
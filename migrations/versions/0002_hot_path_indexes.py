@@ -0,0 +1,89 @@
+"""Indexes for the hot query predicates and a unique customer identity
+
+Indexes are built CONCURRENTLY so large production tables stay writable. Duplicate
+customers (same business, name and phone) are merged first: their invoices move to the
+oldest row and the extra rows are deleted, otherwise the unique index cannot be built.
+
+The customer identity index is the exception. It is built in the same transaction as the
+merge, with writes to epay_customers blocked from before the merge until the commit, so
+the old select-then-insert code cannot slip a new duplicate in between. A failed build
+rolls back with the merge instead of leaving an INVALID index behind; one left by an
+earlier concurrent attempt is dropped first.
+
+epay_subscription_usages.subscriptionId needs nothing new, ux_subscription_usage
+(subscriptionId, usageMonth) already leads with it.
+
+Revision ID: 0002_hot_path_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-17 11:20:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002_hot_path_indexes'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+MERGE_DUPLICATE_CUSTOMERS = """
+WITH ranked AS (
+    SELECT "customerId",
+           min("customerId") OVER (PARTITION BY "businessId", "customerName", "customerPhone") AS "keepId"
+    FROM epay_customers
+)
+UPDATE epay_invoices AS i
+SET "customerId" = ranked."keepId"
+FROM ranked
+WHERE i."customerId" = ranked."customerId" AND ranked."customerId" <> ranked."keepId"
+"""
+
+DELETE_DUPLICATE_CUSTOMERS = """
+DELETE FROM epay_customers AS c
+USING epay_customers AS keep
+WHERE c."businessId" = keep."businessId"
+  AND c."customerName" = keep."customerName"
+  AND c."customerPhone" = keep."customerPhone"
+  AND c."customerId" > keep."customerId"
+"""
+
+DROP_INVALID_CUSTOMER_IDENTITY = """
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_index WHERE indexrelid = to_regclass('ux_customer_identity') AND NOT indisvalid
+    ) THEN
+        DROP INDEX ux_customer_identity;
+    END IF;
+END $$
+"""
+
+def upgrade():
+    # SHARE lets reads through and blocks writers until the constraint is in place
+    op.execute('LOCK TABLE epay_customers IN SHARE MODE')
+    op.execute(DROP_INVALID_CUSTOMER_IDENTITY)
+    op.execute(MERGE_DUPLICATE_CUSTOMERS)
+    op.execute(DELETE_DUPLICATE_CUSTOMERS)
+    op.create_index(
+        'ux_customer_identity', 'epay_customers', ['businessId', 'customerName', 'customerPhone'],
+        unique=True, if_not_exists=True,
+    )
+    # Promote the unique index to a constraint so ON CONFLICT can name it
+    op.execute('ALTER TABLE epay_customers ADD CONSTRAINT ux_customer_identity UNIQUE USING INDEX ux_customer_identity')
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_invoices_business_date', 'epay_invoices', ['businessId', 'invoiceDate'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_invoices_invoice_date', 'epay_invoices', ['invoiceDate'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_business_user', 'epay_business', ['userId'], postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(
+            'ix_business_template_open', 'epay_business', ['templateStatus'],
+            postgresql_where=sa.text('"templateStatus" <> \'ACTIVE\''),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+
+def downgrade():
+    op.drop_constraint('ux_customer_identity', 'epay_customers', type_='unique')
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_business_template_open', table_name='epay_business', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_business_user', table_name='epay_business', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_invoices_invoice_date', table_name='epay_invoices', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_invoices_business_date', table_name='epay_invoices', postgresql_concurrently=True, if_exists=True)
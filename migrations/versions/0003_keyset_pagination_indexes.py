@@ -0,0 +1,35 @@
+"""Indexes for keyset pagination on (createdOn, id)
+
+List endpoints page newest first with WHERE ("createdOn", id) < (cursor). Each index
+matches one list query, so a page is a short backward index scan however deep it is.
+
+Revision ID: 0003_keyset_pagination_indexes
+Revises: 0002_hot_path_indexes
+Create Date: 2026-10-17 11:40:00.000000
+"""
+from alembic import op
+
+revision = '0003_keyset_pagination_indexes'
+down_revision = '0002_hot_path_indexes'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_invoices_created', 'epay_invoices', ['createdOn', 'invoiceId']),
+    ('ix_invoices_business_created', 'epay_invoices', ['businessId', 'createdOn', 'invoiceId']),
+    ('ix_customers_created', 'epay_customers', ['createdOn', 'customerId']),
+    ('ix_customers_business_created', 'epay_customers', ['businessId', 'createdOn', 'customerId']),
+    ('ix_business_created', 'epay_business', ['createdOn', 'businessId']),
+    ('ix_users_created', 'epay_users', ['createdOn', 'userId']),
+    ('ix_subscription_payments_subscription_created', 'epay_subscription_payments', ['subscriptionId', 'createdOn', 'subscriptionPaymentId']),
+]
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,207 @@
+"""Rollup tables and triggers for /admin/stats
+
+epay_stats_counters holds global counters (sharded by backend to spread hot-row updates)
+and epay_stats_invoice_daily holds invoice counts per business and UTC day. Triggers on
+epay_invoices, epay_business and epay_users keep both in the writing transaction; the
+backfill is the same rebuild that POST /admin/stats/rebuild runs.
+
+Revision ID: 0004_stats_rollups
+Revises: 0003_keyset_pagination_indexes
+Create Date: 2026-10-17 12:10:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004_stats_rollups'
+down_revision = '0003_keyset_pagination_indexes'
+branch_labels = None
+depends_on = None
+
+TRIGGERS = [
+    ('epay_stats_invoices_inserted', 'epay_invoices'),
+    ('epay_stats_invoices_deleted', 'epay_invoices'),
+    ('epay_stats_invoices_updated', 'epay_invoices'),
+    ('epay_stats_business', 'epay_business'),
+    ('epay_stats_users', 'epay_users'),
+]
+
+FUNCTIONS = [
+    'epay_stats_invoices_inserted()',
+    'epay_stats_invoices_deleted()',
+    'epay_stats_invoices_updated()',
+    'epay_stats_business()',
+    'epay_stats_users()',
+    'epay_stats_apply_invoice_delta(integer[], date[], bigint[])',
+    'epay_stats_bump(text, bigint)',
+]
+
+# Frozen copy of the SQL as it was when this revision was written; later changes ship as new
+# migrations, so replaying this one always builds the same schema
+TRIGGER_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_bump(name text, delta bigint) RETURNS void AS $$
+    BEGIN
+        IF delta IS NULL OR delta = 0 THEN
+            RETURN;
+        END IF;
+        INSERT INTO epay_stats_counters ("counterName", shard, value)
+        VALUES (name, pg_backend_pid() % 16, delta)
+        ON CONFLICT ("counterName", shard) DO UPDATE SET value = epay_stats_counters.value + EXCLUDED.value;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_apply_invoice_delta(business_ids integer[], days date[], deltas bigint[]) RETURNS void AS $$
+    BEGIN
+        IF business_ids IS NULL THEN
+            RETURN;
+        END IF;
+        -- Fixed lock order keeps concurrent batches from deadlocking on the daily rows
+        INSERT INTO epay_stats_invoice_daily ("businessId", day, "invoiceCount")
+        SELECT b, d, sum(n) FROM unnest(business_ids, days, deltas) AS t(b, d, n)
+        GROUP BY b, d ORDER BY b, d
+        ON CONFLICT ("businessId", day) DO UPDATE SET "invoiceCount" = epay_stats_invoice_daily."invoiceCount" + EXCLUDED."invoiceCount";
+        PERFORM epay_stats_bump('invoices:' || to_char(d, 'YYYY-MM-DD'), sum(n)::bigint)
+        FROM unnest(business_ids, days, deltas) AS t(b, d, n) GROUP BY d ORDER BY d;
+        PERFORM epay_stats_bump('invoices', (SELECT sum(n) FROM unnest(deltas) AS n)::bigint);
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_invoices_inserted() RETURNS trigger AS $$
+    BEGIN
+        PERFORM epay_stats_apply_invoice_delta(array_agg(b), array_agg(d), array_agg(n))
+        FROM (SELECT "businessId" AS b, (COALESCE("invoiceDate", "createdOn") AT TIME ZONE 'UTC')::date AS d, count(*) AS n FROM new_rows GROUP BY 1, 2) t;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_invoices_deleted() RETURNS trigger AS $$
+    BEGIN
+        PERFORM epay_stats_apply_invoice_delta(array_agg(b), array_agg(d), array_agg(n))
+        FROM (SELECT "businessId" AS b, (COALESCE("invoiceDate", "createdOn") AT TIME ZONE 'UTC')::date AS d, -count(*) AS n FROM old_rows GROUP BY 1, 2) t;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_invoices_updated() RETURNS trigger AS $$
+    BEGIN
+        -- Only rows that moved to another business or day change the rollup
+        PERFORM epay_stats_apply_invoice_delta(array_agg(b), array_agg(d), array_agg(n))
+        FROM (
+            WITH moved AS (
+                SELECT o."businessId" AS old_b, (COALESCE(o."invoiceDate", o."createdOn") AT TIME ZONE 'UTC')::date AS old_d,
+                       r."businessId" AS new_b, (COALESCE(r."invoiceDate", r."createdOn") AT TIME ZONE 'UTC')::date AS new_d
+                FROM old_rows o JOIN new_rows r ON r."invoiceId" = o."invoiceId"
+            )
+            SELECT old_b AS b, old_d AS d, -count(*) AS n FROM moved
+            WHERE (old_b, old_d) IS DISTINCT FROM (new_b, new_d) GROUP BY 1, 2
+            UNION ALL
+            SELECT new_b, new_d, count(*) FROM moved
+            WHERE (old_b, old_d) IS DISTINCT FROM (new_b, new_d) GROUP BY 1, 2
+        ) t;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_business() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD."templateStatus" IS NOT DISTINCT FROM NEW."templateStatus" THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+            PERFORM epay_stats_bump('businesses', 1);
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM epay_stats_bump('businesses', -1);
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') AND OLD."templateStatus" IS NOT NULL THEN
+            PERFORM epay_stats_bump('templates:' || OLD."templateStatus", -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') AND NEW."templateStatus" IS NOT NULL THEN
+            PERFORM epay_stats_bump('templates:' || NEW."templateStatus", 1);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_stats_users() RETURNS trigger AS $$
+    BEGIN
+        PERFORM epay_stats_bump('users', CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_invoices_inserted AFTER INSERT ON epay_invoices
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION epay_stats_invoices_inserted()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_invoices_deleted AFTER DELETE ON epay_invoices
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION epay_stats_invoices_deleted()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_invoices_updated AFTER UPDATE ON epay_invoices
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION epay_stats_invoices_updated()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_business AFTER INSERT OR DELETE OR UPDATE OF "templateStatus" ON epay_business
+    FOR EACH ROW EXECUTE FUNCTION epay_stats_business()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_stats_users AFTER INSERT OR DELETE ON epay_users
+    FOR EACH ROW EXECUTE FUNCTION epay_stats_users()
+    """,
+]
+
+REBUILD_SQL = [
+    "LOCK TABLE epay_users, epay_business, epay_invoices IN SHARE MODE",
+    "DELETE FROM epay_stats_invoice_daily",
+    "DELETE FROM epay_stats_counters",
+    """
+    INSERT INTO epay_stats_invoice_daily ("businessId", day, "invoiceCount")
+    SELECT "businessId", (COALESCE("invoiceDate", "createdOn") AT TIME ZONE 'UTC')::date, count(*) FROM epay_invoices GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO epay_stats_counters ("counterName", shard, value)
+    SELECT 'invoices:' || to_char(day, 'YYYY-MM-DD'), 0, sum("invoiceCount") FROM epay_stats_invoice_daily GROUP BY day
+    """,
+    """
+    INSERT INTO epay_stats_counters ("counterName", shard, value)
+    SELECT 'invoices', 0, count(*) FROM epay_invoices
+    UNION ALL SELECT 'businesses', 0, count(*) FROM epay_business
+    UNION ALL SELECT 'users', 0, count(*) FROM epay_users
+    UNION ALL SELECT 'templates:' || "templateStatus", 0, count(*) FROM epay_business
+              WHERE "templateStatus" IS NOT NULL GROUP BY "templateStatus"
+    """,
+]
+
+def upgrade():
+    op.create_table('epay_stats_counters',
+    sa.Column('counterName', sa.String(length=50), nullable=False),
+    sa.Column('shard', sa.SmallInteger(), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('counterName', 'shard')
+    )
+    op.create_table('epay_stats_invoice_daily',
+    sa.Column('businessId', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('invoiceCount', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('businessId', 'day')
+    )
+    # Triggers before the backfill: the rebuild's SHARE locks keep writers out until both are in place
+    for statement in TRIGGER_SQL:
+        op.execute(statement)
+    for statement in REBUILD_SQL:
+        op.execute(statement)
+
+def downgrade():
+    for name, table in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+    for signature in FUNCTIONS:
+        op.execute(f'DROP FUNCTION IF EXISTS {signature}')
+    op.drop_table('epay_stats_invoice_daily')
+    op.drop_table('epay_stats_counters')
@@ -0,0 +1,21 @@
+"""Monthly invoice limit on subscription plans
+
+NULL means unlimited, which is what every existing plan gets.
+
+Revision ID: 0005_plan_invoice_limit
+Revises: 0004_stats_rollups
+Create Date: 2026-10-17 13:00:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005_plan_invoice_limit'
+down_revision = '0004_stats_rollups'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('epay_subscription_plans', sa.Column('invoiceLimit', sa.Integer(), nullable=True))
+
+def downgrade():
+    op.drop_column('epay_subscription_plans', 'invoiceLimit')
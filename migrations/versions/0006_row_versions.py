@@ -0,0 +1,116 @@
+"""Row versions (updatedOn) for conditional GETs
+
+Adds "updatedOn" to the tables behind the per-entity read endpoints and the BEFORE UPDATE
+triggers that maintain it, see app/core/versioning.py. The column default is evaluated once,
+so existing rows are not rewritten; they all start at the migration time.
+
+Revision ID: 0006_row_versions
+Revises: 0005_plan_invoice_limit
+Create Date: 2026-10-17 13:40:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006_row_versions'
+down_revision = '0005_plan_invoice_limit'
+branch_labels = None
+depends_on = None
+
+# Frozen copy of the SQL as it was when this revision was written; later changes ship as new
+# migrations, so replaying this one always builds the same schema
+VERSIONED_TABLES = [
+    'epay_users',
+    'epay_business',
+    'epay_customers',
+    'epay_invoices',
+    'epay_subscriptions',
+    'epay_subscription_payments',
+    'epay_subscription_usages',
+]
+
+TRIGGER_SQL = [
+    """
+    CREATE OR REPLACE FUNCTION epay_touch_updated_on() RETURNS trigger AS $$
+    BEGIN
+        NEW."updatedOn" := GREATEST(clock_timestamp(), OLD."updatedOn" + interval '1 microsecond');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION epay_touch_user_roles() RETURNS trigger AS $$
+    BEGIN
+        UPDATE epay_users SET "updatedOn" = clock_timestamp()
+        WHERE "userId" IN (SELECT "userId" FROM changed_roles);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_users_touch BEFORE UPDATE ON epay_users
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION epay_touch_updated_on()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_business_touch BEFORE UPDATE ON epay_business
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION epay_touch_updated_on()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_customers_touch BEFORE UPDATE ON epay_customers
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION epay_touch_updated_on()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_invoices_touch BEFORE UPDATE ON epay_invoices
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION epay_touch_updated_on()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_subscriptions_touch BEFORE UPDATE ON epay_subscriptions
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION epay_touch_updated_on()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_subscription_payments_touch BEFORE UPDATE ON epay_subscription_payments
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION epay_touch_updated_on()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_subscription_usages_touch BEFORE UPDATE ON epay_subscription_usages
+    FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION epay_touch_updated_on()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_user_roles_touch_insert AFTER INSERT ON epay_user_roles
+    REFERENCING NEW TABLE AS changed_roles FOR EACH STATEMENT EXECUTE FUNCTION epay_touch_user_roles()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER epay_user_roles_touch_delete AFTER DELETE ON epay_user_roles
+    REFERENCING OLD TABLE AS changed_roles FOR EACH STATEMENT EXECUTE FUNCTION epay_touch_user_roles()
+    """,
+]
+
+TRIGGERS = [
+    ('epay_users_touch', 'epay_users'),
+    ('epay_business_touch', 'epay_business'),
+    ('epay_customers_touch', 'epay_customers'),
+    ('epay_invoices_touch', 'epay_invoices'),
+    ('epay_subscriptions_touch', 'epay_subscriptions'),
+    ('epay_subscription_payments_touch', 'epay_subscription_payments'),
+    ('epay_subscription_usages_touch', 'epay_subscription_usages'),
+    ('epay_user_roles_touch_insert', 'epay_user_roles'),
+    ('epay_user_roles_touch_delete', 'epay_user_roles'),
+]
+
+FUNCTIONS = [
+    'epay_touch_updated_on()',
+    'epay_touch_user_roles()',
+]
+
+def upgrade():
+    for table in VERSIONED_TABLES:
+        op.add_column(table, sa.Column('updatedOn', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    for statement in TRIGGER_SQL:
+        op.execute(statement)
+
+def downgrade():
+    for name, table in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name} ON {table}')
+    for signature in FUNCTIONS:
+        op.execute(f'DROP FUNCTION IF EXISTS {signature}')
+    for table in VERSIONED_TABLES:
+        op.drop_column(table, 'updatedOn')
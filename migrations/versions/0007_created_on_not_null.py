@@ -0,0 +1,59 @@
+"""NOT NULL createdOn on the keyset paginated tables
+
+List endpoints page on (createdOn, id), which skips rows with a NULL createdOn and cannot put
+one in a cursor. Such rows are backfilled (invoices from invoiceDate where they have one, the
+rest at the epoch so they come last, newest first) and the column becomes NOT NULL.
+
+Every step commits on its own so no lock is held across the table scans: the backfill runs in
+batches of BACKFILL_BATCH rows, the CHECK constraint is added NOT VALID (a brief ACCESS EXCLUSIVE
+lock), a second backfill pass catches rows that went NULL in between, VALIDATE scans under SHARE
+UPDATE EXCLUSIVE, which lets writes through, and SET NOT NULL then takes the validated CHECK as
+proof and skips its own scan.
+
+Revision ID: 0007_created_on_not_null
+Revises: 0006_row_versions
+Create Date: 2026-10-17 15:10:00.000000
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007_created_on_not_null'
+down_revision = '0006_row_versions'
+branch_labels = None
+depends_on = None
+
+EPOCH = "TIMESTAMPTZ '1970-01-01 00:00:00+00'"
+
+BACKFILL = {
+    'epay_users': EPOCH,
+    'epay_business': EPOCH,
+    'epay_customers': EPOCH,
+    'epay_invoices': f'COALESCE("invoiceDate", {EPOCH})',
+    'epay_subscription_payments': EPOCH,
+}
+
+BACKFILL_BATCH = 10000
+
+def _backfill(table: str, value: str):
+    # Autocommit, so every batch is its own short transaction
+    statement = sa.text(
+        f'UPDATE {table} SET "createdOn" = {value} WHERE ctid IN '
+        f'(SELECT ctid FROM {table} WHERE "createdOn" IS NULL LIMIT {BACKFILL_BATCH})'
+    )
+    while op.get_bind().execute(statement).rowcount:
+        pass
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for table, value in BACKFILL.items():
+            _backfill(table, value)
+            op.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_created_on_not_null CHECK ("createdOn" IS NOT NULL) NOT VALID')
+            _backfill(table, value)
+            op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {table}_created_on_not_null')
+            op.alter_column(table, 'createdOn', nullable=False)
+            op.drop_constraint(f'{table}_created_on_not_null', table)
+
+def downgrade():
+    # Backfilled values are kept
+    for table in BACKFILL:
+        op.alter_column(table, 'createdOn', nullable=True)
@@ -0,0 +1,18 @@
+from starlette.requests import Request
+from app.core.conditional import accepts_encoding
+
+def _request(accept_encoding: str) -> Request:
+    return Request({"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]})
+
+def test_accepts_encoding_honours_quality_values():
+    assert accepts_encoding(_request("gzip, deflate, br"), "gzip")
+    assert accepts_encoding(_request("br;q=1.0, GZIP;q=0.5"), "gzip")
+    assert not accepts_encoding(_request("gzip;q=0"), "gzip")
+    assert not accepts_encoding(_request("gzip ; q=0.000, identity"), "gzip")
+    assert not accepts_encoding(_request("identity"), "gzip")
+    assert not accepts_encoding(_request(""), "gzip")
+
+def test_accepts_encoding_wildcard():
+    assert accepts_encoding(_request("*"), "gzip")
+    assert not accepts_encoding(_request("*;q=0"), "gzip")
+    assert not accepts_encoding(_request("*, gzip;q=0"), "gzip")
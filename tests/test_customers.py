@@ -0,0 +1,76 @@
+import asyncio
+import httpx
+from sqlalchemy.exc import IntegrityError
+from app import deps, models
+from app.core.database import get_db
+from app.core.principals import Principal
+from app.main import app
+
+# Duplicate (businessId, customerName, customerPhone) hits ux_customer_identity on commit; the
+# API answers 409 instead of a 500. The session is faked, no database is needed.
+
+class _DriverError(Exception):
+    def __init__(self, sqlstate: str):
+        super().__init__(f"sqlstate {sqlstate}")
+        self.sqlstate = sqlstate
+
+class _Result:
+    def __init__(self, row):
+        self._row = row
+
+    def scalars(self):
+        return self
+
+    def first(self):
+        return self._row
+
+class _Session:
+    def __init__(self, row, sqlstate: str):
+        self.row = row
+        self.sqlstate = sqlstate
+        self.rolled_back = False
+
+    async def execute(self, statement):
+        return _Result(self.row)
+
+    def add(self, instance):
+        pass
+
+    async def commit(self):
+        raise IntegrityError("INSERT INTO epay_customers", {}, _DriverError(self.sqlstate))
+
+    async def rollback(self):
+        self.rolled_back = True
+
+def _request(session: _Session, method: str, url: str) -> httpx.Response:
+    async def get_db_override():
+        yield session
+
+    async def principal_override():
+        return Principal(userId=1, emailId="a@example.com", isActive=True, roles=("admin",))
+
+    async def send():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, json={
+                "businessId": 1, "customerName": "A", "customerPhone": "1", "customerFullAddress": "x",
+            })
+
+    app.dependency_overrides[get_db] = get_db_override
+    app.dependency_overrides[deps.get_current_principal] = principal_override
+    try:
+        return asyncio.run(send())
+    finally:
+        app.dependency_overrides.clear()
+
+def test_create_duplicate_customer_is_conflict():
+    session = _Session(models.Business(businessId=1), "23505")
+    response = _request(session, "POST", "/customers/")
+    assert response.status_code == 409
+    assert session.rolled_back
+
+def test_update_to_duplicate_customer_is_conflict():
+    session = _Session(models.Customer(customerId=2, businessId=1, customerName="B", customerPhone="1"), "23505")
+    response = _request(session, "PUT", "/customers/2")
+    assert response.status_code == 409
+    assert session.rolled_back